@@ -6,18 +6,25 @@ Versão: 3.0
 """
 
 import os
-import time
+import sys
 import logging
 import pandas as pd
 from openpyxl import load_workbook
 from tqdm import tqdm
 import google.generativeai as genai
-import google.api_core.exceptions as google_exceptions
 import re
 import json
 import hashlib
 from dotenv import load_dotenv
 
+# Módulos compartilhados do pipeline (arte_code/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "arte_code"))
+from arte_limiter import ModelRateLimiter
+from arte_llm import GeminiBackend, LLMClient, TIER_LITE, TIER_STANDARD
+from arte_llm_replay import backend_from_env, llm_mode
+from arte_llm_cache import ResponseCache
+import arte_trace
+
 # =====================
 # CONFIGURAÇÕES BÁSICAS
 # =====================
@@ -28,6 +35,11 @@ PROJECT_ROOT = os.path.dirname(_SCRIPT_DIR)
 CAMINHO_DADOS = r"C:\Users\pietr\OneDrive\.vscode\arte_\DOWNLOADS\PRODUTOS\ultra_base.xlsx"
 PASTA_SAIDA = r'C:\Users\pietr\OneDrive\.vscode\arte_\DOWNLOADS\METADADOS'
 ARQUIVO_SAIDA = os.path.join(PASTA_SAIDA, "categoria_GPT.xlsx")
+# Cache de respostas LLM compartilhado com arte_heavy/arte_edital (reexecuções não repetem prompts)
+LLM_CACHE_PATH = r"C:\Users\pietr\OneDrive\.vscode\arte_\machine_learning\cache\llm_responses.sqlite"
+LLM_CACHE_TTL_DAYS = 30
+LLM_CACHE_MAX_MB = 256
+TRACE_DIR = r"C:\Users\pietr\OneDrive\.vscode\arte_\LOGS\traces"  # Trace JSONL por execução (spans, chamadas LLM, tokens)
 
 # --- LLM Config ---
 # A chave de API agora deve ser carregada de um arquivo .env para segurança.
@@ -44,16 +56,25 @@ LLM_MODELS_FALLBACK = [
     "gemini-2.0-flash",
 ]
 LLM_MODEL_PRIMARY = LLM_MODELS_FALLBACK[0]
+CURATION_LLM_TIER = TIER_STANDARD  # Curadoria/enriquecimento das descrições
+CATEGORIZATION_LLM_TIER = TIER_LITE  # Categorização em batch
 
 # Parâmetros de Processamento
 BATCH_SIZE = 15  # Tamanho do batch para chamadas ao LLM
 MAX_RETRIES = 3  # Número de tentativas em caso de erro
-TEMPO = 10  # Delay (em segundos) entre chamadas de BATCH de categorização.
+# Orçamento por modelo (sobrescreve os padrões de arte_limiter); substitui a pausa fixa entre batches.
+# Ex. nível gratuito: {"gemini-2.0-flash-lite": {"rpm": 30, "tpm": 1_000_000, "rpd": 200}}
+LLM_RATE_LIMITS = {}
 
 # Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Modelos em cache, disjuntor por modelo e rota pelo mais rápido saudável do nível pedido
+# O ritmo das chamadas vem do limitador (compartilhado com outros scripts que usam a mesma chave)
+LLM_CLIENT = LLMClient(backend_from_env(GeminiBackend), LLM_MODELS_FALLBACK,
+                       rate_limiter=ModelRateLimiter.shared("GOOGLE_API_KEY", LLM_RATE_LIMITS))
+
 # --- Estrutura de Categorias ---
 # Centralizar as categorias facilita a manutenção e a consistência com o prompt.
 CATEGORIAS_PRODUTOS = {
@@ -67,6 +88,7 @@ CATEGORIAS_PRODUTOS = {
         "EQUIPAMENTO_TECNICO" : ["ssd", "fonte_energia", "switch_rede", "projetor", "drone"]
 }
 
+@arte_trace.traced('excel')
 def append_df_to_excel(filename, df, **to_excel_kwargs):
     """Anexa um DataFrame a um arquivo .xlsx existente sem reescrever o arquivo inteiro."""
     with pd.ExcelWriter(filename, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
@@ -114,38 +136,6 @@ def parse_llm_response(response_text):
     logger.warning("Nenhum JSON válido encontrado na resposta do LLM.")
     return None
 
-def gerar_conteudo_com_fallback(prompt: str, modelos: list[str]) -> str | None:
-    """
-    Tenta gerar conteúdo usando uma lista de modelos em ordem de preferência.
-    Se um modelo falhar por cota (ResourceExhausted), tenta o próximo.
-
-    Args:
-        prompt: O prompt a ser enviado para a API.
-        modelos: A lista de nomes de modelos para tentar em sequência.
-
-    Returns:
-        O texto da resposta da API em caso de sucesso, ou None se todos falharem.
-    """
-    for nome_modelo in modelos:
-        try:
-            logger.info(f"Tentando chamada à API com o modelo: {nome_modelo}...")
-            model = genai.GenerativeModel(nome_modelo)
-            response = model.generate_content(prompt)
-            logger.info(f" Sucesso com o modelo '{nome_modelo}'.")
-            return response.text
-        except google_exceptions.ResourceExhausted as e:
-            logger.warning(f"⚠️ Cota excedida para o modelo '{nome_modelo}'. Tentando o próximo da lista.")
-            time.sleep(5)  # Pausa para não sobrecarregar o próximo modelo imediatamente
-            continue
-        except Exception as e:
-            # Para outros erros (ex: prompt inválido, erro de servidor), é melhor parar e registrar.
-            logger.error(f"❌ Erro inesperado com o modelo '{nome_modelo}': {e}")
-            # Não continua para o próximo modelo, pois o erro pode não ser de cota.
-            return None
-
-    logger.error("❌ FALHA TOTAL: Todos os modelos na lista de fallback falharam. Prompt não processado.")
-    return None
-
 def curar_descricoes_em_batch_llm(batch_produtos: list[dict]) -> list[str]:
     """Usa o LLM com fallback para curar uma lista de descrições de produtos em batch."""
     produtos_json = json.dumps(batch_produtos, ensure_ascii=False, indent=2)
@@ -202,7 +192,10 @@ Compatibilidade: requer fonte phantom power 48V, interface de áudio com entrada
   ...
 ]"""
     for attempt in range(MAX_RETRIES):
-        response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+        response_text = LLM_CLIENT.generate(
+            prompt, min_tier=CURATION_LLM_TIER, stage='curadoria',
+            validate=lambda texto: isinstance(r := parse_llm_response(texto), list) and len(r) == len(batch_produtos),
+        )
         if response_text:
             parsed_response = parse_llm_response(response_text)
             if parsed_response and isinstance(parsed_response, list) and len(parsed_response) == len(batch_produtos):
@@ -217,9 +210,6 @@ Compatibilidade: requer fonte phantom power 48V, interface de áudio com entrada
         else:
             logger.error(f"Falha na chamada da API de curadoria em batch (tentativa {attempt + 1}/{MAX_RETRIES}).")
 
-        if attempt < MAX_RETRIES - 1:
-            time.sleep(TEMPO)
-
     logger.error(f"Falha ao curar batch após {MAX_RETRIES} tentativas. Usando descrições originais para este batch.")
     # Retorna as descrições originais do batch em caso de falha total
     return [prod['descricao'] for prod in batch_produtos]
@@ -245,7 +235,10 @@ def processar_batch_llm(batch_descricoes: list[str]) -> list[dict]:
     )
     
     for attempt in range(MAX_RETRIES):
-        response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+        response_text = LLM_CLIENT.generate(
+            prompt, min_tier=CATEGORIZATION_LLM_TIER, stage='categorizacao',
+            validate=lambda texto: bool(parse_llm_response(texto)),
+        )
 
         if response_text:
             parsed_response = parse_llm_response(response_text)
@@ -256,9 +249,6 @@ def processar_batch_llm(batch_descricoes: list[str]) -> list[dict]:
         else:
             logger.error(f"Falha na chamada da API de categorização (tentativa {attempt + 1}/{MAX_RETRIES}).")
 
-        if attempt < MAX_RETRIES - 1:
-            time.sleep(TEMPO)
-
     logger.error(f"Falha ao processar batch após {MAX_RETRIES} tentativas.")
     return [{'CATEGORIA_PRINCIPAL': 'ERRO_PROCESSAMENTO', 'SUBCATEGORIA': 'ERRO_PROCESSAMENTO'}] * len(batch_descricoes)
 
@@ -280,6 +270,10 @@ def processar_produtos():
         pd.DataFrame(columns=ordem_final_colunas).to_excel(ARQUIVO_SAIDA, index=False)
 
     configurar_llm()
+    # Gravação/reprodução (arte_llm_replay): acertos do cache não chegariam ao arquivo nem passariam pela latência/429 simulados
+    if llm_mode() == "live":
+        LLM_CLIENT.cache = ResponseCache(LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_DAYS * 86400, max_bytes=LLM_CACHE_MAX_MB * 2**20)
+    arte_trace.start_run("arte_metadados", TRACE_DIR)
 
     # 1. Carregar e preparar a base de produtos de origem
     logger.info(f"Carregando dados de origem de: {CAMINHO_DADOS}")
@@ -333,6 +327,7 @@ def processar_produtos():
         for i in tqdm(range(0, len(produtos_para_processar), BATCH_SIZE), desc="Processando e salvando lotes"):
             batch_produtos_dict = produtos_para_processar[i:i + BATCH_SIZE]
             df_batch_to_process = pd.DataFrame(batch_produtos_dict)
+            arte_trace.count('produtos', len(batch_produtos_dict))
 
             # --- ETAPA 3.1: CURADORIA DO BATCH ---
             logger.info(f"Lote {i//BATCH_SIZE + 1}: Iniciando curadoria de {len(df_batch_to_process)} produtos.")
@@ -345,13 +340,15 @@ def processar_produtos():
                 }, axis=1
             ).tolist()
             
-            curated_batch = curar_descricoes_em_batch_llm(produtos_para_curar)
+            with arte_trace.span('curadoria', lote=i // BATCH_SIZE + 1):
+                curated_batch = curar_descricoes_em_batch_llm(produtos_para_curar)
             df_batch_to_process['DESCRICAO_CURADA'] = curated_batch
             
             # --- ETAPA 3.2: CATEGORIZAÇÃO DO BATCH ---
             logger.info(f"Lote {i//BATCH_SIZE + 1}: Iniciando categorização.")
             descricoes_para_categorizar = df_batch_to_process['DESCRICAO_CURADA'].tolist()
-            metadados = processar_batch_llm(descricoes_para_categorizar)
+            with arte_trace.span('categorizacao', lote=i // BATCH_SIZE + 1):
+                metadados = processar_batch_llm(descricoes_para_categorizar)
 
             if len(metadados) != len(descricoes_para_categorizar):
                 logger.error(f"Lote {i//BATCH_SIZE + 1}: Inconsistência no batch. Pulando salvamento deste lote.")
@@ -382,9 +379,12 @@ def processar_produtos():
 
             except Exception as e:
                 logger.error(f"Erro ao salvar o lote {i//BATCH_SIZE + 1}: {e}. Progresso do lote perdido.")
-            
-            time.sleep(TEMPO)
 
+    logger.info(LLM_CLIENT.health_report())
+    if LLM_CLIENT.cache is not None:
+        logger.info(LLM_CLIENT.cache.report())
+        LLM_CLIENT.cache.close()
+    logger.info(arte_trace.finish_run())
     logger.info("Processamento incremental concluído.")
 
 # =====================
@@ -0,0 +1,165 @@
+"""
+ÍNDICE ANN FILTRADO SOBRE OS EMBEDDINGS DOS PRODUTOS
+====================================================
+
+Busca top-k por similaridade de cosseno com filtros de payload
+(VALOR <= teto, subcategoria, categoria_principal), sem montar
+`product_embeddings_tensor[candidatos]` a cada item.
+
+Estratégia (CPU):
+- Os filtros viram posições candidatas pelo `CatalogIndex` (busca binária por
+  preço dentro das partições de categoria/subcategoria).
+- Conjuntos pequenos (até EXACT_SEARCH_MAX_CANDIDATES) são pontuados de forma
+  exata, com um produto matricial sobre as linhas filtradas.
+- Conjuntos grandes usam um grafo HNSW persistente (hnswlib, opcional) com o
+  filtro aplicado durante a navegação do grafo. Sem hnswlib, cai na busca exata.
+
+As posições (labels) são posições de linha da base, o mesmo contrato do
+`CatalogIndex`: a linha i da matriz de embeddings é o produto i da base.
+`recall_at_k` compara o índice com a busca exata para os mesmos filtros.
+
+Os embeddings podem ser uma matriz float32 ou um `QuantizedEmbeddings`
+(int8/float16 em memmap): a busca exata pontua direto sobre os códigos
+quantizados, lendo do disco apenas as linhas candidatas.
+"""
+
+import os
+import glob
+import hashlib
+import logging
+import threading
+import numpy as np
+
+from arte_catalog import CatalogIndex
+from arte_embeddings import QuantizedEmbeddings
+
+try:
+    import hnswlib
+except ImportError:  # Dependência opcional: sem ela, toda busca é exata
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_PREFIX = "hnsw_"
+EXACT_SEARCH_MAX_CANDIDATES = 4096  # Abaixo disso, a busca exata filtrada é mais rápida que o grafo
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH_MIN = 64
+
+
+def _normalize(matriz: np.ndarray) -> np.ndarray:
+    matriz = np.asarray(matriz, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+    return matriz / np.maximum(normas, 1e-12)
+
+
+def _as_quantized(embeddings) -> QuantizedEmbeddings:
+    if isinstance(embeddings, QuantizedEmbeddings):
+        return embeddings
+    return QuantizedEmbeddings.from_vectors(embeddings, 'float32')
+
+
+def embeddings_content_hash(embeddings) -> str:
+    if isinstance(embeddings, QuantizedEmbeddings):
+        digest = hashlib.sha256(np.ascontiguousarray(embeddings.codes).tobytes())
+        digest.update(np.ascontiguousarray(embeddings.scales, dtype=np.float32).tobytes())
+        return digest.hexdigest()
+    return hashlib.sha256(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes()).hexdigest()
+
+
+class FilteredAnnIndex:
+    """Top-k por cosseno com filtros de preço/categoria: exato em conjuntos pequenos, HNSW nos grandes."""
+
+    def __init__(self, embeddings, catalog: CatalogIndex, hnsw_index=None):
+        if len(embeddings) != len(catalog):
+            raise ValueError(f"Embeddings ({len(embeddings)}) e base ({len(catalog)}) não estão alinhados.")
+        self.vectors = _as_quantized(embeddings)
+        self.catalog = catalog
+        self.hnsw = hnsw_index
+        self._hnsw_lock = threading.Lock()  # set_ef vale para o índice todo: ef + consulta juntos
+
+    @classmethod
+    def load_or_build(cls, embeddings, catalog: CatalogIndex, index_dir: str) -> "FilteredAnnIndex":
+        """Carrega o grafo HNSW salvo para estes embeddings ou constrói e salva um novo."""
+        if hnswlib is None:
+            logger.info("hnswlib não instalado: usando apenas busca exata filtrada.")
+            return cls(embeddings, catalog)
+
+        vetores = _as_quantized(embeddings)
+        path = os.path.join(index_dir, f"{INDEX_FILE_PREFIX}{embeddings_content_hash(vetores)[:16]}.bin")
+        hnsw = hnswlib.Index(space='ip', dim=vetores.dim)
+        if os.path.exists(path):
+            hnsw.load_index(path, max_elements=len(vetores))
+            logger.info(f"Índice HNSW carregado de: {path}")
+        else:
+            logger.info(f"Construindo índice HNSW para {len(vetores)} produtos...")
+            hnsw.init_index(max_elements=len(vetores), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            hnsw.add_items(_normalize(vetores.dequantize()), np.arange(len(vetores)))
+            os.makedirs(index_dir, exist_ok=True)
+            for antigo in glob.glob(os.path.join(index_dir, f"{INDEX_FILE_PREFIX}*.bin")):
+                os.remove(antigo)
+            hnsw.save_index(path)
+            logger.info(f"Índice HNSW salvo em: {path}")
+        return cls(vetores, catalog, hnsw)
+
+    def candidate_positions(self, max_cost=None, categoria=None, subcategoria=None) -> np.ndarray:
+        """Posições que satisfazem os filtros de payload (subcategoria tem precedência sobre categoria)."""
+        if subcategoria is not None:
+            return self.catalog.subcategory_positions(subcategoria, max_cost)
+        if categoria is not None:
+            return self.catalog.category_positions(categoria, max_cost)
+        return self.catalog.price_positions(max_cost)
+
+    def _exact(self, query: np.ndarray, positions: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        scores = self.vectors.score(query, positions)
+        k = min(k, len(positions))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return positions[top], scores[top]
+
+    def _hnsw(self, query: np.ndarray, positions: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        permitido = np.zeros(len(self.vectors), dtype=bool)
+        permitido[positions] = True
+        # Quanto mais seletivo o filtro, maior o ef para manter o recall
+        seletividade = len(positions) / len(self.vectors)
+        try:
+            with self._hnsw_lock:
+                self.hnsw.set_ef(max(HNSW_EF_SEARCH_MIN, int(k / max(seletividade, 1e-3))))
+                labels, distancias = self.hnsw.knn_query(query, k=min(k, len(positions)),
+                                                         filter=lambda label: permitido[label])
+        except RuntimeError as e:
+            # O grafo não achou k vizinhos dentro do filtro: esta consulta vai para a busca exata
+            logger.debug(f"HNSW sem {k} resultados no filtro ({e}); usando busca exata.")
+            return self._exact(query, positions, k)
+        return labels[0].astype(np.int64), 1.0 - distancias[0]
+
+    def search(self, query, k: int, max_cost=None, categoria=None, subcategoria=None,
+               exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Retorna (posições, similaridades) dos k produtos mais similares à consulta
+        dentre os que passam nos filtros, em ordem decrescente de similaridade.
+        """
+        positions = self.candidate_positions(max_cost, categoria, subcategoria)
+        return self.search_positions(query, positions, k, exact)
+
+    def search_positions(self, query, positions, k: int, exact: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """Como `search`, mas dentre posições já filtradas pelo chamador (ex.: `arte_hybrid`)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = _normalize(np.asarray(query).reshape(-1))
+        if exact or self.hnsw is None or len(positions) <= EXACT_SEARCH_MAX_CANDIDATES:
+            return self._exact(query, positions, k)
+        return self._hnsw(query, positions, k)
+
+    def recall_at_k(self, queries: np.ndarray, k: int, filters: list[dict] | None = None) -> float:
+        """Recall@k médio da busca padrão contra a busca exata, para as mesmas consultas e filtros."""
+        filters = filters or [{}] * len(queries)
+        recalls = []
+        for query, filtro in zip(queries, filters):
+            esperado, _ = self.search(query, k, exact=True, **filtro)
+            if len(esperado) == 0:
+                continue
+            obtido, _ = self.search(query, k, **filtro)
+            recalls.append(len(set(esperado.tolist()) & set(obtido.tolist())) / len(esperado))
+        return float(np.mean(recalls)) if recalls else 1.0
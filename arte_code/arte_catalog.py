@@ -0,0 +1,116 @@
+"""
+ÍNDICE DE CATÁLOGO POR PREÇO E CATEGORIA
+========================================
+
+Monta, uma única vez na inicialização, partições da base de produtos por
+(categoria_principal, subcategoria), cada uma com as posições das linhas
+ordenadas por VALOR. Um teto de preço vira uma busca binária
+(`np.searchsorted`) que devolve uma fatia de posições inteiras, sem copiar
+DataFrames; só as linhas realmente enviadas ao LLM são materializadas com
+`df_base.iloc[...]`.
+
+As posições são posições de linha (0..N-1) da base, por isso ela deve estar
+com índice padrão (`reset_index(drop=True)`), o mesmo contrato de
+`arte_tfidf.TfidfCatalogIndex` e dos embeddings pré-computados.
+
+Produtos com VALOR vazio ou inválido só aparecem em consultas sem teto de preço.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _key(valor) -> str | None:
+    return None if pd.isna(valor) else str(valor)
+
+
+class _PricePartition:
+    """Posições de um grupo de produtos, ordenadas por preço."""
+
+    def __init__(self, positions: np.ndarray, valores: np.ndarray):
+        ordem = np.argsort(valores[positions], kind='stable')
+        self.positions = positions[ordem]
+        self.valores = valores[self.positions]
+
+    def between(self, max_cost: float | None, min_cost: float | None = None) -> np.ndarray:
+        """Fatia (view) das posições com min_cost < VALOR <= max_cost."""
+        inicio = 0 if min_cost is None else np.searchsorted(self.valores, min_cost, side='right')
+        fim = len(self.positions) if max_cost is None else np.searchsorted(self.valores, max_cost, side='right')
+        return self.positions[inicio:max(inicio, fim)]
+
+
+class CatalogIndex:
+    """Partições da base por categoria/subcategoria com filtro de preço por busca binária."""
+
+    def __init__(self, df_base: pd.DataFrame):
+        if not df_base.index.equals(pd.RangeIndex(len(df_base))):
+            raise ValueError("CatalogIndex requer a base com índice padrão (use reset_index(drop=True)).")
+        self.df = df_base
+        valores = pd.to_numeric(df_base['VALOR'], errors='coerce').to_numpy(dtype=float)
+        self.valores = np.where(np.isnan(valores), np.inf, valores)
+
+        self._all = _PricePartition(np.arange(len(df_base), dtype=np.int64), self.valores)
+
+        grupos: dict[tuple, list[int]] = {}
+        for pos, (cat, sub) in enumerate(zip(df_base['categoria_principal'], df_base['subcategoria'])):
+            grupos.setdefault((_key(cat), _key(sub)), []).append(pos)
+        self._partitions = {
+            chave: _PricePartition(np.asarray(pos, dtype=np.int64), self.valores) for chave, pos in grupos.items()
+        }
+
+        por_categoria: dict[str | None, list[int]] = {}
+        for (cat, _), pos in grupos.items():
+            por_categoria.setdefault(cat, []).extend(pos)
+        self._by_category = {
+            cat: _PricePartition(np.asarray(pos, dtype=np.int64), self.valores) for cat, pos in por_categoria.items()
+        }
+        self._contains_cache: dict[str, list[tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def partitions(self) -> list[tuple]:
+        """Chaves (categoria_principal, subcategoria) existentes na base."""
+        return list(self._partitions)
+
+    def _merge(self, fatias: list[np.ndarray]) -> np.ndarray:
+        """Une fatias de partições distintas mantendo a ordem por preço."""
+        fatias = [f for f in fatias if f.size]
+        if not fatias:
+            return np.empty(0, dtype=np.int64)
+        if len(fatias) == 1:
+            return fatias[0]
+        unidas = np.concatenate(fatias)
+        return unidas[np.argsort(self.valores[unidas], kind='stable')]
+
+    def price_positions(self, max_cost: float | None = None, min_cost: float | None = None) -> np.ndarray:
+        """
+        Todas as posições com min_cost < VALOR <= max_cost (ou toda a base), em ordem de preço.
+        `min_cost` permite consultar só a faixa nova quando o teto de preço é ampliado.
+        """
+        return self._all.between(max_cost, min_cost)
+
+    def category_positions(self, categoria: str, max_cost: float | None = None, min_cost: float | None = None) -> np.ndarray:
+        """Posições da categoria principal com min_cost < VALOR <= max_cost."""
+        particao = self._by_category.get(_key(categoria))
+        return particao.between(max_cost, min_cost) if particao else np.empty(0, dtype=np.int64)
+
+    def subcategory_positions(self, subcategoria: str, max_cost: float | None = None, contains: bool = False,
+                              min_cost: float | None = None) -> np.ndarray:
+        """
+        Posições da subcategoria (em qualquer categoria principal) com min_cost < VALOR <= max_cost.
+        Com `contains=True`, aceita subcategorias cujo nome contém o texto (sem diferenciar maiúsculas).
+        """
+        if contains:
+            padrao = str(subcategoria).lower()
+            if padrao not in self._contains_cache:
+                self._contains_cache[padrao] = [k for k in self._partitions if k[1] is not None and padrao in k[1].lower()]
+            chaves = self._contains_cache[padrao]
+        else:
+            chaves = [k for k in self._partitions if k[1] == _key(subcategoria)]
+        return self._merge([self._partitions[k].between(max_cost, min_cost) for k in chaves])
+
+    def rows(self, positions) -> pd.DataFrame:
+        """Materializa as linhas da base nas posições indicadas (apenas o que vai ao LLM)."""
+        return self.df.iloc[np.asarray(positions, dtype=np.int64)]
@@ -0,0 +1,96 @@
+"""
+DEDUPLICAÇÃO DE ITENS ENTRE EDITAIS
+===================================
+
+Muitos editais (pastas U_xxx_E_yyy) repetem o mesmo texto de item, copiado de
+atas e descrições nacionais. Antes do matching, as linhas do master.xlsx são
+agrupadas por descrição e referência normalizadas e por faixa de preço; cada
+grupo é processado uma única vez e o resultado é replicado para todas as
+linhas do grupo.
+
+A faixa de preço é logarítmica (largura de PRICE_BAND_TOLERANCE), e o
+representante do grupo é a linha de menor valor de referência: o teto de
+custo calculado para ele também respeita a margem das demais linhas.
+"""
+
+import math
+import re
+import unicodedata
+import pandas as pd
+
+PRICE_BAND_TOLERANCE = 0.05  # Linhas com preços até ~5% de diferença caem na mesma faixa
+
+
+def normalize_text(texto) -> str:
+    """Texto em minúsculas, sem acentos e com espaços colapsados."""
+    texto = unicodedata.normalize('NFKD', str(texto).lower()).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', texto).strip()
+
+
+def parse_price(valor) -> float | None:
+    """Converte o valor de referência (aceita vírgula decimal); None se vazio, inválido ou <= 0."""
+    numero = pd.to_numeric(str(valor).replace(',', '.'), errors='coerce')
+    return float(numero) if pd.notna(numero) and numero > 0 else None
+
+
+def price_band(valor, tolerance: float = PRICE_BAND_TOLERANCE) -> int | None:
+    preco = parse_price(valor)
+    return None if preco is None else int(math.floor(math.log(preco) / math.log1p(tolerance)))
+
+
+def dedup_key(description, reference, valor, tolerance: float = PRICE_BAND_TOLERANCE) -> tuple:
+    return normalize_text(description), normalize_text(reference), price_band(valor, tolerance)
+
+
+class DedupGroups:
+    """Grupos de linhas idênticas: representante (posição) -> posições de todas as linhas do grupo."""
+
+    def __init__(self, members: dict[int, list[int]], total_rows: int):
+        self.members = members
+        self.total_rows = total_rows
+
+    @property
+    def representatives(self) -> list[int]:
+        return list(self.members)
+
+    @property
+    def ratio(self) -> float:
+        """Linhas por grupo processado (1.0 = nenhuma duplicata)."""
+        return self.total_rows / len(self.members) if self.members else 1.0
+
+    def calls_saved(self, llm_calls_by_rep: dict[int, int]) -> int:
+        """Chamadas LLM evitadas: as do representante, multiplicadas pelas demais linhas do grupo."""
+        return sum(llm_calls_by_rep.get(rep, 0) * (len(pos) - 1) for rep, pos in self.members.items())
+
+    def report(self, llm_calls_by_rep: dict[int, int] | None = None) -> str:
+        texto = (f"Deduplicação: {self.total_rows} linhas -> {len(self.members)} grupos "
+                 f"(razão {self.ratio:.2f}x, {self.total_rows - len(self.members)} linhas replicadas)")
+        if llm_calls_by_rep is not None:
+            feitas = sum(llm_calls_by_rep.values())
+            texto += f" | Chamadas LLM: {feitas} feitas, {self.calls_saved(llm_calls_by_rep)} evitadas"
+        return texto
+
+
+def group_items(df_items: pd.DataFrame, tolerance: float = PRICE_BAND_TOLERANCE,
+                price_column: str = 'VALOR_UNIT') -> DedupGroups:
+    """
+    Agrupa as linhas (por posição 0..N-1) pela chave normalizada
+    DESCRICAO + REFERENCIA + faixa de preço. O representante é a linha de menor
+    preço do grupo (empates ficam com a primeira); a ordem dos grupos segue a
+    primeira ocorrência no DataFrame.
+    """
+    grupos: dict[tuple, list[int]] = {}
+    for pos, (desc, ref, valor) in enumerate(zip(
+        df_items['DESCRICAO'],
+        df_items['REFERENCIA'] if 'REFERENCIA' in df_items.columns else [''] * len(df_items),
+        df_items[price_column] if price_column in df_items.columns else [None] * len(df_items),
+    )):
+        ref = '' if pd.isna(ref) else ref
+        grupos.setdefault(dedup_key(desc, ref, valor, tolerance), []).append(pos)
+
+    precos = df_items[price_column].map(parse_price).tolist() if price_column in df_items.columns else [None] * len(df_items)
+    members = {}
+    for posicoes in grupos.values():
+        rep = min(posicoes, key=lambda p: (precos[p] if precos[p] is not None else math.inf, p))
+        members[rep] = posicoes
+    return DedupGroups(members, len(df_items))
@@ -35,6 +35,7 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 from lxml import html
+import arte_trace
 from selenium import webdriver
 from webdriver_manager.chrome import ChromeDriverManager
 
@@ -51,6 +52,7 @@ ORCAMENTOS_DIR = os.path.join(BASE_DIR, "EDITAIS", "aba")
 LIVRO_RAZAO_PATH = os.path.join(BASE_DIR, "livro_razao.xlsx") # Ledger de todos os editais processados
 SUMMARY_EXCEL_PATH = os.path.join(BASE_DIR, "summary.xlsx") # Este é o arquivo com todos os itens dos novos editais
 FINAL_MASTER_PATH = os.path.join(BASE_DIR, "master.xlsx") # Este será o arquivo final filtrado
+TRACE_DIR = os.path.join(os.path.dirname(BASE_DIR), "LOGS", "traces") # Trace JSONL por execução (spans por etapa)
 
 # Palavras-chave para filtro do arte_orcamento
 PALAVRAS_CHAVE = [
@@ -307,15 +309,19 @@ class WavecodeAutomation:
             self.log(f"Erro ao encontrar botões de download: {str(e)}")
             return []
 
+    @arte_trace.traced()
     def download_document(self, download_element, uasg, edital, comprador, dia_disputa):
+        arte_trace.annotate(uasg=uasg, edital=edital)
         try:
             files_before = set(os.listdir(self.download_dir))
             self.driver.execute_script("arguments[0].scrollIntoView(true);", download_element)
             time.sleep(8)
+            arte_trace.count('selenium_espera_s', 8)
             if download_element.tag_name == 'a':
                 self.driver.execute_script("window.open(arguments[0].href, '_blank');", download_element)
                 self.driver.switch_to.window(self.driver.window_handles[-1])
                 time.sleep(1)
+                arte_trace.count('selenium_espera_s', 1)
                 self.driver.close()
                 self.driver.switch_to.window(self.driver.window_handles[0])
             else:
@@ -324,6 +330,7 @@ class WavecodeAutomation:
             waited = 0
             while waited < max_wait:
                 time.sleep(8)
+                arte_trace.count('selenium_espera_s', 8)
                 waited += 2
                 files_after = set(os.listdir(self.download_dir))
                 new_files = files_after - files_before
@@ -744,6 +751,7 @@ class WavecodeAutomation:
 
         return df[colunas_desejadas + outras_colunas]
 
+    @arte_trace.traced()
     def pdfs_para_xlsx(self, input_dir=None, output_dir=None):
         input_dir = input_dir or self.download_dir
         output_dir = output_dir or self.orcamentos_dir
@@ -786,6 +794,7 @@ class WavecodeAutomation:
                 df[col] = df[col].astype(str).str.replace(' ', '').replace('nan', '')
         return df
 
+    @arte_trace.traced()
     def combine_excel_files(self, input_dir=None, output_file=None):
         input_dir = input_dir or self.orcamentos_dir
         output_file = output_file or SUMMARY_EXCEL_PATH
@@ -807,6 +816,7 @@ class WavecodeAutomation:
             df_combinado.to_excel(output_file, index=False, sheet_name='Resumo')
             self.log(f"✅ Master Excel salvo: {output_file}")
             
+    @arte_trace.traced()
     def filtrar_e_atualizar_master(self):
         """
         Filtra itens da planilha de resumo gerada (summary.xlsx) com base em palavras-chave
@@ -992,6 +1002,7 @@ class WavecodeAutomation:
         print("="*60)
         
         newly_downloaded_bids = []
+        arte_trace.start_run("arte_download", TRACE_DIR)
         try:
             self.log("[1/8] Iniciando automação do navegador...")
             self.setup_driver()
@@ -1034,6 +1045,7 @@ class WavecodeAutomation:
         
         if not newly_downloaded_bids:
             self.log("✅ Nenhum edital novo encontrado ou baixado. Pipeline concluído sem processamento de arquivos.")
+            print(arte_trace.finish_run())
             return
         
         self.log(f"\n[2/8] Atualizando livro razão com {len(newly_downloaded_bids)} novos editais...")
@@ -1065,6 +1077,7 @@ class WavecodeAutomation:
         print(f"📁 Arquivos de orçamento em: {self.orcamentos_dir}")
         print(f"📊 Master Final Filtrada: {FINAL_MASTER_PATH}")
         print(f"📖 Livro Razão atualizado: {LIVRO_RAZAO_PATH}")
+        print(arte_trace.finish_run())
 
 if __name__ == "__main__":
     automation = WavecodeAutomation()
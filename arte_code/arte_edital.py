@@ -5,15 +5,25 @@ from pathlib import Path
 import shutil
 from io import StringIO
 import time
+import threading
+import contextlib
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import pandas as pd
 import fitz  # PyMuPDF
 import zipfile
 import rarfile
-from pdf2image import convert_from_path
+from PIL import Image
 import pytesseract
 import google.generativeai as genai
 from dotenv import load_dotenv
 from datetime import datetime
+from arte_limiter import ModelRateLimiter
+from arte_llm import GeminiBackend, LLMClient, TIER_PREMIUM
+from arte_llm_replay import backend_from_env, llm_mode
+from arte_llm_cache import ResponseCache
+from arte_page_cache import PageTextCache, page_content_hash
+import arte_trace
 
 # =====================================================================================
 # 1. CONFIGURAÇÕES E CONSTANTES
@@ -31,7 +41,6 @@ FINAL_MASTER_PATH = BASE_DIR / "master.xlsx"
 
 # --- Configurações de Ferramentas Externas ---
 SCRIPTS_DIR = PROJECT_ROOT / "scripts"
-POPLER_PATH = SCRIPTS_DIR / "Release-25.07.0-0" / "poppler-25.07.0" / "Library" / "bin"
 TESSERACT_CMD = SCRIPTS_DIR / "Tesseract-OCR" / "tesseract.exe"
 pytesseract.pytesseract.tesseract_cmd = str(TESSERACT_CMD)
 UNRAR_CMD = SCRIPTS_DIR / "unrar" / "UnRAR.exe"
@@ -58,6 +67,37 @@ else:
     # para permitir o fallback entre diferentes modelos.
     # MODEL = genai.GenerativeModel(model_name='gemini-1.5-pro')
 
+# Modelos em cache, disjuntor por modelo e rota pelo mais rápido saudável do nível pedido
+# O orçamento RPM/TPM da chave é compartilhado com os outros scripts que a usam
+LLM_CLIENT = LLMClient(backend_from_env(GeminiBackend), LLM_MODELS_FALLBACK, rate_limiter=ModelRateLimiter.shared("GOOGLE_API_PAGO"))
+EDITAL_LLM_TIER = TIER_PREMIUM  # Enriquecimento/extração de itens do edital
+# Cache de respostas compartilhado com arte_heavy/arte_metadados (reexecuções não repetem prompts)
+LLM_CACHE_PATH = PROJECT_ROOT / "machine_learning" / "cache" / "llm_responses.sqlite"
+LLM_CACHE_TTL_DAYS = 30
+LLM_CACHE_MAX_MB = 256
+# Trace JSONL por execução (spans por etapa, chamadas LLM, tokens) + tabela-resumo no fim
+TRACE_DIR = PROJECT_ROOT / "LOGS" / "traces"
+
+# --- Paralelismo por Pasta ---
+# Extração de texto/OCR (CPU) em processos; etapa de IA em threads, com o ritmo real
+# das chamadas dado pelo rate limiter compartilhado. Os consolidados seguem a ordem das pastas.
+MAX_PROCESSOS_EXTRACAO = max(1, (os.cpu_count() or 2) // 2)
+MAX_PASTAS_IA = 4
+
+# --- OCR por Página ---
+# Só páginas sem camada de texto útil são renderizadas (fitz) e passam pelo Tesseract,
+# num pool de OCR_PROCESSOS processos por processo de extração.
+OCR_DPI = 300
+OCR_PROCESSOS = 2
+OCR_MAX_CARACTERES_COM_IMAGEM = 500  # Página com pouco texto (nenhum ou só carimbo/rodapé)...
+OCR_COBERTURA_IMAGEM = 0.5  # ... e imagem cobrindo ao menos metade dela vai para o OCR
+
+# --- Cache de Texto por Página ---
+# Texto direto e OCR guardados pelo hash do conteúdo de cada página: reexecuções e PDFs
+# repetidos entre editais (modelos, anexos) não são extraídos de novo. Compartilhado entre processos.
+PAGE_CACHE_PATH = PROJECT_ROOT / "machine_learning" / "cache" / "pdf_paginas.sqlite"
+PAGE_CACHE_MAX_MB = 512
+
 # --- Configurações de Filtro ---
 PALAVRAS_CHAVE = [
 
@@ -158,43 +198,125 @@ REGEX_EXCECAO = re.compile('|'.join(PALAVRAS_EXCECAO), re.IGNORECASE)
 # 2. FUNÇÕES DE EXTRAÇÃO E PROCESSAMENTO
 # =====================================================================================
 
+def pagina_precisa_ocr(page, texto: str) -> bool:
+    """
+    Decide por página: só vai para o OCR a página com pouco texto (abaixo de
+    OCR_MAX_CARACTERES_COM_IMAGEM) e imagem cobrindo ao menos OCR_COBERTURA_IMAGEM dela.
+    Páginas sem imagem (em branco, de assinatura, capas curtas) ficam com o texto direto.
+    """
+    if len(texto.strip()) >= OCR_MAX_CARACTERES_COM_IMAGEM:
+        return False
+    area_pagina = abs(page.rect) or 1.0
+    area_imagens = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    return area_imagens / area_pagina >= OCR_COBERTURA_IMAGEM
+
+def ocr_pagina_pdf(pdf_path: str, indice: int, dpi: int = OCR_DPI) -> tuple[str, float]:
+    """Renderiza uma página com fitz (tons de cinza) e aplica o Tesseract. Retorna (texto, segundos)."""
+    inicio = time.perf_counter()
+    with fitz.open(pdf_path) as doc:
+        pix = doc[indice].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        imagem = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    texto = pytesseract.image_to_string(imagem, lang='por')
+    return texto, time.perf_counter() - inicio
+
+def _iniciar_processo_ocr():
+    # Uma página por processo: o paralelismo vem do pool, não das threads internas do Tesseract
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+_PAGE_CACHE = None
+_PAGE_CACHE_LOCK = threading.Lock()
+
+def cache_paginas() -> PageTextCache:
+    """Cache de texto por página do processo atual (uma conexão SQLite por processo)."""
+    global _PAGE_CACHE
+    with _PAGE_CACHE_LOCK:
+        if _PAGE_CACHE is None:
+            _PAGE_CACHE = PageTextCache(str(PAGE_CACHE_PATH), max_bytes=PAGE_CACHE_MAX_MB * 2**20)
+        return _PAGE_CACHE
+
+def texto_pagina(doc, page, tipo: str, extrair, chave: str | None = None) -> str:
+    """Texto da página pelo cache (`tipo` = forma de extração); na falta, `extrair(page)`."""
+    cache = cache_paginas()
+    chave = chave or page_content_hash(doc, page)
+    texto = cache.get(chave, tipo)
+    if texto is None:
+        texto = extrair(page)
+        cache.put(chave, tipo, texto)
+    else:
+        arte_trace.count('cache_paginas_acertos')
+    return texto
+
 def extrair_texto_de_pdf(pdf_path: Path) -> str:
 
     """
-    Tenta extrair texto diretamente do PDF. Se o resultado for insatisfatório
-    (indicando um PDF baseado em imagem), usa OCR (Tesseract) como fallback.
+    Extrai o texto do PDF página a página: páginas com camada de texto são lidas
+    diretamente; páginas escaneadas (ver `pagina_precisa_ocr`) passam por OCR em
+    paralelo. O texto final mantém a ordem das páginas. O texto final de cada
+    página (direto ou OCR) fica no cache de páginas, pelo hash do conteúdo.
     """
-    texto_completo = ""
     print(f"    > Processando PDF: {pdf_path.name}")
-
-    # --- TENTATIVA 1: Extração de texto direto (rápido) ---
+    inicio = time.perf_counter()
     try:
+        cache = cache_paginas()
+        tipo_final = f"final_ocr{OCR_DPI}"
         with fitz.open(pdf_path) as doc:
-            for page in doc:
-                texto_completo += page.get_text("text", sort=True) + "\n\n"
-        
-        # Verifica se o texto extraído é significativo (mais de 100 caracteres)
-        if len(texto_completo.strip()) > 100:
-            print("      - ✅ Texto extraído diretamente com sucesso.")
-            return texto_completo.strip()
-        else:
-            print("      - ⚠️ Texto direto insuficiente. Tentando OCR como fallback...")
-    except Exception as e:
-        print(f"      - ⚠️ Falha na extração direta: {e}. Tentando OCR.")
-
-    # --- TENTATIVA 2: Fallback para OCR (lento) ---
-    try:
-        texto_ocr = ""
-        images = convert_from_path(pdf_path, dpi=300, poppler_path=POPLER_PATH)
-        for i, img in enumerate(images):
-            print(f"      - Lendo página {i+1}/{len(images)} (OCR)...")
-            texto_ocr += pytesseract.image_to_string(img, lang='por') + "\n\n"
-        print("      - ✅ Texto extraído via OCR com sucesso.")
-        return texto_ocr.strip()
+            textos = []
+            chaves = []
+            paginas_ocr = []
+            em_cache = 0
+            for i, page in enumerate(doc):
+                t0 = time.perf_counter()
+                chave = page_content_hash(doc, page)
+                chaves.append(chave)
+                texto = cache.get(chave, tipo_final)
+                if texto is not None:
+                    textos.append(texto)
+                    em_cache += 1
+                    arte_trace.count('cache_paginas_acertos')
+                    arte_trace.event('pagina_pdf', arquivo=pdf_path.name, pagina=i + 1, modo='cache',
+                                     segundos=round(time.perf_counter() - t0, 4), caracteres=len(texto))
+                    continue
+                # Sem passar pelo cache: a página fica gravada uma vez só, como final_* (texto direto ou OCR)
+                texto = page.get_text("text", sort=True)
+                textos.append(texto)
+                if pagina_precisa_ocr(page, texto):
+                    paginas_ocr.append(i)
+                else:
+                    cache.put(chave, tipo_final, texto)
+                    arte_trace.event('pagina_pdf', arquivo=pdf_path.name, pagina=i + 1, modo='texto',
+                                     segundos=round(time.perf_counter() - t0, 4), caracteres=len(texto))
     except Exception as e:
-        print(f"      - ❌ ERRO FATAL: Falha na extração direta e no OCR para o arquivo {pdf_path.name}: {e}")
+        print(f"      - ❌ ERRO FATAL: Falha ao abrir o arquivo {pdf_path.name}: {e}")
         return ""
 
+    if paginas_ocr:
+        print(f"      - {len(paginas_ocr)}/{len(textos)} página(s) sem texto útil. Aplicando OCR ({OCR_DPI} dpi)...")
+        with arte_trace.span('ocr', arquivo=pdf_path.name, paginas=len(paginas_ocr)):
+            # Pool de OCR só durante este PDF: um pool vivo dentro de um processo de extração
+            # impede o pool de processar_pastas_em_paralelo de encerrar esse processo.
+            paralelo = OCR_PROCESSOS > 1 and len(paginas_ocr) > 1
+            with (ProcessPoolExecutor(max_workers=min(OCR_PROCESSOS, len(paginas_ocr)), initializer=_iniciar_processo_ocr)
+                  if paralelo else contextlib.nullcontext()) as pool:
+                futures = {i: pool.submit(ocr_pagina_pdf, str(pdf_path), i, OCR_DPI) for i in paginas_ocr} if paralelo else None
+                for i in paginas_ocr:
+                    try:
+                        texto, segundos = futures[i].result() if futures else ocr_pagina_pdf(str(pdf_path), i, OCR_DPI)
+                    except Exception as e:
+                        print(f"      - ⚠️ OCR falhou na página {i + 1}: {e}. Mantendo o texto direto.")
+                        continue
+                    # Página escaneada com rodapé/carimbo digital: o OCR já lê a página inteira
+                    textos[i] = texto
+                    cache.put(chaves[i], tipo_final, texto)
+                    arte_trace.count('ocr_paginas')
+                    arte_trace.event('pagina_pdf', arquivo=pdf_path.name, pagina=i + 1, modo='ocr',
+                                     segundos=round(segundos, 4), caracteres=len(texto))
+                    print(f"      - Página {i + 1}/{len(textos)} (OCR): {segundos:.1f}s")
+
+    texto_completo = "\n\n".join(textos).strip()
+    print(f"      - ✅ {len(textos)} página(s): {em_cache} do cache, {len(textos) - len(paginas_ocr) - em_cache} com texto direto, "
+          f"{len(paginas_ocr)} via OCR ({time.perf_counter() - inicio:.1f}s).")
+    return texto_completo
+
 def extrair_itens_pdf_texto(text):
 
     """Extrai itens estruturados do texto de um PDF 'Relação de Itens'."""
@@ -245,7 +367,7 @@ def processar_pdf_relacao_itens(pdf_path):
     try:
         with fitz.open(pdf_path) as doc:
             for page in doc:
-                text += page.get_text()
+                text += texto_pagina(doc, page, "texto", lambda p: p.get_text())
     except Exception as e:
         print(f"    > ERRO ao ler o PDF {pdf_path.name}: {e}")
         return []
@@ -360,41 +482,23 @@ def tratar_dataframe(df):
     # A conversão de volta para string foi removida para permitir cálculos em outros scripts.
     return df
 
-def gerar_conteudo_com_fallback(prompt: str, modelos: list[str]):
-
-    """
-    Tenta gerar conteúdo usando uma lista de modelos em ordem de preferência.
-    Se um modelo falhar por cota (ResourceExhausted), tenta o próximo.
-    """
-    if "API_KEY" not in globals() or not API_KEY:
+def gerar_conteudo_ia(prompt: str, etapa: str) -> str | None:
+    """Chama o cliente LLM compartilhado; None se a API Key não estiver configurada ou se todos falharem."""
+    if not API_KEY and llm_mode() != "replay":
         print("    > ERRO: API Key do Google não configurada. Pulando chamada da LLM.")
         return None
+    print("    > Comunicando com a IA...")
+    return LLM_CLIENT.generate(prompt, min_tier=EDITAL_LLM_TIER, on_empty=salvar_prompt_bloqueado, stage=etapa)
 
-    for nome_modelo in modelos:
-        try:
-            print(f"    > Comunicando com a IA (modelo: {nome_modelo})...")
-            model = genai.GenerativeModel(nome_modelo)
-            response = model.generate_content(prompt)
-
-            if not response.parts:
-                finish_reason = response.candidates[0].finish_reason.name if response.candidates else 'N/A'
-                print(f"    > ❌ A GERAÇÃO RETORNOU VAZIA. Motivo: {finish_reason}. Tentando próximo modelo.")
-                # Log do prompt que causou a falha para análise posterior
-                if finish_reason == 'SAFETY':
-                    log_path = PROJECT_ROOT / "logs"
-                    log_path.mkdir(exist_ok=True)
-                    timestamp = time.strftime("%Y%m%d_%H%M%S")
-                    (log_path / f"safety_failure_{timestamp}.txt").write_text(prompt, encoding="utf-8")
-                    print(f"      - ℹ️ O prompt que causou a falha de segurança foi salvo em /logs/ para análise.")
-                continue
-            print(f"    > ✅ IA respondeu com sucesso usando o modelo '{nome_modelo}'.")
-            return response.text
-        except Exception as e:
-            # Importar a exceção específica se quiser tratá-la separadamente
-            print(f"    > ⚠️ Erro com o modelo '{nome_modelo}': {e}. Tentando o próximo da lista.")
-            continue
-    print("    > ❌ FALHA TOTAL: Todos os modelos na lista de fallback falharam.")
-    return None
+def salvar_prompt_bloqueado(prompt: str, motivo: str):
+    """Salva o prompt que causou uma falha de segurança para análise posterior."""
+    if motivo != 'SAFETY':
+        return
+    log_path = PROJECT_ROOT / "logs"
+    log_path.mkdir(exist_ok=True)
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    (log_path / f"safety_failure_{timestamp}.txt").write_text(prompt, encoding="utf-8")
+    print(f"      - ℹ️ O prompt que causou a falha de segurança foi salvo em /logs/ para análise.")
 
 def construir_prompt_referencia(df, texto_pdf):
 
@@ -549,8 +653,8 @@ def extrair_contexto_relevante_de_pdf(pdf_path: Path, df_itens: pd.DataFrame, ma
     try:
         with fitz.open(pdf_path) as doc:
             for i, page in enumerate(doc):
-                texto_pagina = page.get_text("text").lower()
-                if any(termo in texto_pagina for termo in termos_busca):
+                conteudo = texto_pagina(doc, page, "texto", lambda p: p.get_text("text")).lower()
+                if any(termo in conteudo for termo in termos_busca):
                     # Adiciona a página encontrada e as páginas na margem
                     inicio = max(0, i - margem_paginas)
                     fim = min(len(doc) - 1, i + margem_paginas)
@@ -558,7 +662,8 @@ def extrair_contexto_relevante_de_pdf(pdf_path: Path, df_itens: pd.DataFrame, ma
                         paginas_relevantes.add(num_pagina)
             
             # Extrai o texto das páginas relevantes e ordenadas
-            contexto_final = "".join(doc[i].get_text("text", sort=True) for i in sorted(list(paginas_relevantes)))
+            contexto_final = "".join(texto_pagina(doc, doc[i], "texto_ordenado", lambda p: p.get_text("text", sort=True))
+                                     for i in sorted(list(paginas_relevantes)))
             return contexto_final
     except Exception as e:
         print(f"      - ⚠️ Erro ao extrair contexto relevante de '{pdf_path.name}': {e}")
@@ -601,31 +706,16 @@ def achatar_estrutura_de_diretorios(base_path: Path):
 # 3. ORQUESTRADOR PRINCIPAL
 # =====================================================================================
 
-def processar_pasta_edital(pasta_path):
+def preparar_pasta_edital(pasta_path: Path) -> pd.DataFrame:
     """
-    Orquestra o pipeline completo para uma única pasta de edital, combinando eficiência e robustez.
-    - Pula pastas se o resultado final já existir.
-    - Prioriza a extração de 'RelacaoItens.pdf'.
-    - Usa o PDF principal para enriquecer os dados com IA.
-    - Possui um fallback para extrair itens com IA se 'RelacaoItens.pdf' falhar.
+    Etapas 1 a 3 de uma pasta (só disco e CPU: descompactação, texto/OCR dos PDFs e
+    extração de itens), sem chamadas à IA. Roda no pool de processos de
+    `processar_pastas_em_paralelo`, que repassa o `df_itens` retornado para
+    `processar_pasta_edital`; o texto dos PDFs fica em 'razao.txt'.
     """
     nome_pasta = pasta_path.name
-    print(f"\n--- Processando Edital: {nome_pasta} ---")
-    
-    # --- CAMINHOS DE SAÍDA ---
     caminho_razao_txt = pasta_path / "razao.txt"
     caminho_xlsx_itens = pasta_path / f"{nome_pasta}_itens.xlsx"
-    caminho_final_xlsx = pasta_path / f"{nome_pasta}_master.xlsx"
-
-    # --- ETAPA 0: VERIFICAR SE JÁ FOI PROCESSADO ---
-    if caminho_final_xlsx.exists():
-        print(f"  >✅ RESULTADO FINAL JÁ EXISTE ({caminho_final_xlsx.name}). Pulando processamento.")
-        try:
-            df_itens = pd.read_excel(caminho_xlsx_itens) if caminho_xlsx_itens.exists() else pd.DataFrame()
-            df_enriquecido = pd.read_excel(caminho_final_xlsx)
-            return df_itens, df_enriquecido
-        except Exception as e:
-            print(f"  > AVISO: Falha ao ler arquivos existentes. {e}. O processamento será refeito.")
 
     # --- ETAPA 1: ACHATAR ESTRUTURA DE PASTAS ---
     print(f"  [ETAPA 1/6] Garantindo que todos os arquivos estejam na pasta principal...")
@@ -642,8 +732,9 @@ def processar_pasta_edital(pasta_path):
         pdfs_na_pasta = [p for p in pasta_path.glob("*.pdf") if not p.name.lower().startswith("relacaoitens")]
         texto_completo_extraido = ""
         if pdfs_na_pasta:
-            for pdf in pdfs_na_pasta:
-                texto_completo_extraido += extrair_texto_de_pdf(pdf) + "\n\n"
+            with arte_trace.span('extrair_texto_pdfs', pdfs=len(pdfs_na_pasta)):
+                for pdf in pdfs_na_pasta:
+                    texto_completo_extraido += extrair_texto_de_pdf(pdf) + "\n\n"
             caminho_razao_txt.write_text(texto_completo_extraido, encoding="utf-8")
             print(f"    > Texto de contexto salvo em: {caminho_razao_txt.name}")
     else:
@@ -682,6 +773,42 @@ def processar_pasta_edital(pasta_path):
         else:
             print("    > AVISO: Nenhum arquivo estruturado (RelacaoItens.pdf ou .xlsx) para extração de itens foi encontrado.")
 
+    return df_itens
+
+@arte_trace.traced()
+def processar_pasta_edital(pasta_path, df_itens: pd.DataFrame | None = None):
+    """
+    Orquestra o pipeline completo para uma única pasta de edital, combinando eficiência e robustez.
+    - Pula pastas se o resultado final já existir.
+    - Prioriza a extração de 'RelacaoItens.pdf'.
+    - Usa o PDF principal para enriquecer os dados com IA.
+    - Possui um fallback para extrair itens com IA se 'RelacaoItens.pdf' falhar.
+    `df_itens` é o resultado de `preparar_pasta_edital` já feito no pool de extração;
+    sem ele (None), as etapas 1 a 3 rodam aqui.
+    """
+    nome_pasta = pasta_path.name
+    arte_trace.annotate(pasta=nome_pasta)
+    print(f"\n--- Processando Edital: {nome_pasta} ---")
+    
+    # --- CAMINHOS DE SAÍDA ---
+    caminho_razao_txt = pasta_path / "razao.txt"
+    caminho_xlsx_itens = pasta_path / f"{nome_pasta}_itens.xlsx"
+    caminho_final_xlsx = pasta_path / f"{nome_pasta}_master.xlsx"
+
+    # --- ETAPA 0: VERIFICAR SE JÁ FOI PROCESSADO ---
+    if caminho_final_xlsx.exists():
+        print(f"  >✅ RESULTADO FINAL JÁ EXISTE ({caminho_final_xlsx.name}). Pulando processamento.")
+        try:
+            df_itens = pd.read_excel(caminho_xlsx_itens) if caminho_xlsx_itens.exists() else pd.DataFrame()
+            df_enriquecido = pd.read_excel(caminho_final_xlsx)
+            return df_itens, df_enriquecido
+        except Exception as e:
+            print(f"  > AVISO: Falha ao ler arquivos existentes. {e}. O processamento será refeito.")
+
+    # --- ETAPAS 1 A 3: ARQUIVOS, TEXTO DOS PDFs E ITENS (já feitas se a pasta passou pelo pool de extração) ---
+    if df_itens is None:
+        df_itens = preparar_pasta_edital(pasta_path)
+
     # --- ETAPA 4 & 5: PROCESSAMENTO COM IA (FALLBACK E ENRIQUECIMENTO) ---
     texto_pdf_bruto = caminho_razao_txt.read_text(encoding="utf-8") if caminho_razao_txt.exists() else ""
     if not texto_pdf_bruto:
@@ -696,7 +823,7 @@ def processar_pasta_edital(pasta_path):
     if not df_itens.empty:
         print(f"  [ETAPA 4/5] Itens encontrados. Enriquecendo com IA usando contexto otimizado...")
         prompt = construir_prompt_referencia(df_itens, texto_pdf_bruto)
-        resposta_llm = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+        resposta_llm = gerar_conteudo_ia(prompt, 'enriquecimento')
         if resposta_llm:
             try:
                 df_referencia = pd.read_csv(StringIO(resposta_llm.replace("`", "")), sep="<--|-->", engine="python")
@@ -723,7 +850,7 @@ def processar_pasta_edital(pasta_path):
     else:
         print(f"  [ETAPA 4/5] Nenhum item encontrado. Usando IA como fallback para EXTRAIR do zero...")
         prompt = construir_prompt_extracao_itens(texto_pdf_bruto)
-        resposta_llm = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+        resposta_llm = gerar_conteudo_ia(prompt, 'extracao')
         if resposta_llm:
             try:
                 df_final = pd.read_csv(StringIO(resposta_llm.replace("`", "")), sep="<--|-->", engine="python", on_bad_lines='warn')
@@ -751,7 +878,8 @@ def processar_pasta_edital(pasta_path):
         df_final = df_final.reindex(columns=desired_order, fill_value='')
         
         
-        df_final.to_excel(caminho_final_xlsx, index=False)
+        with arte_trace.span('excel', arquivo=caminho_final_xlsx.name, linhas=len(df_final)):
+            df_final.to_excel(caminho_final_xlsx, index=False)
         print(f"    >✅ SUCESSO! Planilha final salva como: {caminho_final_xlsx.name}")
         return df_itens, df_final
     else:
@@ -763,6 +891,55 @@ def processar_pasta_edital(pasta_path):
         return None, df_placeholder
 
 
+def _iniciar_processo_extracao():
+    """Cada processo do pool de extração grava seus spans (OCR, PDFs) num trace próprio."""
+    global _PAGE_CACHE
+    _PAGE_CACHE = None  # Conexão SQLite própria (não a herdada no fork)
+    arte_trace.start_run(f"arte_edital_extracao_{os.getpid()}", str(TRACE_DIR))
+    # Os processos do pool não rodam atexit: o encerramento fica registrado no multiprocessing
+    multiprocessing.util.Finalize(None, _encerrar_processo_extracao, exitpriority=10)
+
+def _encerrar_processo_extracao():
+    """Ao sair do pool: grava o resumo do trace e fecha (com evicção) o cache de páginas do processo."""
+    arte_trace.finish_run()
+    if _PAGE_CACHE is not None:
+        _PAGE_CACHE.close()
+
+def processar_pastas_em_paralelo(pastas: list[Path]) -> dict[Path, tuple]:
+    """
+    Processa as pastas em duas faixas que se sobrepõem:
+    - extração (`preparar_pasta_edital`) num pool de MAX_PROCESSOS_EXTRACAO processos;
+    - assim que a extração de uma pasta termina, `processar_pasta_edital` (chamadas à IA)
+      entra num pool de MAX_PASTAS_IA threads, recebendo os itens já extraídos.
+    Retorna {pasta: (df_itens, df_final)}. Uma pasta com erro vira (None, None) e não
+    interrompe as demais; se a extração falhar, a pasta é extraída de novo na faixa de IA.
+    """
+    resultados = {}
+    # Pastas já concluídas não passam pelo pool de processos
+    pendentes = [p for p in pastas if not (p / f"{p.name}_master.xlsx").exists()]
+    with ProcessPoolExecutor(max_workers=MAX_PROCESSOS_EXTRACAO, initializer=_iniciar_processo_extracao) as processos, \
+         ThreadPoolExecutor(max_workers=MAX_PASTAS_IA) as threads:
+        extracoes = {processos.submit(preparar_pasta_edital, pasta): pasta for pasta in pendentes}
+        etapas_ia = {threads.submit(processar_pasta_edital, pasta): pasta for pasta in pastas if pasta not in pendentes}
+        for future in as_completed(extracoes):
+            pasta = extracoes[future]
+            try:
+                df_itens = future.result()
+            except Exception as e:
+                print(f"  > ⚠️ Falha na extração de '{pasta.name}' no pool de processos: {e}. Tentando de novo na etapa de IA.")
+                df_itens = None
+            etapas_ia[threads.submit(processar_pasta_edital, pasta, df_itens)] = pasta
+
+        for future in as_completed(etapas_ia):
+            pasta = etapas_ia[future]
+            try:
+                resultados[pasta] = future.result()
+            except Exception as e:
+                print(f"--- ❌ ERRO no edital '{pasta.name}': {e}. Seguindo com os demais. ---")
+                resultados[pasta] = (None, None)
+            print(f"--- Edital {len(resultados)}/{len(pastas)} concluído ({pasta.name}). ---")
+    return resultados
+
 def main():
     """
     Função principal que itera sobre todas as pastas de editais e as processa.
@@ -775,18 +952,23 @@ def main():
     if not PASTA_EDITAIS.is_dir():
         print(f"ERRO CRÍTICO: O diretório de editais '{PASTA_EDITAIS}' não foi encontrado.")
         return
+    # Gravação/reprodução (arte_llm_replay): acertos do cache não chegariam ao arquivo nem passariam pela latência/429 simulados
+    if llm_mode() == "live":
+        LLM_CLIENT.cache = ResponseCache(str(LLM_CACHE_PATH), ttl_seconds=LLM_CACHE_TTL_DAYS * 86400, max_bytes=LLM_CACHE_MAX_MB * 2**20)
+    arte_trace.start_run("arte_edital", str(TRACE_DIR))
 
     todos_os_itens_base = []
     todos_os_itens_finais = []
 
     pastas_de_editais = sorted([d for d in PASTA_EDITAIS.iterdir() if d.is_dir()])
-    for i, pasta in enumerate(pastas_de_editais):
-        df_base, df_final = processar_pasta_edital(pasta)
+    resultados = processar_pastas_em_paralelo(pastas_de_editais)
+    # Consolidação na ordem das pastas, independente da ordem em que terminaram
+    for pasta in pastas_de_editais:
+        df_base, df_final = resultados[pasta]
         if df_base is not None and not df_base.empty:
             todos_os_itens_base.append(df_base)
         if df_final is not None and not df_final.empty:
             todos_os_itens_finais.append(df_final)
-        print(f"--- Edital {i+1}/{len(pastas_de_editais)} concluído. ---")
 
     print("\n--- Finalizando e Gerando Arquivos Consolidados ---")
 
@@ -794,7 +976,8 @@ def main():
     if todos_os_itens_finais:
         df_summary = pd.concat(todos_os_itens_finais, ignore_index=True)
         df_summary = tratar_dataframe(df_summary)
-        df_summary.to_excel(SUMMARY_EXCEL_PATH, index=False)
+        with arte_trace.span('excel', arquivo=SUMMARY_EXCEL_PATH.name, linhas=len(df_summary)):
+            df_summary.to_excel(SUMMARY_EXCEL_PATH, index=False)
         print(f"✅ Arquivo 'summary.xlsx' criado com {len(df_summary)} itens totais (dos arquivos _master).")
     else:
         print("🟡 Nenhum item final foi processado para gerar o 'summary.xlsx'.")
@@ -832,7 +1015,8 @@ def main():
         # Adicionar coluna de timestamp
         df_filtrado['TIMESTAMP'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        df_filtrado.to_excel(FINAL_MASTER_PATH, index=False)
+        with arte_trace.span('excel', arquivo=FINAL_MASTER_PATH.name, linhas=len(df_filtrado)):
+            df_filtrado.to_excel(FINAL_MASTER_PATH, index=False)
         print(f"✅ Arquivo 'master.xlsx' criado com {len(df_filtrado)} itens relevantes.")
 
         # --- Análise de Editais Ausentes no Master ---
@@ -865,6 +1049,14 @@ def main():
             except OSError as e:
                 print(f"  > ERRO ao remover {caminho_itens_xlsx.name}: {e}")
 
+    print(LLM_CLIENT.health_report())
+    if LLM_CLIENT.cache is not None:
+        print(LLM_CLIENT.cache.report())
+        LLM_CLIENT.cache.close()
+    # Só os acertos deste processo; os dos processos de extração estão nos traces deles
+    print(cache_paginas().report())
+    cache_paginas().close()
+    print(arte_trace.finish_run())
     print("="*80)
     print("PROCESSO CONCLUÍDO!")
     print("="*80)
@@ -0,0 +1,227 @@
+"""
+ARMAZENAMENTO INCREMENTAL DE EMBEDDINGS DA BASE DE PRODUTOS
+===========================================================
+
+Cada produto é identificado por um hash de conteúdo (ID_PRODUTO + DESCRICAO).
+A cada execução, `EmbeddingStore.sync` compara os hashes da base atual com os
+já codificados e só envia ao modelo as linhas novas ou alteradas; produtos
+removidos da base saem do armazenamento. A matriz de vetores e as linhas de
+metadados são gravadas juntas e na ordem da base (linha i = produto i), o mesmo
+contrato de posições do `CatalogIndex`.
+
+Arquivos em `store_dir`:
+- vectors.npy  -> matriz float32 (N x dim), fonte para a atualização incremental
+- rows.pkl     -> DataFrame com content_hash + colunas de contexto, alinhado à matriz
+- model.txt    -> nome do modelo que gerou os vetores (trocar o modelo recodifica tudo)
+- vectors_int8.npy + scales_int8.npy -> vetores normalizados em int8 com escala por linha
+- vectors_float16.npy                -> vetores normalizados em float16
+
+As versões quantizadas são abertas com `QuantizedEmbeddings.open` como memmap
+(somente leitura): vários processos compartilham o cache de páginas do sistema
+em vez de cada um carregar a matriz float32 inteira na RAM. Com
+`sync(..., quantization='int8')` e a base inalterada, a matriz float32 nem é
+lida; armazenamentos antigos sem os arquivos quantizados são completados.
+"""
+
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_COLUMNS = ['ID_PRODUTO', 'DESCRICAO', 'categoria_principal', 'subcategoria', 'MARCA', 'MODELO', 'VALOR']
+QUANTIZED_DTYPES = ('int8', 'float16')
+
+
+def product_content_hash(id_produto, descricao) -> str:
+    """Hash estável do produto: muda quando o ID ou a descrição mudam."""
+    texto = f"{'' if pd.isna(id_produto) else id_produto}\x1f{'' if pd.isna(descricao) else descricao}"
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Linhas com norma 1 (float32)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+def quantize_rows(vectors: np.ndarray, dtype: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Normaliza as linhas (cosseno vira produto escalar) e quantiza.
+    Retorna (códigos, escala por linha): vetor ≈ códigos * escala.
+    """
+    normalized = normalize_rows(vectors)
+    if dtype == 'int8':
+        scales = np.maximum(np.abs(normalized).max(axis=1), 1e-12) / 127.0
+        codes = np.clip(np.rint(normalized / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if dtype in ('float16', 'float32'):
+        return normalized.astype(dtype), np.ones(len(normalized), dtype=np.float32)
+    raise ValueError(f"Tipo de quantização não suportado: {dtype}")
+
+
+class QuantizedEmbeddings:
+    """Matriz de embeddings normalizada e quantizada (int8 com escala por linha, float16 ou float32)."""
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_vectors(cls, vectors: np.ndarray, dtype: str = 'float32') -> "QuantizedEmbeddings":
+        return cls(*quantize_rows(vectors, dtype))
+
+    @classmethod
+    def open(cls, store_dir: str, dtype: str = 'int8') -> "QuantizedEmbeddings":
+        """Abre os arquivos quantizados do armazenamento como memmap somente leitura."""
+        codes = np.load(os.path.join(store_dir, f"vectors_{dtype}.npy"), mmap_mode='r')
+        scales_path = os.path.join(store_dir, f"scales_{dtype}.npy")
+        scales = np.load(scales_path, mmap_mode='r') if os.path.exists(scales_path) else np.ones(len(codes), dtype=np.float32)
+        return cls(codes, scales)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def dim(self) -> int:
+        return self.codes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + np.asarray(self.scales).nbytes)
+
+    def score(self, query: np.ndarray, positions=None) -> np.ndarray:
+        """
+        Similaridade de cosseno entre a consulta e as linhas indicadas (ou todas),
+        calculada sobre os códigos quantizados: (códigos · q) * escala da linha.
+        Só as linhas pedidas são lidas do memmap.
+        """
+        query = normalize_rows(np.asarray(query).reshape(1, -1))[0]
+        if positions is None:
+            codes, scales = self.codes, self.scales
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            codes, scales = self.codes[positions], self.scales[positions]
+        return (codes.astype(np.float32, copy=False) @ query) * scales
+
+    def dequantize(self, positions=None) -> np.ndarray:
+        codes = self.codes if positions is None else self.codes[np.asarray(positions, dtype=np.int64)]
+        scales = self.scales if positions is None else self.scales[np.asarray(positions, dtype=np.int64)]
+        return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def _save_atomic(path: str, write_fn):
+    """Grava em um arquivo temporário e substitui o destino (nunca deixa um arquivo pela metade)."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        write_fn(f)
+    os.replace(temp_path, path)
+
+
+class EmbeddingStore:
+    """Vetores da base de produtos indexados por hash de conteúdo, atualizados incrementalmente."""
+
+    def __init__(self, store_dir: str, model_name: str):
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self.vectors_path = os.path.join(store_dir, "vectors.npy")
+        self.rows_path = os.path.join(store_dir, "rows.pkl")
+        self.model_path = os.path.join(store_dir, "model.txt")
+
+    def _stored_hashes(self) -> list[str] | None:
+        """Hashes na ordem gravada, sem ler os vetores; None se ausente, ilegível ou de outro modelo."""
+        if not all(os.path.exists(p) for p in (self.vectors_path, self.rows_path, self.model_path)):
+            return None
+        try:
+            with open(self.model_path, 'r', encoding='utf-8') as f:
+                if f.read().strip() != self.model_name:
+                    return None
+            return pd.read_pickle(self.rows_path)['content_hash'].tolist()
+        except Exception:
+            return None
+
+    def _has_quantized(self, dtype: str, n_rows: int) -> bool:
+        """Os arquivos quantizados de `dtype` existem e têm `n_rows` linhas."""
+        codes_path = os.path.join(self.store_dir, f"vectors_{dtype}.npy")
+        scales_path = os.path.join(self.store_dir, f"scales_{dtype}.npy")
+        if not os.path.exists(codes_path) or (dtype == 'int8' and not os.path.exists(scales_path)):
+            return False
+        try:
+            return len(np.load(codes_path, mmap_mode='r')) == n_rows
+        except Exception:
+            return False
+
+    def _load(self) -> tuple[dict[str, np.ndarray], list[str]]:
+        """
+        Retorna (mapa hash -> vetor, hashes na ordem gravada) do armazenamento atual;
+        vazio se ausente, inconsistente ou gerado por outro modelo.
+        """
+        if not all(os.path.exists(p) for p in (self.vectors_path, self.rows_path, self.model_path)):
+            return {}, []
+        try:
+            with open(self.model_path, 'r', encoding='utf-8') as f:
+                if f.read().strip() != self.model_name:
+                    logger.info("Modelo de embeddings mudou. Recodificando toda a base.")
+                    return {}, []
+            vectors = np.load(self.vectors_path)
+            rows = pd.read_pickle(self.rows_path)
+        except Exception as e:
+            logger.warning(f"Armazenamento de embeddings ilegível ({e}). Recodificando toda a base.")
+            return {}, []
+        if len(vectors) != len(rows):
+            logger.warning("Vetores e metadados de embeddings desalinhados. Recodificando toda a base.")
+            return {}, []
+        return dict(zip(rows['content_hash'], vectors)), rows['content_hash'].tolist()
+
+    def sync(self, df_base: pd.DataFrame, encode_fn,
+             quantization: str = 'float32') -> tuple["np.ndarray | QuantizedEmbeddings", pd.DataFrame]:
+        """
+        Alinha o armazenamento à base atual e retorna (vetores, linhas) na ordem de `df_base`.
+        `encode_fn(textos) -> np.ndarray` só é chamada para os produtos novos ou alterados.
+        Com `quantization` 'int8'/'float16', os vetores voltam como `QuantizedEmbeddings`
+        (memmap) e, se a base não mudou, a matriz float32 não é carregada.
+        """
+        hashes = [product_content_hash(i, d) for i, d in zip(df_base['ID_PRODUTO'], df_base['DESCRICAO'])]
+        rows = df_base.reindex(columns=CONTEXT_COLUMNS).copy()
+        rows.insert(0, 'content_hash', hashes)
+        quantized = quantization != 'float32'
+        if quantized and self._stored_hashes() == hashes and self._has_quantized(quantization, len(hashes)):
+            logger.info("Embeddings da base já atualizados.")
+            return QuantizedEmbeddings.open(self.store_dir, quantization), rows
+
+        known, stored_order = self._load()
+
+        pendentes = list(dict.fromkeys(h for h in hashes if h not in known))
+        if pendentes:
+            textos_por_hash = dict(zip(hashes, df_base['DESCRICAO'].fillna('').astype(str)))
+            logger.info(f"Codificando {len(pendentes)} de {len(df_base)} produtos (novos ou alterados)...")
+            novos = np.asarray(encode_fn([textos_por_hash[h] for h in pendentes]), dtype=np.float32)
+            known.update(zip(pendentes, novos))
+        else:
+            logger.info("Embeddings da base já atualizados.")
+
+        vectors = np.stack([known[h] for h in hashes]).astype(np.float32) if hashes else np.empty((0, 0), dtype=np.float32)
+
+        removidos = len(set(known) - set(hashes))
+        # Armazenamento anterior à quantização: os arquivos quantizados ainda não existem
+        sem_quantizados = quantized and not self._has_quantized(quantization, len(hashes))
+        if pendentes or removidos or stored_order != hashes or sem_quantizados:
+            self._save(vectors, rows)
+            logger.info(f"Embeddings salvos: {len(pendentes)} codificados, {removidos} removidos, {len(rows)} no total.")
+        if quantized:
+            del vectors, known
+            return QuantizedEmbeddings.open(self.store_dir, quantization), rows
+        return vectors, rows
+
+    def _save(self, vectors: np.ndarray, rows: pd.DataFrame):
+        os.makedirs(self.store_dir, exist_ok=True)
+        _save_atomic(self.vectors_path, lambda f: np.save(f, vectors))
+        _save_atomic(self.rows_path, lambda f: rows.to_pickle(f))
+        for dtype in QUANTIZED_DTYPES:
+            codes, scales = quantize_rows(vectors, dtype)
+            _save_atomic(os.path.join(self.store_dir, f"vectors_{dtype}.npy"), lambda f: np.save(f, codes))
+            if dtype == 'int8':
+                _save_atomic(os.path.join(self.store_dir, f"scales_{dtype}.npy"), lambda f: np.save(f, scales))
+        _save_atomic(self.model_path, lambda f: f.write(self.model_name.encode('utf-8')))
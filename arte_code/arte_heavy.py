@@ -1,6 +1,5 @@
 import pandas as pd
 import google.generativeai as genai
-import google.api_core.exceptions as google_exceptions
 import os
 from dotenv import load_dotenv
 import json
@@ -8,10 +7,25 @@ import time
 import logging
 from openpyxl.styles import PatternFill
 import re
+import hashlib
 from datetime import datetime
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from arte_tfidf import TfidfCatalogIndex
+from arte_catalog import CatalogIndex
+from arte_packer import PackedCandidates, pack_candidates
+from arte_dedup import group_items, normalize_text
+from arte_store import DebouncedExport, ResultStore, result_key
+from arte_limiter import ModelRateLimiter
+from arte_llm import GeminiBackend, LLMClient, TIER_PREMIUM, TIER_STANDARD, llm_calls_in_thread
+from arte_llm_replay import backend_from_env, llm_mode
+from arte_llm_cache import ResponseCache, near_duplicate_key
+from arte_speculative import CascadeStage, SpeculativeCascade
+from arte_hybrid import BM25CatalogIndex, HybridRetriever
+import arte_trace
 
 # ======================================================================
 # CONFIGURAÇÕES E CONSTANTES
@@ -23,6 +37,13 @@ CAMINHO_EDITAL = os.path.join(BASE_DIR, "DOWNLOADS", "master.xlsx")
 CAMINHO_BASE = os.path.join(BASE_DIR, "DOWNLOADS", "METADADOS", "produtos_metadados.xlsx")
 CAMINHO_SAIDA = os.path.join(BASE_DIR, "DOWNLOADS", "master_heavy.xlsx")
 CAMINHO_HEAVY_EXISTENTE = CAMINHO_SAIDA
+CAMINHO_RESULT_STORE = os.path.join(BASE_DIR, "DOWNLOADS", "master_heavy.sqlite")  # Resultados gravados item a item
+EXCEL_EXPORT_INTERVAL_SECONDS = 300  # Exporta a planilha estilizada no máximo a cada N segundos (0 = só no fim)
+TFIDF_INDEX_DIR = os.path.join(BASE_DIR, "machine_learning", "ml_models", "tfidf_index")
+BM25_INDEX_DIR = os.path.join(BASE_DIR, "machine_learning", "ml_models", "bm25_index")
+CLASSIFICATION_CACHE_PATH = os.path.join(BASE_DIR, "machine_learning", "cache", "item_classification.json")
+LLM_CACHE_PATH = os.path.join(BASE_DIR, "machine_learning", "cache", "llm_responses.sqlite")  # Compartilhado com arte_edital/arte_metadados
+TRACE_DIR = os.path.join(BASE_DIR, "LOGS", "traces")  # Trace JSONL por execução (spans, chamadas LLM, tokens)
 
 # --- Financial Parameters ---
 PROFIT_MARGIN = 0.53  # MARGEM DE LUCRO
@@ -39,9 +60,33 @@ LLM_MODELS_FALLBACK = [
     "gemini-1.5-flash",  
 ]
 
+# --- Concurrency & Rate Limits ---
+MAX_CONCURRENT_ITEMS = 8  # Itens processados em paralelo
+LLM_MAX_QUOTA_ROUNDS = 3  # Rodadas pela lista de fallback quando todos os modelos estão sem cota
+# Orçamento por modelo (sobrescreve os padrões de arte_limiter). Ex.: {"gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000}}
+LLM_RATE_LIMITS = {}
+# Nível de qualidade por modelo (sobrescreve os padrões de arte_llm) e nível mínimo por tarefa
+LLM_QUALITY_TIERS = {}
+CLASSIFICATION_LLM_TIER = TIER_STANDARD
+MATCH_LLM_TIER = TIER_PREMIUM
+LLM_CACHE_TTL_DAYS = 30  # Respostas em cache expiram após N dias
+LLM_CACHE_MAX_MB = 256  # Acima disso, as respostas usadas há mais tempo são removidas
+NEAR_DUPLICATE_CACHE = True  # Reaproveita o match quando descrição normalizada e candidatos são os mesmos
+
 # --- ML Configuration ---
 SUBCATEGORY_ML_CANDIDATES = 10
 MAIN_CATEGORY_ML_CANDIDATES = 20
+CLASSIFICATION_BATCH_SIZE = 25  # Itens por prompt na classificação em lote
+CANDIDATE_TOKEN_BUDGET = 6000  # Orçamento de tokens da tabela de candidatos enviada ao LLM
+# "cascata": etapas por subcategoria/categoria (até 3 chamadas LLM por faixa de preço)
+# "hibrido": BM25 + TF-IDF fundidos por RRF numa única lista (1 chamada LLM por faixa de preço)
+RETRIEVAL_MODE = "cascata"
+HYBRID_CANDIDATES = 20  # Candidatos da lista fundida enviados ao LLM
+
+# --- Cascata Especulativa ---
+SPECULATIVE_CASCADE = False  # Gera os candidatos das etapas 2 e 3 em paralelo com a etapa 1
+SPECULATIVE_LLM_CALLS = False  # ... e já dispara os julgamentos do LLM delas (chamadas extras quando a etapa 1 resolve)
+SPECULATIVE_WASTED_CALL_BUDGET = 200  # Máximo de chamadas LLM especulativas descartadas por execução (None = sem limite)
 
 # --- Categorization Keywords ---
 CATEGORIZATION_KEYWORDS = {
@@ -67,33 +112,29 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Orçamento compartilhado com os outros scripts que usam a mesma chave (GOOGLE_API_PAGO)
+RATE_LIMITER = ModelRateLimiter.shared("GOOGLE_API_PAGO", LLM_RATE_LIMITS)
+# Modelos em cache, disjuntor por modelo e rota pelo mais rápido saudável do nível pedido
+LLM_CLIENT = LLMClient(backend_from_env(GeminiBackend), LLM_MODELS_FALLBACK, quality_tiers=LLM_QUALITY_TIERS,
+                       rate_limiter=RATE_LIMITER, max_rounds=LLM_MAX_QUOTA_ROUNDS)
+# Etapas da cascata (sequencial ou especulativa) e o relatório de latência x chamadas extras
+CASCADE = SpeculativeCascade(SPECULATIVE_CASCADE, SPECULATIVE_LLM_CALLS, max_workers=2 * MAX_CONCURRENT_ITEMS,
+                             wasted_call_budget=SPECULATIVE_WASTED_CALL_BUDGET)
+
 # ============================================================
 # FUNÇÕES DE IA E ML
 # ============================================================
 
-def gerar_conteudo_com_fallback(prompt: str, modelos: list[str]) -> str | None:
-    """Tenta gerar conteúdo usando uma lista de modelos em ordem de preferência."""
-    for nome_modelo in modelos:
-        try:
-            print(f"   - Tentando chamada à API com o modelo: {nome_modelo}...")
-            model = genai.GenerativeModel(nome_modelo)
-            response = model.generate_content(prompt)
+def clean_json_response(response_text: str) -> str:
+    return response_text.strip().replace("```json", "").replace("```", "")
 
-            if not response.parts:
-                finish_reason = response.candidates[0].finish_reason.name if response.candidates else 'N/A'
-                print(f"   - ❌ A GERAÇÃO RETORNOU VAZIA. Motivo: {finish_reason}.")
-                return None
-            print(f"   - Sucesso com o modelo '{nome_modelo}'.")
-            return response.text
-        except google_exceptions.ResourceExhausted as e:
-            print(f"- Cota excedida para o modelo '{nome_modelo}'. Tentando o próximo da lista.")
-            time.sleep(5)
-            continue
-        except Exception as e:
-            print(f"   - ❌ Erro inesperado com o modelo '{nome_modelo}': {e}")
-            return None
-    print("   - ❌ FALHA TOTAL: Todos os modelos na lista de fallback falharam.")
-    return None
+def is_json_response(response_text: str) -> bool:
+    """Só respostas JSON decodificáveis são servidas do cache ou gravadas nele."""
+    try:
+        json.loads(clean_json_response(response_text))
+        return True
+    except json.JSONDecodeError:
+        return False
 
 def get_item_classification(description: str, reference: str, categories_with_subcategories: dict) -> dict | None:
     """Usa o modelo de IA para classificar o item."""
@@ -120,12 +161,12 @@ Referência: {reference}
 </formato_saida>
 JSON:
 """
-    response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+    response_text = LLM_CLIENT.generate(prompt, min_tier=CLASSIFICATION_LLM_TIER, stage='classificacao', validate=is_json_response)
     if response_text:
         try:
-            cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
+            cleaned_response = clean_json_response(response_text)
             classification = json.loads(cleaned_response)
-            if 'categoria_principal' in classification and 'subcategoria' in classification and classification['categoria_principal'] in categories_with_subcategories:
+            if is_valid_classification(classification, categories_with_subcategories):
                 return classification
             else:
                 print(f"   - WARNING: AI returned an invalid or incomplete classification: {classification}")
@@ -135,23 +176,161 @@ JSON:
             return None
     return None
 
-def get_best_match_from_ai(item_edital, df_candidates, attempt_description: str):
+def is_valid_classification(classification, categories_with_subcategories: dict) -> bool:
+    """Verifica se a categoria e a subcategoria pertencem à taxonomia permitida."""
+    if not isinstance(classification, dict):
+        return False
+    categoria = classification.get('categoria_principal')
+    subcategoria = classification.get('subcategoria')
+    return categoria in categories_with_subcategories and subcategoria in categories_with_subcategories[categoria]
+
+def normalize_classification_key(description: str, reference: str) -> str:
+    """Chave do cache de classificação: DESCRICAO + REFERENCIA sem acentos, caixa ou espaços extras."""
+    texto = normalize_text(f"{description} || {reference}")
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+def load_classification_cache(categories_with_subcategories: dict) -> dict:
+    """Carrega o cache persistente de classificações, descartando entradas fora da taxonomia atual."""
+    if not os.path.exists(CLASSIFICATION_CACHE_PATH):
+        return {}
+    try:
+        with open(CLASSIFICATION_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Cache de classificação ilegível ({e}). Iniciando um novo.")
+        return {}
+    return {k: v for k, v in cache.items() if is_valid_classification(v, categories_with_subcategories)}
+
+def save_classification_cache(cache: dict):
+    """Grava o cache de classificações de forma atômica (arquivo temporário + replace)."""
+    os.makedirs(os.path.dirname(CLASSIFICATION_CACHE_PATH), exist_ok=True)
+    temp_path = f"{CLASSIFICATION_CACHE_PATH}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, CLASSIFICATION_CACHE_PATH)
+
+def get_batch_classification(items: list[tuple[str, str]], categories_with_subcategories: dict) -> list[dict | None]:
+    """Classifica vários itens em um único prompt. Retorna uma classificação (ou None) por item, na mesma ordem."""
+    print(f"- Asking AI to classify a batch of {len(items)} items...")
+    itens_json = json.dumps(
+        [{"id": i, "descricao": desc, "referencia": ref} for i, (desc, ref) in enumerate(items)],
+        ensure_ascii=False
+    )
+    prompt = f"""<identidade>Você é um especialista de almoxarifado e perito em catalogação de produtos.</identidade>
+<objetivo>
+Sua tarefa é classificar CADA item da lista a seguir, identificando sua `categoria_principal` e `subcategoria` com base na estrutura fornecida.
+- A `categoria_principal` DEVE ser uma das chaves da estrutura.
+- A `subcategoria` DEVE ser um dos valores da lista associada à categoria principal escolhida.
+- Retorne exatamente um objeto por item, preservando o `id` recebido.
+Responda APENAS com uma lista JSON.
+</objetivo>
+<estrutura_de_categorias_e_subcategorias_permitidas>
+{json.dumps(categories_with_subcategories, ensure_ascii=False)}
+</estrutura_de_categorias_e_subcategorias_permitidas>
+<itens_a_serem_classificados>
+{itens_json}
+</itens_a_serem_classificados>
+<formato_saida>
+[
+  {{"id": 0, "categoria_principal": "NOME_DA_CATEGORIA_PRINCIPAL", "subcategoria": "NOME_DA_SUBCATEGORIA_ESPECIFICA"}}
+]
+</formato_saida>
+JSON:
+"""
+    results = [None] * len(items)
+    response_text = LLM_CLIENT.generate(prompt, min_tier=CLASSIFICATION_LLM_TIER, stage='classificacao_lote', validate=is_json_response)
+    if not response_text:
+        return results
+    try:
+        cleaned_response = clean_json_response(response_text)
+        parsed = json.loads(cleaned_response)
+    except json.JSONDecodeError as e:
+        print(f"   - ERROR decoding JSON from AI for batch classification: {e}")
+        return results
+
+    for entry in parsed if isinstance(parsed, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        idx = entry.get('id')
+        if isinstance(idx, int) and 0 <= idx < len(items) and is_valid_classification(entry, categories_with_subcategories):
+            results[idx] = {'categoria_principal': entry['categoria_principal'], 'subcategoria': entry['subcategoria']}
+    return results
+
+@arte_trace.traced()
+def classify_items(df_items: pd.DataFrame, categories_with_subcategories: dict) -> list[dict | None]:
+    """
+    Classifica todos os itens do DataFrame (um resultado por linha, na mesma ordem).
+    Consulta primeiro o cache persistente; os itens ausentes são deduplicados e
+    classificados em lotes de CLASSIFICATION_BATCH_SIZE, e os rejeitados na
+    validação recebem uma nova tentativa individual.
+    """
+    cache = load_classification_cache(categories_with_subcategories)
+    keys, pending = [], {}
+    for _, item in df_items.iterrows():
+        description = str(item['DESCRICAO'])
+        reference = str(item.get('REFERENCIA', 'N/A'))
+        key = normalize_classification_key(description, reference)
+        keys.append(key)
+        if key not in cache and key not in pending:
+            pending[key] = (description, reference)
+
+    cache_hits = len(keys) - sum(1 for k in keys if k in pending)
+    logger.info(f"Classification cache: {cache_hits}/{len(keys)} hits, {len(pending)} unique items to classify.")
+    print(f"   - Classification cache: {cache_hits}/{len(keys)} hits, {len(pending)} unique items to classify.")
+
+    pending_keys = list(pending)
+    llm_calls = 0
+    for start in range(0, len(pending_keys), CLASSIFICATION_BATCH_SIZE):
+        batch_keys = pending_keys[start:start + CLASSIFICATION_BATCH_SIZE]
+        batch_results = get_batch_classification([pending[k] for k in batch_keys], categories_with_subcategories)
+        llm_calls += 1
+        for key, classification in zip(batch_keys, batch_results):
+            if classification is None:
+                # Rejeitado ou ausente na resposta do lote: nova tentativa individual
+                classification = get_item_classification(*pending[key], categories_with_subcategories)
+                llm_calls += 1
+            if classification is not None:
+                cache[key] = classification
+        save_classification_cache(cache)
+
+    logger.info(f"Classification finished with {llm_calls} LLM calls for {len(keys)} items.")
+    return [cache.get(key) for key in keys]
+
+def resolve_match_from_catalog(match_data: dict | None, packed: PackedCandidates) -> dict | None:
+    """Preenche Marca/Modelo/Valor/Descrição a partir da linha do catálogo indicada pelo ID da resposta."""
+    if not isinstance(match_data, dict):
+        return match_data
+    row = packed.row_for(match_data.get('ID'))
+    if row is None:
+        print(f"   - WARNING: AI returned unknown product ID '{match_data.get('ID')}'. Keeping the AI-provided fields.")
+        return match_data
+    return {
+        **match_data,
+        'Marca': row.get('MARCA'),
+        'Modelo': row.get('MODELO'),
+        'Valor': float(pd.to_numeric(row.get('VALOR'), errors='coerce') or 0),
+        'Descricao_fornecedor': row.get('DESCRICAO'),
+    }
+
+def get_best_match_from_ai(item_edital, packed: PackedCandidates, attempt_description: str):
     """Usa o modelo de IA para encontrar o melhor match dentro dos candidatos, retornando uma análise estruturada."""
     print(f" - Asking AI for the best match ({attempt_description})...")
-    if df_candidates.empty:
+    if len(packed) == 0:
         print("   - WARNING: Candidate DataFrame is empty. Skipping AI call.")
         return {"best_match": None, "closest_match": None, "reasoning": "No candidates provided."}
+    if packed.dropped:
+        print(f"   - Sending top {len(packed)}/{packed.total} candidates (~{packed.tokens} tokens).")
 
-    candidates_json = df_candidates[['DESCRICAO','categoria_principal','subcategoria','MARCA','MODELO','VALOR']].to_json(orient="records", force_ascii=False, indent=2)
     prompt = f"""<identidade>Você é um consultor de licitações com 20+ anos de experiência em áudio/instrumentos, focado na Lei 14.133/21, economicidade e menor preço.</identidade>
 <objetivo>
 1.  Analise tecnicamente o item do edital: Descrição: `"{item_edital['DESCRICAO']}"` Referência: `"{item_edital.get('REFERENCIA', 'N/A')}"`.
-2.  Compare-o com cada produto na `<base_fornecedores_filtrada>`.
+2.  Compare-o com cada produto na `<base_fornecedores_filtrada>` (tabela separada por `|`; ESPECIFICACOES é um resumo da descrição do produto).
 3.  **Seleção Primária**: Encontre o produto da base que seja >=95% compatível. Dentre os compatíveis, escolha o de **menor 'Valor'**.
 4.  **Seleção Secundária**: Se nenhum for >=95% compatível, identifique o produto tecnicamente mais próximo.
 5.  **Análise Estruturada**: Para o produto escolhido (seja `best_match` ou `closest_match`), forneça uma análise de compatibilidade detalhada no formato JSON especificado abaixo, incluindo: "É compativel x de y especificações" logo no inicio. 
 6.  **Falhas Críticas**: Se uma especificação chave e obrigatória do edital (ex: sensor térmico, potência mínima, marca específica) não for atendida, adicione a flag `FALHA CRÍTICA:` no início do ponto negativo correspondente. 
-7.  Responda **apenas** com um objeto JSON.
+7.  Identifique o produto escolhido pelo `ID` exato da tabela (ex.: "P123").
+8.  Responda **apenas** com um objeto JSON.
 </objetivo>
 <formato_saida>
 Responda APENAS com um único objeto JSON. Não inclua ```json ou qualquer outro texto.
@@ -159,10 +338,10 @@ Responda APENAS com um único objeto JSON. Não inclua ```json ou qualquer outro
 **CASO 1: Encontrou um produto >=95% compatível.**
 {{
   "best_match": {{
+    "ID": "P123",
     "Marca": "Marca do Produto",
     "Modelo": "Modelo do Produto",
     "Valor": 1234.56,
-    "Descricao_fornecedor": "Descrição completa do produto na base",
     "Compatibilidade_analise": {{
       "score_proposto": 98,
       "pontos_positivos": ["Atende à potência de 50W", "Material é alumínio conforme solicitado"],
@@ -177,10 +356,10 @@ Retorne `best_match` como `null` e preencha `closest_match` com a análise do pr
 {{
   "best_match": null,
   "closest_match": {{
+    "ID": "P456",
     "Marca": "Marca do Produto Mais Próximo",
     "Modelo": "Modelo do Mais Próximo",
     "Valor": 4321.98,
-    "Descricao_fornecedor": "Descrição do produto mais próximo.",
     "Compatibilidade_analise": {{
       "score_proposto": 40,
       "pontos_positivos": ["É da mesma marca", "Função de voo está presente"],
@@ -189,25 +368,53 @@ Retorne `best_match` como `null` e preencha `closest_match` com a análise do pr
     }}
   }}
 }}
-</formato_saida><base_fornecedores_filtrada>{candidates_json}</base_fornecedores_filtrada>"""
-
-    response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+</formato_saida><base_fornecedores_filtrada>
+{packed.table}
+</base_fornecedores_filtrada>"""
+
+    near_key = None
+    if NEAR_DUPLICATE_CACHE:
+        near_key = near_duplicate_key(
+            normalize_text(item_edital['DESCRICAO']),
+            normalize_text(item_edital.get('REFERENCIA', '')),
+            tuple(sorted(packed.by_id)),
+            tuple(packed.frame['VALOR'].tolist()) if 'VALOR' in packed.frame.columns else (),
+        )
+    response_text = LLM_CLIENT.generate(prompt, min_tier=MATCH_LLM_TIER, stage='match', near_key=near_key, validate=is_json_response)
     if response_text:
         try:
-            cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
-            return json.loads(cleaned_response)
+            cleaned_response = clean_json_response(response_text)
+            ai_result = json.loads(cleaned_response)
+            if not isinstance(ai_result, dict):
+                raise json.JSONDecodeError("Resposta não é um objeto JSON", cleaned_response, 0)
+            for key in ("best_match", "closest_match"):
+                ai_result[key] = resolve_match_from_catalog(ai_result.get(key), packed)
+            return ai_result
         except json.JSONDecodeError as e:
             print(f"   - ERROR decoding JSON from AI (Attempt: {attempt_description}): {e}")
             return {"best_match": None, "closest_match": None, "reasoning": f"Erro na decodificação do JSON da API: {e}"}
     return {"best_match": None, "closest_match": None, "reasoning": "Falha na chamada da API para todos os modelos de fallback."}
 
-def get_top_n_ml_matches(item_edital, df_candidates, n):
-    """Usa TF-IDF e Cosine Similarity para encontrar os N produtos mais similares."""
-    if df_candidates.empty or n == 0:
+def get_top_n_ml_matches(item_edital, catalog: CatalogIndex, positions, n, tfidf_index: TfidfCatalogIndex | None = None):
+    """
+    Usa TF-IDF e Cosine Similarity para encontrar os N produtos mais similares
+    entre as posições candidatas do catálogo. Com `tfidf_index`, apenas transforma
+    a consulta e pontua as linhas candidatas no índice pré-ajustado da base; sem
+    ele, ajusta um vectorizer só para os candidatos. Só as N linhas vencedoras
+    são materializadas.
+    """
+    if len(positions) == 0 or n == 0:
         return pd.DataFrame()
 
     print(f" - Running ML to find top {n} matches...")
     edital_text = f"{item_edital['DESCRICAO']} {item_edital.get('REFERENCIA', '')}"
+
+    if tfidf_index is not None:
+        top_positions = tfidf_index.top_n(edital_text, positions, n)
+        print(f"   - Found {len(top_positions)} ML candidates.")
+        return catalog.rows(top_positions)
+
+    df_candidates = catalog.rows(positions)
     candidates_texts = df_candidates['DESCRICAO'].fillna('').tolist()
 
     if not candidates_texts:
@@ -305,29 +512,83 @@ def get_rainbow_color(score: float) -> PatternFill:
     else: hex_color = red
     return PatternFill(start_color=hex_color, end_color=hex_color, fill_type='solid')
 
-def process_single_item_pipeline(item_edital, df_base, price_filter_percentage, classification):
-    """Executa o pipeline de análise para um único item do edital."""
+@arte_trace.traced()
+def process_single_item_pipeline(item_edital, catalog: CatalogIndex, price_filter_percentage, classification, tfidf_index=None,
+                                 min_price_percentage=None, judged_positions: set | None = None,
+                                 retriever: HybridRetriever | None = None):
+    """
+    Executa o pipeline de análise para um único item do edital.
+
+    Com `min_price_percentage`, considera apenas a faixa de preço nova
+    (min < VALOR <= max), usada ao ampliar o filtro de preço. `judged_positions`
+    é o conjunto de produtos já avaliados pelo LLM para este item: os avaliados
+    em tentativas anteriores são ignorados e os enviados nesta são adicionados.
+    Com `retriever` (RETRIEVAL_MODE = "hibrido"), a cascata é substituída por uma
+    única lista fundida e uma única chamada LLM.
+    """
+    arte_trace.annotate(item=item_edital['Nº'], arquivo=item_edital.get('ARQUIVO'), faixa=price_filter_percentage)
     descricao = str(item_edital['DESCRICAO'])
     referencia = str(item_edital.get('REFERENCIA', 'N/A'))
     valor_unit_edital = float(str(item_edital.get('VALOR_UNIT', '0')).replace(',', '.'))
     
-    # Filtro de Preço
+    # Filtro de Preço (busca binária nas partições ordenadas por VALOR, sem cópia da base)
+    min_cost = None
     if valor_unit_edital > 0:
         max_cost = valor_unit_edital * price_filter_percentage
-        df_price_candidates = df_base[df_base['VALOR'] <= max_cost].copy()
+        if min_price_percentage is not None:
+            min_cost = valor_unit_edital * min_price_percentage
     else:
         print("- Valor de referência do edital é R$0.00 ou inválido. Analisando todos os produtos da base.")
-        df_price_candidates = df_base.copy()
+        max_cost = None
+
+    # Produtos já julgados em tentativas anteriores (fotografia no início desta tentativa;
+    # dentro dela as etapas 2 e 3 continuam podendo reavaliar candidatos da etapa 1).
+    if judged_positions is None:
+        judged_positions = set()
+    already_judged = np.fromiter(judged_positions, dtype=np.int64, count=len(judged_positions))
+
+    def unjudged(positions):
+        return positions[~np.isin(positions, already_judged)] if already_judged.size else positions
 
-    if df_price_candidates.empty:
+    def ask_ai(df_candidates, attempt_description):
+        packed = pack_candidates(df_candidates, f"{descricao} {referencia}", CANDIDATE_TOKEN_BUDGET, tfidf_index)
+        judged_positions.update(packed.frame.index.tolist())
+        return get_best_match_from_ai(item_edital, packed, attempt_description)
+
+    price_positions = unjudged(catalog.price_positions(max_cost, min_cost))
+
+    if len(price_positions) == 0:
         return "Nenhum Produto com Margem", None, None
 
+    if retriever is not None:
+        # Categoria principal como filtro (se classificada e com produtos na faixa); senão, toda a faixa de preço
+        positions = price_positions
+        main_category = (classification or {}).get('categoria_principal')
+        if main_category:
+            category_positions = unjudged(catalog.category_positions(main_category, max_cost, min_cost))
+            if len(category_positions) > 0:
+                positions = category_positions
+        print(f"\n--- RECUPERAÇÃO HÍBRIDA (BM25 + TF-IDF) em {len(positions)} produtos ---")
+        top_positions, _ = retriever.search(f"{descricao} {referencia}", positions, HYBRID_CANDIDATES)
+        if len(top_positions) == 0:
+            return "Nenhum Produto na Categoria", None, None
+        ai_result = ask_ai(catalog.rows(top_positions), f"Hybrid Top {HYBRID_CANDIDATES}")
+        best_match_data = ai_result.get("best_match")
+        closest_match_data = ai_result.get("closest_match")
+        if best_match_data:
+            print(f"   ✅ - AI recomenda: {best_match_data.get('Marca', 'N/A')} {best_match_data.get('Modelo', 'N/A')}")
+        elif closest_match_data:
+            print(f"   - 🧿 AI sugere como mais próximo: {closest_match_data.get('Marca', 'N/A')} {closest_match_data.get('Modelo', 'N/A')}")
+
+        if check_match_found(ai_result):
+            return "Match Encontrado (Híbrido)", best_match_data, None
+        return "Nenhum Match >95%", best_match_data, closest_match_data
+
     if not classification:
         print("   - ⚠️ AI classification failed. Cannot proceed with category filters.")
         # Fallback: usar ML em todos os produtos filtrados por preço
-        df_ml_candidates = get_top_n_ml_matches(item_edital, df_price_candidates, MAIN_CATEGORY_ML_CANDIDATES)
-        ai_result = get_best_match_from_ai(item_edital, df_ml_candidates, "Fallback ML on all price-filtered")
-        time.sleep(5)
+        df_ml_candidates = get_top_n_ml_matches(item_edital, catalog, price_positions, MAIN_CATEGORY_ML_CANDIDATES, tfidf_index)
+        ai_result = ask_ai(df_ml_candidates, "Fallback ML on all price-filtered")
         best_match_data = ai_result.get("best_match")
         closest_match_data = ai_result.get("closest_match")
         if best_match_data:
@@ -344,63 +605,222 @@ def process_single_item_pipeline(item_edital, df_base, price_filter_percentage,
     subcategory = classification.get('subcategoria')
     print(f"   - AI classified item as: Categoria='{main_category}', Subcategoria='{subcategory}'")
 
-    # --- Etapa 1: LLM na Subcategoria ---
-    print("\n--- ETAPA 1: LLM na Subcategoria ---")
-    df_filtered_sub = df_price_candidates[df_price_candidates['subcategoria'].str.contains(subcategory, case=False, na=False)]
-    if not df_filtered_sub.empty:
-        print(f"  - 📦 Found {len(df_filtered_sub)} candidates matching SUBCATEGORY '{subcategory}'.")
-        ai_result = get_best_match_from_ai(item_edital, df_filtered_sub, "Subcategory Filter")
-        time.sleep(5)
-        best_match_data = ai_result.get("best_match")
-        closest_match_data = ai_result.get("closest_match")
-        if best_match_data:
-            print(f"   ✅ - AI recomenda: {best_match_data.get('Marca', 'N/A')} {best_match_data.get('Modelo', 'N/A')}")
-        elif closest_match_data:
-            print(f"   - 🧿 AI sugere como mais próximo: {closest_match_data.get('Marca', 'N/A')} {closest_match_data.get('Modelo', 'N/A')}")
+    sub_positions = unjudged(catalog.subcategory_positions(subcategory, max_cost, contains=True, min_cost=min_cost))
+    main_positions = unjudged(catalog.category_positions(main_category, max_cost, min_cost))
+
+    # Os candidatos de cada etapa não dependem das anteriores: com SPECULATIVE_CASCADE,
+    # as etapas 2 e 3 são preparadas (e, opcionalmente, julgadas) em paralelo com a 1.
+    stages = [
+        CascadeStage(
+            "ETAPA 1: LLM na Subcategoria", "Subcategory Filter", "Match Encontrado (Subcategoria)",
+            lambda: catalog.rows(sub_positions) if len(sub_positions) > 0 else None,
+            note=(f"  - 📦 Found {len(sub_positions)} candidates matching SUBCATEGORY '{subcategory}'." if len(sub_positions) > 0
+                  else f"  - ⚠️ No candidates found for subcategory '{subcategory}'."),
+        ),
+        CascadeStage(
+            "ETAPA 2: ML na Subcategoria + LLM", f"ML Top {SUBCATEGORY_ML_CANDIDATES} in Subcategory",
+            "Match Encontrado (ML na Subcategoria)",
+            lambda: (get_top_n_ml_matches(item_edital, catalog, sub_positions, SUBCATEGORY_ML_CANDIDATES, tfidf_index)
+                     if len(sub_positions) > 0 else None),
+        ),
+        CascadeStage(
+            "ETAPA 3: ML na Categoria Principal + LLM", f"ML Top {MAIN_CATEGORY_ML_CANDIDATES} in Main Category",
+            "Match Encontrado (ML na Categoria Principal)",
+            lambda: (get_top_n_ml_matches(item_edital, catalog, main_positions, MAIN_CATEGORY_ML_CANDIDATES, tfidf_index)
+                     if len(main_positions) > 0 else None),
+            note=f"  - 📦 Found {len(main_positions)} candidates matching MAIN CATEGORY '{main_category}'." if len(main_positions) > 0 else None,
+        ),
+    ]
 
-        if check_match_found(ai_result):
-            return "Match Encontrado (Subcategoria)", ai_result.get("best_match"), None
-    else:
-        print(f"  - ⚠️ No candidates found for subcategory '{subcategory}'.")
-
-    # --- Etapa 2: ML na Subcategoria + LLM ---
-    print("\n--- ETAPA 2: ML na Subcategoria + LLM ---")
-    if not df_filtered_sub.empty:
-        df_ml_sub_candidates = get_top_n_ml_matches(item_edital, df_filtered_sub, SUBCATEGORY_ML_CANDIDATES)
-        ai_result = get_best_match_from_ai(item_edital, df_ml_sub_candidates, f"ML Top {SUBCATEGORY_ML_CANDIDATES} in Subcategory")
-        time.sleep(5)
-        best_match_data = ai_result.get("best_match")
-        closest_match_data = ai_result.get("closest_match")
-        if best_match_data:
-            print(f"   ✅ - AI recomenda: {best_match_data.get('Marca', 'N/A')} {best_match_data.get('Modelo', 'N/A')}")
-        elif closest_match_data:
-            print(f"   - 🧿 AI sugere como mais próximo: {closest_match_data.get('Marca', 'N/A')} {closest_match_data.get('Modelo', 'N/A')}")
+    def prepare(stage):
+        df_candidates = stage.candidates()
+        if df_candidates is None:
+            return None
+        return pack_candidates(df_candidates, f"{descricao} {referencia}", CANDIDATE_TOKEN_BUDGET, tfidf_index)
+
+    def judge(stage, packed):
+        return get_best_match_from_ai(item_edital, packed, stage.attempt)
+
+    with closing(CASCADE.run(stages, prepare, judge)) as outcomes:
+        for stage, packed, ai_result in outcomes:
+            print(f"\n--- {stage.name} ---")
+            if stage.note:
+                print(stage.note)
+            if packed is None:
+                continue
+            # Só os candidatos de etapas consumidas contam como julgados (as descartadas não)
+            judged_positions.update(packed.frame.index.tolist())
+            best_match_data = ai_result.get("best_match")
+            closest_match_data = ai_result.get("closest_match")
+            if best_match_data:
+                print(f"   ✅ - AI recomenda: {best_match_data.get('Marca', 'N/A')} {best_match_data.get('Modelo', 'N/A')}")
+            elif closest_match_data:
+                print(f"   - 🧿 AI sugere como mais próximo: {closest_match_data.get('Marca', 'N/A')} {closest_match_data.get('Modelo', 'N/A')}")
+
+            if check_match_found(ai_result):
+                return stage.status, ai_result.get("best_match"), None
+            if stage is stages[-1]:
+                # Se chegamos até aqui, este é o nosso melhor palpite
+                return "Nenhum Match >95%", ai_result.get("best_match"), ai_result.get("closest_match")
 
-        if check_match_found(ai_result):
-            return f"Match Encontrado (ML na Subcategoria)", ai_result.get("best_match"), None
-
-    # --- Etapa 3: ML na Categoria Principal + LLM ---
-    print("\n--- ETAPA 3: ML na Categoria Principal + LLM ---")
-    df_filtered_main = df_price_candidates[df_price_candidates['categoria_principal'] == main_category]
-    if not df_filtered_main.empty:
-        print(f"  - 📦 Found {len(df_filtered_main)} candidates matching MAIN CATEGORY '{main_category}'.")
-        df_ml_main_candidates = get_top_n_ml_matches(item_edital, df_filtered_main, MAIN_CATEGORY_ML_CANDIDATES)
-        ai_result = get_best_match_from_ai(item_edital, df_ml_main_candidates, f"ML Top {MAIN_CATEGORY_ML_CANDIDATES} in Main Category")
-        time.sleep(5)
-        best_match_data = ai_result.get("best_match")
-        closest_match_data = ai_result.get("closest_match")
-        if best_match_data:
-            print(f"   ✅ - AI recomenda: {best_match_data.get('Marca', 'N/A')} {best_match_data.get('Modelo', 'N/A')}")
-        elif closest_match_data:
-            print(f"   - 🧿 AI sugere como mais próximo: {closest_match_data.get('Marca', 'N/A')} {closest_match_data.get('Modelo', 'N/A')}")
+    return "Nenhum Produto na Categoria", None, None
 
-        if check_match_found(ai_result):
-            return f"Match Encontrado (ML na Categoria Principal)", ai_result.get("best_match"), None
-        else:
-            # Se chegamos até aqui, este é o nosso melhor palpite
-            return "Nenhum Match >95%", ai_result.get("best_match"), ai_result.get("closest_match")
+# ============================================================
+# PROCESSAMENTO DE ITEM E SALVAMENTO
+# ============================================================
 
-    return "Nenhum Produto na Categoria", None, None
+OUTPUT_COLUMNS = [
+    'ARQUIVO','Nº','DESCRICAO_EDITAL','REFERENCIA','STATUS',
+    'UNID_FORN', 'QTDE', 'VALOR_UNIT_EDITAL', 'VALOR_TOTAL',
+    'LOCAL_ENTREGA', 'INTERVALO_LANCES',
+    'MARCA_SUGERIDA', 'MODELO_SUGERIDO', 'CUSTO_FORNECEDOR',
+    'PRECO_FINAL_VENDA','MARGEM_LUCRO_VALOR', 'LUCRO_TOTAL', 'MOTIVO_INCOMPATIBILIDADE',
+    'DESCRICAO_FORNECEDOR','ANALISE_COMPATIBILIDADE','COMPATIBILITY_SCORE','TENTATIVA_ORIGEM','LAST_UPDATE'
+]
+
+def match_score(match_data: dict | None) -> float:
+    """Score de compatibilidade de um best_match/closest_match retornado pela IA (-1 se ausente)."""
+    if not match_data:
+        return -1.0
+    return calculate_compatibility_score(match_data.get('Compatibilidade_analise'))
+
+def match_item(item_edital, catalog, tfidf_index, classification, retriever=None) -> tuple:
+    """
+    Executa as tentativas de preço para um item já classificado.
+    Retorna (status, best_match, closest_match, tentativa_origem, chamadas_llm).
+    """
+    calls_before = llm_calls_in_thread()
+    # Produtos já avaliados pelo LLM para este item, compartilhados entre as tentativas
+    judged_positions = set()
+
+    # --- ETAPA PADRÃO ---
+    print(f"\n===== [Item {item_edital['Nº']}] TENTATIVA 1: Filtro de Preço Padrão (60%) =====")
+    status, best_match_data, closest_match_data = process_single_item_pipeline(
+        item_edital, catalog, INITIAL_PRICE_FILTER_PERCENTAGE, classification, tfidf_index,
+        judged_positions=judged_positions, retriever=retriever
+    )
+    tentativa_origem = f"TENTATIVA 1 (<= {INITIAL_PRICE_FILTER_PERCENTAGE:.0%})"
+
+    # --- ETAPA 4: Aumentar filtro de preço e avaliar apenas a faixa nova (60% -> 75%) ---
+    if "Match Encontrado" not in status:
+        print(f"\n===== [Item {item_edital['Nº']}] TENTATIVA 2: Filtro de Preço Expandido (60% -> 75%) =====")
+        logger.warning(f"Item {item_edital['Nº']} não encontrou match. Avaliando a faixa de preço expandida.")
+        status_exp, best_match_data_exp, closest_match_data_exp = process_single_item_pipeline(
+            item_edital, catalog, EXPANDED_PRICE_FILTER_PERCENTAGE, classification, tfidf_index,
+            min_price_percentage=INITIAL_PRICE_FILTER_PERCENTAGE, judged_positions=judged_positions,
+            retriever=retriever
+        )
+        # Prioriza o resultado da faixa expandida se encontrar um match
+        if "Match Encontrado" in status_exp:
+            status, best_match_data, closest_match_data = status_exp, best_match_data_exp, closest_match_data_exp
+            tentativa_origem = f"TENTATIVA 2 ({INITIAL_PRICE_FILTER_PERCENTAGE:.0%} - {EXPANDED_PRICE_FILTER_PERCENTAGE:.0%})"
+        # Sem match em nenhuma faixa: mantém a sugestão mais compatível (empate fica com a tentativa 1, mais barata)
+        elif match_score(closest_match_data_exp) > match_score(closest_match_data):
+            status, best_match_data, closest_match_data = status_exp, best_match_data_exp, closest_match_data_exp
+            tentativa_origem = f"TENTATIVA 2 ({INITIAL_PRICE_FILTER_PERCENTAGE:.0%} - {EXPANDED_PRICE_FILTER_PERCENTAGE:.0%})"
+
+    return status, best_match_data, closest_match_data, tentativa_origem, llm_calls_in_thread() - calls_before
+
+def build_result_row(item_edital, status, best_match_data, closest_match_data, tentativa_origem) -> dict:
+    """Monta a linha de resultado de um item do edital a partir do resultado do matching."""
+    # Determina os dados finais para popular a linha
+    data_to_populate = best_match_data if best_match_data else closest_match_data
+    reasoning = None
+    if not best_match_data and closest_match_data:
+        status = "Match Parcial (Sugestão)"
+        # O reasoning já vem da chamada da API
+
+    result_row = {
+        'ARQUIVO': item_edital['ARQUIVO'],
+        'Nº': item_edital['Nº'],
+        'DESCRICAO_EDITAL': item_edital['DESCRICAO'],
+        'REFERENCIA': item_edital.get('REFERENCIA'),
+        'UNID_FORN': item_edital.get('UNID_FORN'),
+        'QTDE': item_edital.get('QTDE'),
+        'VALOR_TOTAL': item_edital.get('VALOR_TOTAL'),
+        'LOCAL_ENTREGA': item_edital.get('LOCAL_ENTREGA'),
+        'INTERVALO_LANCES': item_edital.get('INTERVALO_LANCES'),
+        'VALOR_UNIT_EDITAL': item_edital['VALOR_UNIT'],
+        'STATUS': status,
+        'MOTIVO_INCOMPATIBILIDADE': reasoning,
+        'TENTATIVA_ORIGEM': tentativa_origem,
+        'LAST_UPDATE': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    if data_to_populate:
+        cost_price = float(data_to_populate.get('Valor') or 0)
+        final_price = cost_price * (1 + PROFIT_MARGIN)
+        margem_lucro_valor = final_price - cost_price
+        qtde = 0
+        qtde_val = item_edital.get('QTDE')
+        if pd.notna(qtde_val):
+            try:
+                qtde = int(float(qtde_val))
+            except (ValueError, TypeError):
+                qtde = 0
+        lucro_total = margem_lucro_valor * qtde
+
+        analise_compat_obj = data_to_populate.get('Compatibilidade_analise')
+        compat_score = calculate_compatibility_score(analise_compat_obj)
+
+        # Gera uma descrição textual informativa a partir do objeto de análise
+        analise_compat_text = ""
+        if isinstance(analise_compat_obj, dict):
+            justificativa = analise_compat_obj.get('justificativa', 'Análise não fornecida.')
+            positivos = analise_compat_obj.get('pontos_positivos', [])
+            negativos = analise_compat_obj.get('pontos_negativos', [])
+            
+            texto_prós = "Prós: " + "; ".join(positivos) if positivos else ""
+            texto_contras = "Contras: " + "; ".join(negativos) if negativos else ""
+            
+            analise_compat_text = f"Justificativa: {justificativa}"
+            if texto_prós:
+                analise_compat_text += f" | {texto_prós}"
+            if texto_contras:
+                analise_compat_text += f" | {texto_contras}"
+        elif analise_compat_obj: # Fallback para o formato antigo de string
+            analise_compat_text = str(analise_compat_obj)
+
+        result_row.update({
+            'MARCA_SUGERIDA': data_to_populate.get('Marca'),
+            'MODELO_SUGERIDO': data_to_populate.get('Modelo'),
+            'CUSTO_FORNECEDOR': cost_price,
+            'PRECO_FINAL_VENDA': final_price,
+            'MARGEM_LUCRO_VALOR': margem_lucro_valor,
+            'LUCRO_TOTAL': lucro_total,
+            'DESCRICAO_FORNECEDOR': data_to_populate.get('Descricao_fornecedor'),
+            'ANALISE_COMPATIBILIDADE': analise_compat_text, # Usa o novo texto formatado
+            'COMPATIBILITY_SCORE': compat_score
+        })
+
+    return result_row
+
+@arte_trace.traced('excel')
+def save_results_excel(df_existing: pd.DataFrame, new_rows: list[dict]):
+    """Salva o histórico existente seguido dos novos resultados, colorindo as linhas pelo score."""
+    df_final = pd.concat([df_existing, pd.DataFrame(new_rows)], ignore_index=True).reindex(columns=OUTPUT_COLUMNS)
+
+    output_dir = os.path.dirname(CAMINHO_SAIDA)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    try:
+        writer = pd.ExcelWriter(CAMINHO_SAIDA, engine='openpyxl')
+        df_final.to_excel(writer, index=False, sheet_name='Proposta')
+
+        workbook = writer.book
+        worksheet = writer.sheets['Proposta']
+
+        for row_idx in range(2, len(df_final) + 2):
+            score = df_final.at[row_idx - 2, 'COMPATIBILITY_SCORE']
+            color_fill = get_rainbow_color(score)
+            for col_idx in range(1, len(OUTPUT_COLUMNS) + 1):
+                worksheet.cell(row=row_idx, column=col_idx).fill = color_fill
+
+        writer.close()
+    except Exception as e:
+        logger.error(f"Failed to save Excel file: {e}")
+        print(f"❌ - Failed to save Excel file: {e}")
 
 # ============================================================
 # MAIN
@@ -412,14 +832,19 @@ def main():
 
     load_dotenv()
     api_key = os.getenv("GOOGLE_API_PAGO")
-    if not api_key:
+    if not api_key and llm_mode() != "replay":
         logger.error("GOOGLE_API_KEY not found in .env file.")
         return
-    genai.configure(api_key=api_key)
+    if api_key:
+        genai.configure(api_key=api_key)
+    # Gravação/reprodução (arte_llm_replay): acertos do cache não chegariam ao arquivo nem passariam pela latência/429 simulados
+    if llm_mode() == "live":
+        LLM_CLIENT.cache = ResponseCache(LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_DAYS * 86400, max_bytes=LLM_CACHE_MAX_MB * 2**20)
+    arte_trace.start_run("arte_heavy", TRACE_DIR)
 
     try:
         df_edital = pd.read_excel(CAMINHO_EDITAL)
-        df_base = pd.read_excel(CAMINHO_BASE)
+        df_base = pd.read_excel(CAMINHO_BASE).reset_index(drop=True)
         df_base['VALOR'] = pd.to_numeric(df_base['VALOR'], errors='coerce').fillna(0)
         logger.info(f"Loaded {len(df_edital)} items from edital and {len(df_base)} products from base.")
         print(f"👾 Edital loaded: {len(df_edital)} items.")
@@ -428,173 +853,103 @@ def main():
         logger.error(f"Could not load data files. Details: {e}")
         return
 
-    if os.path.exists(CAMINHO_HEAVY_EXISTENTE):
-        logger.info(f"Loading existing processed data from {os.path.basename(CAMINHO_HEAVY_EXISTENTE)}")
-        df_existing = pd.read_excel(CAMINHO_HEAVY_EXISTENTE)
-        # Garantir consistência na chave de verificação, tratando 'Nº' como inteiro antes de string
-        df_existing['ARQUIVO_str'] = df_existing['ARQUIVO'].astype(str).str.strip()
-        df_existing['N_int_str'] = pd.to_numeric(df_existing['Nº'], errors='coerce').fillna(0).astype(int).astype(str)
-        existing_keys = set(zip(df_existing['ARQUIVO_str'], df_existing['N_int_str']))
-    else:
-        df_existing = pd.DataFrame()
-        existing_keys = set()
-
-    # Criar chaves consistentes para o DataFrame do edital também
-    df_edital['ARQUIVO_str'] = df_edital['ARQUIVO'].astype(str).str.strip()
-    df_edital['N_int_str'] = pd.to_numeric(df_edital['Nº'], errors='coerce').fillna(0).astype(int).astype(str)
-
-    # Filtrar itens novos usando as chaves normalizadas
-    df_edital_new = df_edital[~df_edital.apply(lambda row: (row['ARQUIVO_str'], row['N_int_str']) in existing_keys, axis=1)].copy()
-
-    if df_edital_new.empty:
-        logger.info("No new items to process. Output file is up to date.")
-        print("\n✅ No new items to process. The output file is already up to date.")
-        return
-
-    logger.info(f"Identified {len(df_edital_new)} new items to process.")
-    print(f"   - Found {len(df_edital_new)} new items to process.")
-    total_new_items = len(df_edital_new)
-
-    for idx, item_edital in df_edital_new.iterrows():
-        item_index_in_df = df_edital_new.index.get_loc(idx)
-        print(f"\n📈 Processing new item {item_index_in_df + 1}/{total_new_items}: {str(item_edital['DESCRICAO'])[:60]}...")
-
-        # --- ETAPA DE CLASSIFICAÇÃO (FEITA APENAS UMA VEZ) ---
-        classification = get_item_classification(
-            str(item_edital['DESCRICAO']),
-            str(item_edital.get('REFERENCIA', 'N/A')),
-            CATEGORIZATION_KEYWORDS
-        )
-        time.sleep(5)
-
-        # --- ETAPA PADRÃO ---
-        print("\n===== TENTATIVA 1: Filtro de Preço Padrão (60%) =====")
-        status, best_match_data, closest_match_data = process_single_item_pipeline(
-            item_edital, df_base, INITIAL_PRICE_FILTER_PERCENTAGE, classification
+    # Vetoriza a base uma única vez (ou carrega do cache, se a base não mudou)
+    tfidf_index = TfidfCatalogIndex.load_or_build(df_base, TFIDF_INDEX_DIR)
+    # Partições por categoria/subcategoria ordenadas por preço, montadas uma única vez
+    catalog = CatalogIndex(df_base)
+    # Modo híbrido: índice invertido BM25 (também em cache por conteúdo) fundido com o TF-IDF
+    retriever = None
+    if RETRIEVAL_MODE == "hibrido":
+        retriever = HybridRetriever(BM25CatalogIndex.load_or_build(df_base, BM25_INDEX_DIR), tfidf_index)
+        logger.info("Recuperação híbrida (BM25 + TF-IDF, RRF) ativada: uma chamada LLM por faixa de preço.")
+
+    # Resultados já processados vêm do banco local (o .xlsx antigo é importado só na primeira vez)
+    store = ResultStore(CAMINHO_RESULT_STORE)
+    try:
+        store.import_excel_once(CAMINHO_HEAVY_EXISTENTE)
+        existing_keys = store.keys()
+        df_existing = store.to_dataframe(OUTPUT_COLUMNS)
+        logger.info(f"Loaded {len(existing_keys)} processed items from {os.path.basename(CAMINHO_RESULT_STORE)}")
+
+        # Filtrar itens novos usando as chaves normalizadas (ARQUIVO, Nº inteiro)
+        is_new = [result_key(arquivo, numero) not in existing_keys for arquivo, numero in zip(df_edital['ARQUIVO'], df_edital['Nº'])]
+        df_edital_new = df_edital[is_new].copy()
+
+        if df_edital_new.empty:
+            logger.info("No new items to process. Output file is up to date.")
+            print("\n✅ No new items to process. The output file is already up to date.")
+            return
+
+        logger.info(f"Identified {len(df_edital_new)} new items to process.")
+        print(f"   - Found {len(df_edital_new)} new items to process.")
+        total_new_items = len(df_edital_new)
+
+        # --- DEDUPLICAÇÃO: itens idênticos (descrição, referência e faixa de preço) são processados uma vez ---
+        groups = group_items(df_edital_new)
+        representatives = groups.representatives
+        logger.info(groups.report())
+        print(f"   - {groups.report()}")
+
+        # --- ETAPA DE CLASSIFICAÇÃO (CACHE + LOTES, ANTES DO PROCESSAMENTO PARALELO) ---
+        classifications = classify_items(df_edital_new.iloc[representatives], CATEGORIZATION_KEYWORDS)
+
+        # Grupos rodam em paralelo; o ritmo das chamadas é controlado pelo RATE_LIMITER (RPM/TPM por modelo,
+        # compartilhado com outros scripts rodando ao mesmo tempo).
+        # Os resultados são guardados pela posição no edital para manter a ordem de saída estável.
+        results_by_position = {}
+        llm_calls_by_rep = {}
+        # A planilha é exportada do histórico + resultados desta execução, na ordem original do edital
+        exporter = DebouncedExport(
+            lambda: save_results_excel(df_existing, [results_by_position[p] for p in sorted(results_by_position)]),
+            EXCEL_EXPORT_INTERVAL_SECONDS
         )
-
-        # --- ETAPA 4: Aumentar filtro de preço e repetir ---
-        if "Match Encontrado" not in status:
-            print("\n===== TENTATIVA 2: Filtro de Preço Expandido (75%) =====")
-            logger.warning(f"Item {item_edital['Nº']} não encontrou match. Tentando com filtro de preço expandido.")
-            status_exp, best_match_data_exp, closest_match_data_exp = process_single_item_pipeline(
-                item_edital, df_base, EXPANDED_PRICE_FILTER_PERCENTAGE, classification
-            )
-            # Prioriza o resultado da tentativa expandida se encontrar um match
-            if "Match Encontrado" in status_exp:
-                status, best_match_data, closest_match_data = status_exp, best_match_data_exp, closest_match_data_exp
-            # Se a tentativa expandida também não achou, mas tem uma sugestão melhor, usa ela
-            elif closest_match_data_exp and not closest_match_data:
-                 status, best_match_data, closest_match_data = status_exp, best_match_data_exp, closest_match_data_exp
-
-        # Determina os dados finais para popular a linha
-        data_to_populate = best_match_data if best_match_data else closest_match_data
-        reasoning = None
-        if not best_match_data and closest_match_data:
-            status = "Match Parcial (Sugestão)"
-            # O reasoning já vem da chamada da API
-
-        result_row = {
-            'ARQUIVO': item_edital['ARQUIVO'],
-            'Nº': item_edital['Nº'],
-            'DESCRICAO_EDITAL': item_edital['DESCRICAO'],
-            'REFERENCIA': item_edital.get('REFERENCIA'),
-            'UNID_FORN': item_edital.get('UNID_FORN'),
-            'QTDE': item_edital.get('QTDE'),
-            'VALOR_TOTAL': item_edital.get('VALOR_TOTAL'),
-            'LOCAL_ENTREGA': item_edital.get('LOCAL_ENTREGA'),
-            'INTERVALO_LANCES': item_edital.get('INTERVALO_LANCES'),
-            'VALOR_UNIT_EDITAL': item_edital['VALOR_UNIT'],
-            'STATUS': status,
-            'MOTIVO_INCOMPATIBILIDADE': reasoning,
-            'LAST_UPDATE': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-
-        if data_to_populate:
-            cost_price = float(data_to_populate.get('Valor') or 0)
-            final_price = cost_price * (1 + PROFIT_MARGIN)
-            margem_lucro_valor = final_price - cost_price
-            qtde = 0
-            qtde_val = item_edital.get('QTDE')
-            if pd.notna(qtde_val):
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_ITEMS) as executor:
+            future_to_rep = {
+                executor.submit(match_item, df_edital_new.iloc[rep], catalog, tfidf_index, classifications[i], retriever): rep
+                for i, rep in enumerate(representatives)
+            }
+
+            for future in as_completed(future_to_rep):
+                rep = future_to_rep[future]
+                item_edital = df_edital_new.iloc[rep]
                 try:
-                    qtde = int(float(qtde_val))
-                except (ValueError, TypeError):
-                    qtde = 0
-            lucro_total = margem_lucro_valor * qtde
-
-            analise_compat_obj = data_to_populate.get('Compatibilidade_analise')
-            compat_score = calculate_compatibility_score(analise_compat_obj)
-
-            # Gera uma descrição textual informativa a partir do objeto de análise
-            analise_compat_text = ""
-            if isinstance(analise_compat_obj, dict):
-                justificativa = analise_compat_obj.get('justificativa', 'Análise não fornecida.')
-                positivos = analise_compat_obj.get('pontos_positivos', [])
-                negativos = analise_compat_obj.get('pontos_negativos', [])
-                
-                texto_prós = "Prós: " + "; ".join(positivos) if positivos else ""
-                texto_contras = "Contras: " + "; ".join(negativos) if negativos else ""
-                
-                analise_compat_text = f"Justificativa: {justificativa}"
-                if texto_prós:
-                    analise_compat_text += f" | {texto_prós}"
-                if texto_contras:
-                    analise_compat_text += f" | {texto_contras}"
-            elif analise_compat_obj: # Fallback para o formato antigo de string
-                analise_compat_text = str(analise_compat_obj)
-
-            result_row.update({
-                'MARCA_SUGERIDA': data_to_populate.get('Marca'),
-                'MODELO_SUGERIDO': data_to_populate.get('Modelo'),
-                'CUSTO_FORNECEDOR': cost_price,
-                'PRECO_FINAL_VENDA': final_price,
-                'MARGEM_LUCRO_VALOR': margem_lucro_valor,
-                'LUCRO_TOTAL': lucro_total,
-                'DESCRICAO_FORNECEDOR': data_to_populate.get('Descricao_fornecedor'),
-                'ANALISE_COMPATIBILIDADE': analise_compat_text, # Usa o novo texto formatado
-                'COMPATIBILITY_SCORE': compat_score
-            })
-
-        df_existing = pd.concat([df_existing, pd.DataFrame([result_row])], ignore_index=True)
-
-        # Save incrementally
-        output_columns = [
-            'ARQUIVO','Nº','DESCRICAO_EDITAL','REFERENCIA','STATUS',
-            'UNID_FORN', 'QTDE', 'VALOR_UNIT_EDITAL', 'VALOR_TOTAL',
-            'LOCAL_ENTREGA', 'INTERVALO_LANCES',
-            'MARCA_SUGERIDA', 'MODELO_SUGERIDO', 'CUSTO_FORNECEDOR',
-            'PRECO_FINAL_VENDA','MARGEM_LUCRO_VALOR', 'LUCRO_TOTAL', 'MOTIVO_INCOMPATIBILIDADE',
-            'DESCRICAO_FORNECEDOR','ANALISE_COMPATIBILIDADE','COMPATIBILITY_SCORE','LAST_UPDATE'
-        ]
-        df_final = df_existing.reindex(columns=output_columns)
-
-        output_dir = os.path.dirname(CAMINHO_SAIDA)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        try:
-            writer = pd.ExcelWriter(CAMINHO_SAIDA, engine='openpyxl')
-            df_final.to_excel(writer, index=False, sheet_name='Proposta')
-
-            workbook = writer.book
-            worksheet = writer.sheets['Proposta']
-
-            for row_idx in range(2, len(df_final) + 2):
-                score = df_final.at[row_idx - 2, 'COMPATIBILITY_SCORE']
-                color_fill = get_rainbow_color(score)
-                for col_idx in range(1, len(output_columns) + 1):
-                    worksheet.cell(row=row_idx, column=col_idx).fill = color_fill
-
-            writer.close()
-            logger.info(f"Incremental save after processing item {item_index_in_df + 1}/{total_new_items}")
-            print(f"Incremental save completed for item {item_index_in_df + 1}/{total_new_items}.")
-        except Exception as e:
-            logger.error(f"Failed to save Excel file: {e}")
-            print(f"❌ - Failed to save Excel file: {e}")
-
-    logger.info("All new items processed and saved incrementally.")
-    print("✅ All new items processed and saved incrementally.")
+                    status, best_match_data, closest_match_data, tentativa_origem, llm_calls = future.result()
+                except Exception as e:
+                    # Itens com erro não são salvos, para serem reprocessados na próxima execução.
+                    logger.error(f"Erro ao processar item Nº {item_edital['Nº']} ({item_edital['ARQUIVO']}): {e}", exc_info=True)
+                    continue
+
+                # Replica o resultado do representante para todas as linhas do grupo
+                llm_calls_by_rep[rep] = llm_calls
+                group_rows = [
+                    build_result_row(df_edital_new.iloc[position], status, best_match_data, closest_match_data, tentativa_origem)
+                    for position in groups.members[rep]
+                ]
+
+                # Checkpoint do grupo no banco (uma transação), exportação da planilha com debounce
+                store.append(group_rows)
+                results_by_position.update(zip(groups.members[rep], group_rows))
+                exporter.request()
+                logger.info(f"Saved item {item_edital['Nº']} ({len(results_by_position)}/{total_new_items} done)")
+                print(f"Item saved ({len(results_by_position)}/{total_new_items}).")
+
+        exporter.flush()
+        logger.info(groups.report(llm_calls_by_rep))
+        print(f"📊 {groups.report(llm_calls_by_rep)}")
+        CASCADE.shutdown()
+        logger.info(CASCADE.report())
+        print(f"⏱️ {CASCADE.report()}")
+        logger.info(LLM_CLIENT.health_report())
+        logger.info("All new items processed and saved incrementally.")
+        print("✅ All new items processed and saved incrementally.")
+    finally:
+        # Também no retorno antecipado (nada novo) e em caso de erro: banco, cache de respostas e trace fechados
+        store.close()
+        if LLM_CLIENT.cache is not None:
+            logger.info(LLM_CLIENT.cache.report())
+            print(LLM_CLIENT.cache.report())
+            LLM_CLIENT.cache.close()
+        print(arte_trace.finish_run())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
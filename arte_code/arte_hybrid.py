@@ -0,0 +1,211 @@
+"""
+RECUPERAÇÃO HÍBRIDA (BM25 + VETORES) COM FUSÃO POR POSTO
+========================================================
+
+Alternativa à cascata de etapas (subcategoria -> ML na subcategoria -> ML na
+categoria): uma única lista de candidatos por item, montada sobre o catálogo
+inteiro e julgada por uma única chamada LLM.
+
+- `BM25CatalogIndex`: índice invertido (termo -> produtos) sobre DESCRICAO,
+  MARCA e MODELO, com os pesos BM25 pré-calculados em uma matriz esparsa
+  termos x produtos. Uma consulta só soma as listas de postagem dos seus
+  termos, então o custo não depende do tamanho da base. Persistido em disco e
+  identificado pelo hash do conteúdo, como o `arte_tfidf`.
+- `HybridRetriever`: combina o BM25 com os rankings vetoriais disponíveis
+  (cosseno TF-IDF do `arte_tfidf` e/ou embeddings via `arte_ann`) por
+  reciprocal-rank fusion (RRF): score = soma de 1 / (RRF_K + posto).
+
+Os filtros de preço e categoria ficam com o chamador: `search` recebe as
+posições permitidas (saída do `CatalogIndex`), o mesmo contrato de posições de
+linha (0..N-1) dos demais índices. `recall_at_k` mede a fração de itens cujo
+produto aceito historicamente aparece entre os k primeiros.
+"""
+
+import os
+import re
+import glob
+import json
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from arte_dedup import normalize_text
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_PREFIX = "bm25_"
+TEXT_COLUMNS = ['DESCRICAO', 'MARCA', 'MODELO']
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Constante da fusão: postos altos de uma só fonte não dominam a lista
+RRF_DEPTH = 100  # Postos considerados de cada fonte antes da fusão
+
+
+def tokenize(texto) -> list[str]:
+    """Termos em minúsculas e sem acentos; números e códigos de modelo ficam inteiros (ex.: 'xm8500')."""
+    return re.findall(r'[a-z0-9]+(?:[-/.][a-z0-9]+)*', normalize_text(texto))
+
+
+def catalog_text(df_base: pd.DataFrame) -> list[str]:
+    colunas = [c for c in TEXT_COLUMNS if c in df_base.columns]
+    return df_base[colunas].fillna('').astype(str).agg(' '.join, axis=1).tolist()
+
+
+def _top_positions(scores: np.ndarray, positions: np.ndarray, depth: int) -> np.ndarray:
+    """Posições com score > 0, das maiores para as menores (empates na ordem original)."""
+    validos = np.flatnonzero(scores > 0)
+    if validos.size > depth:
+        validos = validos[np.argpartition(-scores[validos], depth - 1)[:depth]]
+    validos = validos[np.argsort(-scores[validos], kind='stable')]
+    return positions[validos]
+
+
+class BM25CatalogIndex:
+    """Índice invertido com pesos BM25 pré-calculados (linha = termo, coluna = produto)."""
+
+    def __init__(self, vocabulary: dict[str, int], postings: sp.csr_matrix, content_hash: str):
+        self.vocabulary = vocabulary
+        self.postings = postings.tocsr()
+        self.content_hash = content_hash
+
+    def __len__(self) -> int:
+        return self.postings.shape[1]
+
+    @staticmethod
+    def content_hash_of(df_base: pd.DataFrame) -> str:
+        h = hashlib.sha256()
+        for texto in catalog_text(df_base):
+            h.update(texto.encode('utf-8'))
+            h.update(b'\x1f')
+        return h.hexdigest()
+
+    @classmethod
+    def build(cls, df_base: pd.DataFrame, content_hash: str | None = None,
+              k1: float = BM25_K1, b: float = BM25_B) -> "BM25CatalogIndex":
+        content_hash = content_hash or cls.content_hash_of(df_base)
+        vocabulary: dict[str, int] = {}
+        linhas, colunas, contagens = [], [], []
+        for doc, texto in enumerate(catalog_text(df_base)):
+            termos: dict[int, int] = {}
+            for termo in tokenize(texto):
+                termo_id = vocabulary.setdefault(termo, len(vocabulary))
+                termos[termo_id] = termos.get(termo_id, 0) + 1
+            linhas.extend(termos)
+            colunas.extend([doc] * len(termos))
+            contagens.extend(termos.values())
+
+        n_docs = len(df_base)
+        tf = sp.csr_matrix((np.asarray(contagens, dtype=np.float32), (linhas, colunas)),
+                           shape=(len(vocabulary), n_docs))
+        tamanhos = np.asarray(tf.sum(axis=0), dtype=np.float32).ravel()
+        media = float(tamanhos.mean()) if n_docs else 1.0
+        df_termo = np.diff(tf.indptr).astype(np.float32)
+        idf = np.log1p((n_docs - df_termo + 0.5) / (df_termo + 0.5))
+
+        # Peso BM25 de cada par (termo, produto), guardado no lugar da contagem
+        norma = k1 * (1 - b + b * tamanhos[tf.indices] / max(media, 1e-6))
+        tf.data = np.repeat(idf, np.diff(tf.indptr)) * tf.data * (k1 + 1) / (tf.data + norma)
+        return cls(vocabulary, tf, content_hash)
+
+    @classmethod
+    def load_or_build(cls, df_base: pd.DataFrame, index_dir: str) -> "BM25CatalogIndex":
+        """Carrega o índice salvo para este conteúdo de base ou reconstrói e salva um novo."""
+        content_hash = cls.content_hash_of(df_base)
+        postings_path, vocabulary_path = cls._paths(index_dir, content_hash)
+
+        if os.path.exists(postings_path) and os.path.exists(vocabulary_path):
+            try:
+                with open(vocabulary_path, 'r', encoding='utf-8') as f:
+                    vocabulary = json.load(f)
+                index = cls(vocabulary, sp.load_npz(postings_path), content_hash)
+                if len(index) == len(df_base):
+                    logger.info(f"Índice BM25 carregado do cache ({content_hash[:12]}).")
+                    return index
+                logger.warning("Índice BM25 em cache não corresponde ao tamanho da base. Reconstruindo...")
+            except Exception as e:
+                logger.warning(f"Falha ao carregar índice BM25 em cache: {e}. Reconstruindo...")
+
+        logger.info(f"Construindo índice BM25 para {len(df_base)} produtos...")
+        index = cls.build(df_base, content_hash)
+        index.save(index_dir)
+        return index
+
+    @staticmethod
+    def _paths(index_dir: str, content_hash: str) -> tuple[str, str]:
+        stem = os.path.join(index_dir, f"{INDEX_FILE_PREFIX}{content_hash[:16]}")
+        return f"{stem}_postings.npz", f"{stem}_vocabulary.json"
+
+    def save(self, index_dir: str):
+        """Salva postagens e vocabulário, removendo índices de versões anteriores da base."""
+        os.makedirs(index_dir, exist_ok=True)
+        postings_path, vocabulary_path = self._paths(index_dir, self.content_hash)
+        for antigo in glob.glob(os.path.join(index_dir, f"{INDEX_FILE_PREFIX}*")):
+            if antigo not in (postings_path, vocabulary_path):
+                os.remove(antigo)
+        sp.save_npz(postings_path, self.postings)
+        with open(vocabulary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        logger.info(f"Índice BM25 salvo em: {index_dir}")
+
+    def score(self, query_text: str) -> np.ndarray:
+        """Score BM25 da consulta para todos os produtos (só as postagens dos termos da consulta são lidas)."""
+        termos = sorted({self.vocabulary[t] for t in tokenize(query_text) if t in self.vocabulary})
+        if not termos:
+            return np.zeros(len(self), dtype=np.float32)
+        return np.asarray(self.postings[termos].sum(axis=0)).ravel()
+
+    def top_n(self, query_text: str, positions, n: int) -> np.ndarray:
+        """As `n` posições (dentre `positions`) com maior score BM25, em ordem decrescente."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if n <= 0 or positions.size == 0:
+            return np.empty(0, dtype=np.int64)
+        return _top_positions(self.score(query_text)[positions], positions, n)
+
+
+def reciprocal_rank_fusion(rankings: list[np.ndarray], k: int, rrf_k: int = RRF_K) -> tuple[np.ndarray, np.ndarray]:
+    """Funde listas ordenadas de posições: score = soma de 1 / (rrf_k + posto). Empates ficam com a primeira lista."""
+    scores: dict[int, float] = {}
+    for ranking in rankings:
+        for posto, pos in enumerate(ranking.tolist(), start=1):
+            scores[pos] = scores.get(pos, 0.0) + 1.0 / (rrf_k + posto)
+    ordem = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+    return (np.fromiter((p for p, _ in ordem), dtype=np.int64, count=len(ordem)),
+            np.fromiter((s for _, s in ordem), dtype=np.float64, count=len(ordem)))
+
+
+class HybridRetriever:
+    """BM25 + rankings vetoriais (TF-IDF e/ou embeddings) fundidos por RRF, sobre as posições permitidas."""
+
+    def __init__(self, bm25: BM25CatalogIndex, tfidf_index=None, ann_index=None,
+                 depth: int = RRF_DEPTH, rrf_k: int = RRF_K):
+        self.bm25 = bm25
+        self.tfidf_index = tfidf_index
+        self.ann_index = ann_index
+        self.depth = depth
+        self.rrf_k = rrf_k
+
+    def rankings(self, query_text: str, positions, query_vector=None) -> dict[str, np.ndarray]:
+        """Ranking de cada fonte (até `depth` posições) dentro de `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        fontes = {"bm25": self.bm25.top_n(query_text, positions, self.depth)}
+        if self.tfidf_index is not None:
+            fontes["tfidf"] = _top_positions(self.tfidf_index.score(query_text, positions), positions, self.depth)
+        if self.ann_index is not None and query_vector is not None:
+            fontes["embeddings"], _ = self.ann_index.search_positions(query_vector, positions, self.depth)
+        return fontes
+
+    def search(self, query_text: str, positions, k: int, query_vector=None) -> tuple[np.ndarray, np.ndarray]:
+        """Retorna (posições, scores RRF) dos k melhores candidatos dentre `positions`."""
+        if k <= 0 or len(positions) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        fontes = self.rankings(query_text, positions, query_vector)
+        return reciprocal_rank_fusion(list(fontes.values()), k, self.rrf_k)
+
+
+def recall_at_k(ranked: list[np.ndarray], targets: list[int], k: int) -> float:
+    """Fração de consultas cujo alvo aparece entre as k primeiras posições do ranking."""
+    if not targets:
+        return float('nan')
+    return float(np.mean([alvo in ranking[:k].tolist() for ranking, alvo in zip(ranked, targets)]))
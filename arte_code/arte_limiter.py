@@ -0,0 +1,251 @@
+"""
+LIMITADOR DE TAXA POR MODELO (RPM / TPM / RPD)
+==============================================
+
+Token bucket por modelo, compartilhado entre as threads de um script e, com
+`ModelRateLimiter.shared`, entre scripts rodando ao mesmo tempo na mesma
+máquina com a mesma chave de API (o estado dos baldes fica em um arquivo JSON
+local por cota, protegido por um arquivo de trava criado com O_CREAT | O_EXCL, que
+funciona igual no Windows e no Linux).
+
+Cada chamada reserva 1 requisição e uma estimativa de tokens antes de ir à API.
+A estimativa é corrigida pelo uso real (`report_usage`, a partir do
+usage_metadata da resposta): a diferença é debitada/devolvida ao balde e a razão
+real/estimado de cada modelo ajusta as próximas reservas. Quando a API responde
+com 429 / ResourceExhausted, o modelo entra em pausa pelo tempo indicado pela
+própria API (retry_delay) ou, na falta dele, por um backoff exponencial. A pausa
+vale para todos os processos que compartilham o estado. Com a cota diária (rpd)
+esgotada, `acquire` não espera a virada do dia: levanta `DailyQuotaExhausted`.
+O arquivo de estado só é regravado quando algo muda (consultas não o reescrevem).
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Limites padrão (nível pago 1 da API Gemini). Modelos não listados usam DEFAULT_LIMITS.
+# "rpd" (requisições por dia) é opcional.
+DEFAULT_MODEL_LIMITS = {
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000},
+    "gemini-2.5-flash": {"rpm": 1_000, "tpm": 1_000_000},
+    "gemini-2.5-flash-lite": {"rpm": 4_000, "tpm": 4_000_000},
+    "gemini-2.0-flash": {"rpm": 2_000, "tpm": 4_000_000},
+    "gemini-2.0-flash-lite": {"rpm": 4_000, "tpm": 4_000_000},
+    "gemini-1.5-flash": {"rpm": 2_000, "tpm": 4_000_000},
+}
+DEFAULT_LIMITS = {"rpm": 60, "tpm": 1_000_000}
+
+BACKOFF_INITIAL_SECONDS = 5.0
+BACKOFF_MAX_SECONDS = 120.0
+TOKEN_RATIO_ALPHA = 0.2  # Peso de cada observação na média móvel real/estimado
+TOKEN_RATIO_BOUNDS = (0.25, 8.0)
+LOCK_STALE_SECONDS = 30.0  # Trava mais velha que isso é de um processo que morreu
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa conservadora de tokens (~4 caracteres por token)."""
+    return max(1, len(text or "") // 4)
+
+
+def retry_delay_from_exception(exc: Exception) -> float | None:
+    """Extrai o tempo de espera sugerido pela API a partir da mensagem de erro 429."""
+    mensagem = str(exc)
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", mensagem)
+    if not match:
+        match = re.search(r"retry (?:in|after)\s*([\d.]+)\s*s", mensagem, re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def shared_state_path(quota_name: str, state_dir: str | None = None) -> str:
+    """
+    Arquivo de estado de uma cota. A cota é da chave de API, não do script: use o
+    nome da variável de ambiente da chave (ex.: "GOOGLE_API_PAGO").
+    """
+    nome = re.sub(r'\W+', '_', quota_name)
+    return os.path.join(state_dir or tempfile.gettempdir(), f"arte_llm_rate_{nome}.json")
+
+
+class _FileLock:
+    """Trava entre processos: o arquivo de trava existe enquanto alguém está na seção crítica."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode('ascii'))
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > LOCK_STALE_SECONDS:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.005)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class DailyQuotaExhausted(Exception):
+    """Cota diária (rpd) do modelo esgotada: ele só volta na virada do dia."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"cota diária de '{model}' esgotada (volta em {retry_after:.0f}s)")
+        self.model = model
+        self.retry_after = retry_after
+
+
+def _wait_time(level: float, capacity: float, per_minute: float, amount: float) -> float:
+    missing = min(amount, capacity) - level
+    return 0.0 if missing <= 0 else missing / (per_minute / 60.0)
+
+
+class ModelRateLimiter:
+    """Orçamento de requisições e tokens por modelo, seguro para threads (e processos, com `state_path`)."""
+
+    def __init__(self, limits: dict[str, dict] | None = None, state_path: str | None = None):
+        self.limits = {**DEFAULT_MODEL_LIMITS, **(limits or {})}
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._state: dict[str, dict] = {}
+
+    @classmethod
+    def shared(cls, quota_name: str, limits: dict[str, dict] | None = None,
+               state_dir: str | None = None) -> "ModelRateLimiter":
+        """Limitador cujo estado é compartilhado por todos os scripts que usam a mesma cota."""
+        if os.getenv("ARTE_LLM_MODE", "live").strip().lower() == "replay":
+            # Reprodução offline (arte_llm_replay) não pode consumir o orçamento das execuções reais
+            quota_name = f"{quota_name}_replay"
+        return cls(limits, state_path=shared_state_path(quota_name, state_dir))
+
+    # --- Estado ---
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """
+        Estado de todos os modelos, lido (e, com `write`, gravado) atomicamente sob as
+        travas. Sem `write`, o arquivo compartilhado não é regravado.
+        """
+        with self._lock:
+            if self.state_path is None:
+                yield self._state
+                return
+            with _FileLock(f"{self.state_path}.lock"):
+                try:
+                    with open(self.state_path, 'r', encoding='utf-8') as f:
+                        state = json.load(f)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    state = {}
+                yield state
+                if not write:
+                    return
+                temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+                os.replace(temp_path, self.state_path)
+
+    def _model(self, state: dict, model: str, now: float) -> dict:
+        """Estado do modelo com os baldes reabastecidos até `now`."""
+        limite = self.limits.get(model, DEFAULT_LIMITS)
+        m = state.setdefault(model, {
+            "requests": float(limite["rpm"]), "tokens": float(limite["tpm"]), "updated": now,
+            "cooldown_until": 0.0, "backoff": 0.0, "token_ratio": 1.0, "day": "", "day_requests": 0,
+        })
+        elapsed = max(0.0, now - m["updated"])
+        m["requests"] = min(float(limite["rpm"]), m["requests"] + elapsed * limite["rpm"] / 60.0)
+        m["tokens"] = min(float(limite["tpm"]), m["tokens"] + elapsed * limite["tpm"] / 60.0)
+        m["updated"] = now
+        hoje = date.today().isoformat()
+        if m["day"] != hoje:
+            m["day"], m["day_requests"] = hoje, 0
+        return m
+
+    # --- API ---
+
+    def acquire(self, model: str, tokens: int = 0) -> int:
+        """
+        Bloqueia até haver orçamento de 1 requisição e `tokens` tokens (corrigidos pela
+        razão real/estimado do modelo). Retorna os tokens reservados. Com a cota diária
+        esgotada, levanta `DailyQuotaExhausted` em vez de esperar.
+        """
+        limite = self.limits.get(model, DEFAULT_LIMITS)
+        escrever = True  # Enquanto espera, só lê o estado; grava quando há orçamento para reservar
+        while True:
+            with self._transaction(write=escrever) as state:
+                now = time.time()
+                m = self._model(state, model, now)
+                esgotado = "rpd" in limite and m["day_requests"] >= limite["rpd"]
+                if esgotado:
+                    # Cota diária esgotada: o modelo fica em pausa até a virada do dia
+                    amanha = time.mktime(date.fromordinal(date.today().toordinal() + 1).timetuple())
+                    m["cooldown_until"] = max(m["cooldown_until"], amanha)
+                else:
+                    reservados = int(tokens * m["token_ratio"])
+                    wait = max(
+                        m["cooldown_until"] - now,
+                        _wait_time(m["requests"], limite["rpm"], limite["rpm"], 1),
+                        _wait_time(m["tokens"], limite["tpm"], limite["tpm"], reservados),
+                    )
+                    if wait <= 0 and escrever:
+                        m["requests"] -= 1
+                        m["tokens"] -= min(reservados, limite["tpm"])
+                        m["day_requests"] += 1
+                        return reservados
+            if esgotado:
+                raise DailyQuotaExhausted(model, amanha - now)
+            escrever = wait <= 0
+            if wait > 0:
+                time.sleep(min(wait, 5.0))
+
+    def report_usage(self, model: str, estimated: int, reserved: int, actual: int | None):
+        """Acerta o balde de tokens com o uso real e atualiza a razão real/estimado do modelo."""
+        if not actual or estimated <= 0:
+            return
+        with self._transaction() as state:
+            m = self._model(state, model, time.time())
+            m["tokens"] -= actual - reserved
+            razao = (1 - TOKEN_RATIO_ALPHA) * m["token_ratio"] + TOKEN_RATIO_ALPHA * (actual / estimated)
+            m["token_ratio"] = min(max(razao, TOKEN_RATIO_BOUNDS[0]), TOKEN_RATIO_BOUNDS[1])
+
+    def report_success(self, model: str):
+        """Zera o backoff do modelo após uma chamada bem-sucedida."""
+        with self._transaction(write=False) as state:
+            backoff = state.get(model, {}).get("backoff", 0.0)
+        if backoff:
+            with self._transaction() as state:
+                self._model(state, model, time.time())["backoff"] = 0.0
+
+    def report_exhausted(self, model: str, retry_after: float | None = None) -> float:
+        """Coloca o modelo em pausa após um 429. Retorna a duração da pausa em segundos."""
+        with self._transaction() as state:
+            now = time.time()
+            m = self._model(state, model, now)
+            if retry_after is None:
+                retry_after = min((m["backoff"] or BACKOFF_INITIAL_SECONDS / 2) * 2, BACKOFF_MAX_SECONDS)
+            m["backoff"] = retry_after
+            m["cooldown_until"] = max(m["cooldown_until"], now + retry_after)
+            # O balde de requisições é esvaziado para não disparar uma rajada ao fim da pausa.
+            m["requests"] = 0.0
+        logger.warning(f"Cota excedida para '{model}'. Pausando o modelo por {retry_after:.1f}s.")
+        return retry_after
+
+    def cooldown_remaining(self, model: str) -> float:
+        """Segundos restantes de pausa para o modelo (0 se disponível)."""
+        with self._transaction(write=False) as state:
+            return max(0.0, state.get(model, {}).get("cooldown_until", 0.0) - time.time())
@@ -0,0 +1,409 @@
+"""
+CLIENTE LLM COMPARTILHADO (FALLBACK COM SAÚDE POR MODELO)
+=========================================================
+
+Substitui as cópias de `gerar_conteudo_com_fallback` dos scripts, que
+percorriam LLM_MODELS_FALLBACK do início a cada chamada e recriavam o
+`GenerativeModel` a cada prompt.
+
+- Backends retornam (texto, `TokenUsage`): tokens de prompt, de resposta e total
+  segundo a API. O trace registra esses valores (a estimativa por caracteres só
+  entra quando a API não os informa) e o total real corrige as estimativas do `ModelRateLimiter` (RPM/TPM por modelo, compartilhado entre
+  threads e, com `ModelRateLimiter.shared`, entre scripts).
+- Handles de modelo em cache: um `GenerativeModel` por nome (GeminiBackend) ou
+  uma sessão HTTP reaproveitada (OpenRouterBackend).
+- Saúde por modelo: chamadas, erros, esgotamentos de cota e latência p50/p95.
+- Disjuntor: um modelo sem cota (429) ou com CIRCUIT_FAILURE_THRESHOLD erros
+  seguidos sai da rota até o fim do resfriamento. Depois recebe uma chamada de
+  teste; se ela falhar, volta a ser desligado na hora (meio-aberto).
+- Rota: entre os modelos saudáveis com nível de qualidade >= o da tarefa, o mais
+  rápido (p50 medido) primeiro e, sem medições, a ordem da lista. Se nenhum
+  modelo do nível estiver saudável, cai para os saudáveis de nível menor (do
+  melhor para o pior). Se todos estiverem desligados, espera o que volta primeiro;
+  se todos estiverem com a cota diária (rpd) esgotada, desiste da chamada.
+
+- Cache (opcional, `arte_llm_cache.ResponseCache`): antes de chamar a API, procura
+  a resposta do mesmo prompt de uma família de modelo que atenda o nível da
+  tarefa (ou de uma quase-duplicata, com `near_key`). Acertos não contam como
+  chamada nem consomem cota.
+
+O contador de chamadas por thread (`llm_calls_in_thread`) também mora aqui.
+Cada `generate` é um span "llm" do `arte_trace`, com um evento por tentativa
+(modelo, tokens, latência, resultado) e contadores de cache e retentativas.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+import arte_trace
+from arte_limiter import DailyQuotaExhausted, estimate_tokens, retry_delay_from_exception
+from arte_llm_cache import model_family
+
+logger = logging.getLogger(__name__)
+
+# --- Níveis de qualidade por tarefa ---
+TIER_LITE = 1      # Classificação e respostas curtas
+TIER_STANDARD = 2  # Extração e julgamento de rotina
+TIER_PREMIUM = 3   # Julgamentos finais / extração de documentos difíceis
+
+# Modelos não listados ficam em TIER_LITE
+DEFAULT_QUALITY_TIERS = {
+    "gemini-2.5-pro": TIER_PREMIUM,
+    "gemini-2.5-flash": TIER_STANDARD,
+    "gemini-flash-latest": TIER_STANDARD,
+    "gemini-2.0-flash": TIER_STANDARD,
+    "gemini-2.5-flash-lite": TIER_LITE,
+    "gemini-2.0-flash-lite": TIER_LITE,
+    "gemini-1.5-flash": TIER_LITE,
+}
+
+CIRCUIT_FAILURE_THRESHOLD = 3  # Erros seguidos que desligam o modelo
+CIRCUIT_COOLDOWN_SECONDS = 60.0  # Resfriamento após erros seguidos
+QUOTA_COOLDOWN_SECONDS = 30.0  # Resfriamento após 429 quando a API não informa o tempo
+LATENCY_WINDOW = 50  # Últimas latências guardadas por modelo
+MIN_LATENCY_SAMPLES = 3  # Abaixo disso o modelo ainda não é roteado pela latência
+
+_LLM_CALL_COUNTER = threading.local()
+
+
+def llm_calls_in_thread() -> int:
+    """Chamadas à API feitas pela thread atual (usado no relatório de deduplicação)."""
+    return getattr(_LLM_CALL_COUNTER, 'count', 0)
+
+
+def add_llm_calls_in_thread(calls: int):
+    """Credita à thread atual chamadas feitas em outra thread em nome dela (execução especulativa)."""
+    _LLM_CALL_COUNTER.count = llm_calls_in_thread() + calls
+
+
+class QuotaExhausted(Exception):
+    """O provedor recusou a chamada por cota/limite de taxa (429)."""
+
+    def __init__(self, retry_after: float | None = None):
+        super().__init__(f"cota excedida (retry_after={retry_after})")
+        self.retry_after = retry_after
+
+
+class EmptyResponse(Exception):
+    """O modelo respondeu sem conteúdo (ex.: bloqueio de segurança)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenUsage(NamedTuple):
+    """Tokens informados pelo provedor em uma chamada (None = não informado)."""
+
+    prompt: int | None = None
+    response: int | None = None
+    total: int | None = None
+
+    @classmethod
+    def coerce(cls, value) -> "TokenUsage":
+        """Aceita também o formato antigo, só com o total (int), e listas vindas de JSON."""
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, (list, tuple)):
+            return cls(*value)
+        return cls(total=value)
+
+    def resolved_total(self) -> int | None:
+        if self.total is not None:
+            return self.total
+        if self.prompt is not None and self.response is not None:
+            return self.prompt + self.response
+        return None
+
+
+# =====================================================================
+# BACKENDS
+# =====================================================================
+
+class GeminiBackend:
+    """google.generativeai com um `GenerativeModel` em cache por nome de modelo."""
+
+    def __init__(self, api_key: str | None = None):
+        import google.generativeai as genai
+        import google.api_core.exceptions as google_exceptions
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self._exceptions = google_exceptions
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, name: str):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self._genai.GenerativeModel(name)
+            return self._models[name]
+
+    def generate(self, model_name: str, contents, **kwargs) -> tuple[str, TokenUsage]:
+        try:
+            response = self.model(model_name).generate_content(contents, **kwargs)
+        except self._exceptions.ResourceExhausted as e:
+            raise QuotaExhausted(retry_delay_from_exception(e)) from e
+        if not response.parts:
+            raise EmptyResponse(response.candidates[0].finish_reason.name if response.candidates else 'N/A')
+        usage = getattr(response, 'usage_metadata', None)
+        return response.text, TokenUsage(getattr(usage, 'prompt_token_count', None) or None,
+                                          getattr(usage, 'candidates_token_count', None) or None,
+                                          getattr(usage, 'total_token_count', None) or None)
+
+
+class OpenRouterBackend:
+    """API de chat do OpenRouter sobre uma `requests.Session` reaproveitada."""
+
+    URL = "https://openrouter.ai/api/v1/chat/completions"
+
+    def __init__(self, api_key: str | None = None, headers: dict | None = None, timeout: float = 180):
+        import requests
+        self._session = requests.Session()
+        self._session.headers.update(headers or {})
+        self.api_key = api_key  # None = OPENROUTER_API_KEY do ambiente, lida na hora da chamada
+        self.timeout = timeout
+
+    def generate(self, model_name: str, contents, **kwargs) -> tuple[str, TokenUsage]:
+        response = self._session.post(
+            self.URL,
+            headers={"Authorization": f"Bearer {self.api_key or os.getenv('OPENROUTER_API_KEY')}"},
+            json={"model": model_name, "messages": [{"role": "user", "content": contents}], **kwargs},
+            timeout=self.timeout,
+        )
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise QuotaExhausted(float(retry_after) if retry_after and retry_after.replace('.', '', 1).isdigit() else None)
+        response.raise_for_status()
+        response_json = response.json()
+        content = (response_json.get('choices') or [{}])[0].get('message', {}).get('content')
+        if not content:
+            raise EmptyResponse('resposta vazia')
+        usage = response_json.get('usage') or {}
+        return content, TokenUsage(usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('total_tokens'))
+
+
+# =====================================================================
+# SAÚDE E ROTEAMENTO
+# =====================================================================
+
+class ModelHealth:
+    """Estatísticas de um modelo e estado do disjuntor."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.quota_exhausted = 0
+        self.consecutive_failures = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.open_until = 0.0
+        self.daily_until = 0.0  # Cota diária esgotada até (time.monotonic)
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.calls if self.calls else 0.0
+
+    def latency(self, q: float) -> float | None:
+        return float(np.percentile(self.latencies, q)) if self.latencies else None
+
+    def is_open(self, now: float) -> bool:
+        return now < self.open_until
+
+
+class LLMClient:
+    """Geração com fallback entre modelos, roteada pela saúde de cada um. Seguro para threads."""
+
+    def __init__(self, backend, models: list[str], quality_tiers: dict[str, int] | None = None,
+                 rate_limiter=None, max_rounds: int = 3, cache=None):
+        self.backend = backend
+        self.models = list(models)
+        self.quality_tiers = {**DEFAULT_QUALITY_TIERS, **(quality_tiers or {})}
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.max_rounds = max_rounds
+        self._lock = threading.Lock()
+        self._health: dict[str, ModelHealth] = {}
+
+    def health(self, model: str) -> ModelHealth:
+        with self._lock:
+            return self._health.setdefault(model, ModelHealth())
+
+    def tier(self, model: str) -> int:
+        return self.quality_tiers.get(model, TIER_LITE)
+
+    def route(self, min_tier: int = TIER_LITE, models: list[str] | None = None) -> list[str]:
+        """Modelos saudáveis na ordem em que devem ser tentados para uma tarefa do nível `min_tier`."""
+        models = models or self.models
+        now = time.monotonic()
+        # Pausas do limitador contam como disjuntor aberto (inclusive as impostas por outro processo)
+        em_pausa = {m for m in models if self.rate_limiter is not None and self.rate_limiter.cooldown_remaining(m) > 0}
+        with self._lock:
+            saudaveis = [m for m in models
+                         if not self._health.setdefault(m, ModelHealth()).is_open(now) and m not in em_pausa]
+
+            def velocidade(m):
+                h = self._health[m]
+                p50 = float(np.median(h.latencies)) if len(h.latencies) >= MIN_LATENCY_SAMPLES else float('inf')
+                return p50, models.index(m)
+
+        no_nivel = sorted((m for m in saudaveis if self.tier(m) >= min_tier), key=velocidade)
+        abaixo = sorted((m for m in saudaveis if self.tier(m) < min_tier), key=lambda m: (-self.tier(m), models.index(m)))
+        return no_nivel + abaixo
+
+    def _record_success(self, model: str, latency: float):
+        with self._lock:
+            h = self._health[model]
+            h.calls += 1
+            h.consecutive_failures = 0
+            h.latencies.append(latency)
+        if self.rate_limiter is not None:
+            self.rate_limiter.report_success(model)
+
+    def _record_quota(self, model: str, retry_after: float | None):
+        if self.rate_limiter is not None:
+            retry_after = self.rate_limiter.report_exhausted(model, retry_after)
+        cooldown = retry_after if retry_after is not None else QUOTA_COOLDOWN_SECONDS
+        with self._lock:
+            h = self._health[model]
+            h.calls += 1
+            h.quota_exhausted += 1
+            h.open_until = max(h.open_until, time.monotonic() + cooldown)
+        logger.warning(f"Cota excedida para '{model}'. Fora da rota por {cooldown:.1f}s.")
+
+    def _record_daily_quota(self, model: str, retry_after: float):
+        """Cota diária esgotada (limitador): fora da rota até a virada do dia."""
+        with self._lock:
+            h = self._health[model]
+            h.daily_until = h.open_until = max(h.open_until, time.monotonic() + retry_after)
+        logger.warning(f"Cota diária de '{model}' esgotada. Fora da rota por {retry_after / 3600:.1f}h.")
+
+    def _record_failure(self, model: str, error: Exception):
+        with self._lock:
+            h = self._health[model]
+            h.calls += 1
+            h.errors += 1
+            h.consecutive_failures += 1
+            desligar = h.consecutive_failures >= CIRCUIT_FAILURE_THRESHOLD
+            if desligar:
+                h.open_until = time.monotonic() + CIRCUIT_COOLDOWN_SECONDS
+        logger.error(f"Erro com o modelo '{model}': {error}")
+        if desligar:
+            logger.warning(f"Modelo '{model}' desligado por {CIRCUIT_COOLDOWN_SECONDS:.0f}s após "
+                           f"{CIRCUIT_FAILURE_THRESHOLD} erros seguidos.")
+
+    def generate(self, contents, min_tier: int = TIER_LITE, models: list[str] | None = None,
+                 on_empty=None, stage: str = 'default', near_key: str | None = None,
+                 validate=None, **kwargs) -> str | None:
+        """
+        Gera conteúdo com o melhor modelo disponível para o nível `min_tier`.
+        Cota excedida e erros levam ao próximo modelo da rota; resposta vazia
+        (bloqueio) devolve None na hora e chama `on_empty(contents, motivo)`.
+
+        Com cache: `stage` agrupa as estatísticas, `near_key` habilita o acerto por
+        quase-duplicata e `validate(texto) -> bool` impede que uma resposta
+        inutilizável seja servida do cache ou gravada nele.
+        `kwargs` vão direto para o backend (ex.: request_options do Gemini).
+        """
+        with arte_trace.span('llm', stage=stage):
+            return self._generate(contents, min_tier, models, on_empty, stage, near_key, validate, **kwargs)
+
+    def _generate(self, contents, min_tier, models, on_empty, stage, near_key, validate, **kwargs) -> str | None:
+        models = models or self.models
+        usar_cache = self.cache is not None and isinstance(contents, str)
+        if usar_cache:
+            elegiveis = [m for m in models if self.tier(m) >= min_tier] or models
+            em_cache = self.cache.get(contents, [model_family(m) for m in elegiveis], stage, near_key)
+            if em_cache is not None and (validate is None or validate(em_cache)):
+                arte_trace.count('llm_cache_hits')
+                return em_cache
+
+        texto_prompt = contents if isinstance(contents, str) else " ".join(p for p in contents if isinstance(p, str))
+        tokens = estimate_tokens(texto_prompt)
+        tentativas = 0
+
+        for _ in range(self.max_rounds):
+            rota = self.route(min_tier, models)
+            if not rota:
+                # Todos desligados: espera pelo que volta primeiro (o limitador espera a própria pausa),
+                # a menos que todos só voltem amanhã
+                with self._lock:
+                    agora = time.monotonic()
+                    if all(self._health[m].daily_until > agora for m in models):
+                        logger.error("❌ Cota diária esgotada em todos os modelos. Desistindo da chamada.")
+                        return None
+                    proximo = min(models, key=lambda m: self._health[m].open_until)
+                    espera = max(0.0, self._health[proximo].open_until - time.monotonic())
+                logger.warning(f"Todos os modelos fora da rota. Aguardando {espera:.1f}s por '{proximo}'.")
+                time.sleep(espera)
+                rota = [proximo]
+
+            for nome_modelo in rota:
+                reservados = tokens
+                if self.rate_limiter is not None:
+                    inicio = time.monotonic()
+                    try:
+                        reservados = self.rate_limiter.acquire(nome_modelo, tokens)
+                    except DailyQuotaExhausted as e:
+                        self._record_daily_quota(nome_modelo, e.retry_after)
+                        continue
+                    finally:
+                        arte_trace.count('rate_limit_wait_s', time.monotonic() - inicio)
+                logger.info(f"   - Chamando o modelo '{nome_modelo}'...")
+                _LLM_CALL_COUNTER.count = llm_calls_in_thread() + 1
+                if tentativas:
+                    arte_trace.count('llm_retries')
+                tentativas += 1
+                inicio = time.monotonic()
+                try:
+                    texto, usados = self.backend.generate(nome_modelo, contents, **kwargs)
+                except QuotaExhausted as e:
+                    arte_trace.record_llm_call(nome_modelo, stage, 'quota', time.monotonic() - inicio, tokens, 0, None)
+                    self._record_quota(nome_modelo, e.retry_after)
+                    continue
+                except EmptyResponse as e:
+                    arte_trace.record_llm_call(nome_modelo, stage, 'empty', time.monotonic() - inicio, tokens, 0, None)
+                    self._record_success(nome_modelo, time.monotonic() - inicio)
+                    logger.warning(f"   - ❌ A GERAÇÃO RETORNOU VAZIA ('{nome_modelo}'). Motivo: {e.reason}.")
+                    if on_empty is not None:
+                        on_empty(contents, e.reason)
+                    return None
+                except Exception as e:
+                    arte_trace.record_llm_call(nome_modelo, stage, 'error', time.monotonic() - inicio, tokens, 0, None)
+                    self._record_failure(nome_modelo, e)
+                    continue
+                # Tokens por direção informados pela API; estimativa só quando ela não informa
+                uso = TokenUsage.coerce(usados)
+                arte_trace.record_llm_call(nome_modelo, stage, 'ok', time.monotonic() - inicio,
+                                           uso.prompt if uso.prompt is not None else tokens,
+                                           uso.response if uso.response is not None else estimate_tokens(texto),
+                                           uso.resolved_total())
+                self._record_success(nome_modelo, time.monotonic() - inicio)
+                if self.rate_limiter is not None:
+                    self.rate_limiter.report_usage(nome_modelo, tokens, reservados, uso.resolved_total())
+                if usar_cache and (validate is None or validate(texto)):
+                    self.cache.put(contents, model_family(nome_modelo), texto, stage, near_key)
+                return texto
+
+        logger.error("❌ FALHA TOTAL: Todos os modelos na lista de fallback falharam.")
+        return None
+
+    def health_report(self) -> str:
+        """Uma linha por modelo usado: chamadas, erros, cotas, latências e estado do disjuntor."""
+        now = time.monotonic()
+        linhas = ["Saúde dos modelos LLM:"]
+        with self._lock:
+            for nome, h in self._health.items():
+                if not h.calls:
+                    continue
+                p50, p95 = h.latency(50), h.latency(95)
+                latencia = f"p50 {p50:.1f}s, p95 {p95:.1f}s" if p50 is not None else "sem latência"
+                estado = f"desligado por mais {h.open_until - now:.0f}s" if h.is_open(now) else "ativo"
+                linhas.append(f"  - {nome}: {h.calls} chamadas, {h.error_rate:.0%} erros, "
+                              f"{h.quota_exhausted} cotas excedidas, {latencia}, {estado}")
+        return "\n".join(linhas)
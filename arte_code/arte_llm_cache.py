@@ -0,0 +1,150 @@
+"""
+CACHE PERSISTENTE DE RESPOSTAS LLM (SQLITE)
+===========================================
+
+Reexecuções (após uma queda ou com pequenas edições) reenviam os mesmos
+prompts. O `ResponseCache` guarda as respostas em um banco SQLite local,
+compartilhável entre scripts:
+
+- Exato: chave (família do modelo, hash do prompt). A família ignora a versão
+  ("gemini-2.5-flash" e "gemini-2.0-flash" -> "gemini-flash"); a busca aceita
+  qualquer família capaz de atender a tarefa.
+- Quase-duplicata (opcional): a chamada informa uma chave semântica, por exemplo
+  descrição normalizada + conjunto de IDs de candidatos. Se o prompt mudou
+  só na redação, mas essa chave bate, a resposta é reaproveitada.
+
+Entradas expiram após `ttl_seconds`. Quando o banco passa de `max_bytes`, as
+respostas usadas há mais tempo são removidas. Acertos e falhas são contados por
+etapa (`report`).
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 2**20
+EVICTION_TARGET = 0.9  # Após exceder o limite, remove até ficar em 90% dele
+
+
+def model_family(model: str) -> str:
+    """Nome do modelo sem versão nem sufixos de canal: "gemini-2.5-flash-lite" -> "gemini-flash-lite"."""
+    nome = model.split(':')[0].lower()
+    partes = [p for p in nome.split('-') if p and not re.fullmatch(r'[\d.]+|latest|preview|exp|\d+b', p)]
+    return '-'.join(partes) or nome
+
+
+def prompt_hash(contents: str) -> str:
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+
+def near_duplicate_key(*parts) -> str:
+    """Chave semântica estável a partir de partes já normalizadas (textos, tuplas de IDs...)."""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Respostas LLM por (família, hash do prompt) e, opcionalmente, por chave semântica. Seguro para threads."""
+
+    def __init__(self, db_path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " family TEXT NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " near_key TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (family, prompt_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_near ON responses (stage, near_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_used ON responses (last_used)")
+        self._conn.commit()
+
+    def _count(self, stage: str, kind: str):
+        with self._lock:
+            contagem = self._stats.setdefault(stage, {'exato': 0, 'similar': 0, 'falha': 0})
+            contagem[kind] += 1
+
+    def get(self, contents: str, families: list[str], stage: str = 'default', near_key: str | None = None) -> str | None:
+        """Resposta em cache para o prompt (ou, se `near_key`, para uma quase-duplicata); None se não houver."""
+        limite = time.time() - self.ttl_seconds
+        familias = list(dict.fromkeys(families))
+        marcadores = ','.join('?' * len(familias))
+        with self._lock, self._conn:
+            linha = self._conn.execute(
+                f"SELECT rowid, response FROM responses WHERE prompt_hash = ? AND family IN ({marcadores})"
+                f" AND created_at >= ? ORDER BY last_used DESC LIMIT 1",
+                (prompt_hash(contents), *familias, limite),
+            ).fetchone()
+            tipo = 'exato'
+            if linha is None and near_key is not None:
+                linha = self._conn.execute(
+                    f"SELECT rowid, response FROM responses WHERE stage = ? AND near_key = ? AND family IN ({marcadores})"
+                    f" AND created_at >= ? ORDER BY last_used DESC LIMIT 1",
+                    (stage, near_key, *familias, limite),
+                ).fetchone()
+                tipo = 'similar'
+            if linha is not None:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE rowid = ?", (time.time(), linha[0]))
+        self._count(stage, tipo if linha is not None else 'falha')
+        return linha[1] if linha is not None else None
+
+    def put(self, contents: str, family: str, response: str, stage: str = 'default', near_key: str | None = None):
+        agora = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (family, prompt_hash, stage, near_key, response, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (family, prompt_hash(contents), stage, near_key, response, len(response.encode('utf-8')), agora, agora),
+            )
+        self._evict()
+
+    def _evict(self):
+        """Remove as expiradas e, se o total passar de `max_bytes`, as usadas há mais tempo."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            alvo = total - int(self.max_bytes * EVICTION_TARGET)
+            removidos = 0
+            for rowid, tamanho in self._conn.execute("SELECT rowid, size FROM responses ORDER BY last_used").fetchall():
+                if removidos >= alvo:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE rowid = ?", (rowid,))
+                removidos += tamanho
+        logger.info(f"Cache LLM acima de {self.max_bytes / 2**20:.0f} MiB: {removidos / 2**20:.1f} MiB removidos.")
+
+    def report(self) -> str:
+        """Acertos (exatos e por similaridade) e falhas por etapa."""
+        with self._lock:
+            if not self._stats:
+                return "Cache LLM: nenhuma consulta."
+            linhas = ["Cache LLM por etapa:"]
+            for etapa, c in self._stats.items():
+                total = sum(c.values())
+                acertos = c['exato'] + c['similar']
+                linhas.append(f"  - {etapa}: {acertos}/{total} acertos ({acertos / total:.0%}; "
+                              f"{c['exato']} exatos, {c['similar']} similares), {c['falha']} falhas")
+            return "\n".join(linhas)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
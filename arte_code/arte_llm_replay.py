@@ -0,0 +1,174 @@
+"""
+GRAVAÇÃO E REPRODUÇÃO DE CHAMADAS LLM (BENCHMARK OFFLINE)
+=========================================================
+
+Permite medir `arte_edital.py` -> `arte_heavy.py` sem rede e de forma
+reprodutível. O modo é escolhido pela variável de ambiente ARTE_LLM_MODE:
+
+- live (padrão): backend real (Gemini / OpenRouter).
+- record: backend real, e cada chamada (prompt, resposta, tokens, latência e
+  erros como 429 ou resposta vazia) é anexada a um arquivo JSONL
+  (ARTE_LLM_ARCHIVE).
+- replay: nenhuma chamada sai da máquina. As respostas gravadas são servidas de
+  volta pelo mesmo `LLMClient`, na ordem gravada para cada (modelo, prompt).
+  Opções:
+    ARTE_LLM_REPLAY_LATENCY  -> fator sobre a latência gravada (0 = sem espera, padrão 1)
+    ARTE_LLM_REPLAY_429_RATE -> fração de chamadas que recebem um 429 simulado (padrão 0)
+    ARTE_LLM_REPLAY_SEED     -> semente da injeção de 429 (determinística por chamada)
+
+Um prompt gravado com outro modelo também é servido (a rota pode mudar entre a
+gravação e a reprodução). Um prompt nunca gravado gera `ReplayMiss`, tratado pelo
+cliente como erro do modelo. Fora do modo live, os scripts não ligam o cache de
+respostas (arte_llm_cache): todo prompt passa pelo backend de gravação/reprodução.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+
+from arte_llm import EmptyResponse, QuotaExhausted, TokenUsage
+
+logger = logging.getLogger(__name__)
+
+MODE_ENV = "ARTE_LLM_MODE"
+ARCHIVE_ENV = "ARTE_LLM_ARCHIVE"
+DEFAULT_ARCHIVE = "llm_archive.jsonl"
+REPLAY_RETRY_AFTER_SECONDS = 1.0  # retry_after informado nos 429 simulados
+
+
+def contents_hash(contents) -> str:
+    """Hash do conteúdo enviado ao modelo (texto ou lista de partes, inclusive imagens)."""
+    digest = hashlib.sha256()
+    for parte in (contents if isinstance(contents, (list, tuple)) else [contents]):
+        if isinstance(parte, bytes):
+            digest.update(parte)
+        elif isinstance(parte, str):
+            digest.update(parte.encode('utf-8'))
+        else:
+            digest.update(json.dumps(parte, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+class ReplayMiss(Exception):
+    """O prompt não está no arquivo de gravação."""
+
+
+class RecordingBackend:
+    """Repassa as chamadas ao backend real e grava cada uma (resultado ou erro) no arquivo JSONL."""
+
+    def __init__(self, inner, archive_path: str):
+        self.inner = inner
+        self.archive_path = archive_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+
+    def _append(self, registro: dict):
+        linha = json.dumps(registro, ensure_ascii=False) + "\n"
+        with self._lock, open(self.archive_path, 'a', encoding='utf-8') as f:
+            f.write(linha)
+
+    def generate(self, model_name: str, contents, **kwargs):
+        registro = {
+            "model": model_name,
+            "hash": contents_hash(contents),
+            "prompt": contents if isinstance(contents, str) else None,
+            "timestamp": time.time(),
+        }
+        inicio = time.monotonic()
+        try:
+            texto, usados = self.inner.generate(model_name, contents, **kwargs)
+        except QuotaExhausted as e:
+            self._append({**registro, "latency": time.monotonic() - inicio, "error": "quota", "retry_after": e.retry_after})
+            raise
+        except EmptyResponse as e:
+            self._append({**registro, "latency": time.monotonic() - inicio, "error": "empty", "reason": e.reason})
+            raise
+        except Exception as e:
+            self._append({**registro, "latency": time.monotonic() - inicio, "error": "exception", "message": str(e)})
+            raise
+        uso = TokenUsage.coerce(usados)
+        self._append({**registro, "latency": time.monotonic() - inicio, "response": texto,
+                      "tokens": uso.resolved_total(), "usage": list(uso)})
+        return texto, uso
+
+
+class ReplayBackend:
+    """Serve as chamadas gravadas, com latência simulada e 429 injetados de forma determinística."""
+
+    def __init__(self, archive_path: str, latency_scale: float = 1.0, quota_rate: float = 0.0, seed: int = 0):
+        self.latency_scale = latency_scale
+        self.quota_rate = quota_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._by_model: dict[tuple[str, str], list[dict]] = {}
+        self._by_hash: dict[str, list[dict]] = {}
+        self._served: dict[tuple[str, str], int] = {}
+        with open(archive_path, 'r', encoding='utf-8') as f:
+            for linha in f:
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                self._by_model.setdefault((registro["model"], registro["hash"]), []).append(registro)
+                self._by_hash.setdefault(registro["hash"], []).append(registro)
+        logger.info(f"Reprodução LLM: {sum(map(len, self._by_hash.values()))} chamadas gravadas em {archive_path}.")
+
+    def _next_record(self, model_name: str, chave: str) -> tuple[dict, int]:
+        registros = self._by_model.get((model_name, chave))
+        if registros is None:
+            # Gravado com outro modelo: usa as respostas bem-sucedidas daquele prompt
+            registros = [r for r in self._by_hash.get(chave, []) if "response" in r]
+        if not registros:
+            raise ReplayMiss(f"prompt {chave[:12]} não gravado")
+        with self._lock:
+            vez = self._served.get((model_name, chave), 0)
+            self._served[(model_name, chave)] = vez + 1
+        # Depois da última gravação, repete a última
+        return registros[min(vez, len(registros) - 1)], vez
+
+    def generate(self, model_name: str, contents, **kwargs):
+        chave = contents_hash(contents)
+        registro, vez = self._next_record(model_name, chave)
+        if self.latency_scale > 0:
+            time.sleep(registro.get("latency", 0.0) * self.latency_scale)
+        if self.quota_rate > 0 and random.Random(f"{self.seed}:{model_name}:{chave}:{vez}").random() < self.quota_rate:
+            raise QuotaExhausted(REPLAY_RETRY_AFTER_SECONDS)
+
+        erro = registro.get("error")
+        if erro == "quota":
+            raise QuotaExhausted(registro.get("retry_after"))
+        if erro == "empty":
+            raise EmptyResponse(registro.get("reason", "N/A"))
+        if erro == "exception":
+            raise RuntimeError(registro.get("message", "erro gravado"))
+        # Gravações antigas só têm o total ("tokens")
+        return registro["response"], TokenUsage.coerce(registro.get("usage", registro.get("tokens")))
+
+
+def llm_mode() -> str:
+    """Modo atual: "live", "record" ou "replay"."""
+    return os.getenv(MODE_ENV, "live").strip().lower()
+
+
+def backend_from_env(make_live_backend):
+    """
+    Backend conforme ARTE_LLM_MODE. `make_live_backend()` só é chamado nos modos
+    live/record, então o modo replay não precisa de chave de API nem de rede.
+    """
+    modo = llm_mode()
+    arquivo = os.getenv(ARCHIVE_ENV, DEFAULT_ARCHIVE)
+    if modo == "replay":
+        return ReplayBackend(
+            arquivo,
+            latency_scale=float(os.getenv("ARTE_LLM_REPLAY_LATENCY", "1")),
+            quota_rate=float(os.getenv("ARTE_LLM_REPLAY_429_RATE", "0")),
+            seed=int(os.getenv("ARTE_LLM_REPLAY_SEED", "0")),
+        )
+    if modo == "record":
+        logger.info(f"Gravando chamadas LLM em {arquivo}.")
+        return RecordingBackend(make_live_backend(), arquivo)
+    return make_live_backend()
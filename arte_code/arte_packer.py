@@ -0,0 +1,128 @@
+"""
+EMPACOTADOR DE CANDIDATOS PARA O PROMPT
+=======================================
+
+Monta a lista de produtos candidatos enviada ao LLM dentro de um orçamento de
+tokens:
+
+1. Pré-ordena os candidatos pela similaridade com o item do edital (índice
+   TF-IDF da base, quando disponível; senão, sobreposição de palavras).
+2. Encurta cada DESCRICAO para as frases que carregam especificação (a frase
+   de abertura, frases com números/medidas e frases que citam termos do item).
+3. Codifica em tabela compacta separada por `|`, em vez de JSON indentado.
+4. Preenche o orçamento de tokens na ordem do ranking.
+
+Cada linha leva um ID estável (`P<posição na base>`), então a resposta do LLM é
+mapeada de volta à linha exata do catálogo sem comparar Marca/Modelo.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+from arte_limiter import estimate_tokens
+
+ID_PREFIX = "P"
+TABLE_COLUMNS = ['ID', 'MARCA', 'MODELO', 'VALOR', 'SUBCATEGORIA', 'ESPECIFICACOES']
+MAX_SPEC_CHARS = 420  # Limite de caracteres da descrição encurtada de cada produto
+MIN_TERM_LENGTH = 4  # Palavras menores não contam como termo do item
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.;!?])\s+|\n+')
+_HAS_NUMBER = re.compile(r'\d')
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def candidate_id(position: int) -> str:
+    return f"{ID_PREFIX}{int(position)}"
+
+
+def _query_terms(query_text: str) -> set[str]:
+    return {w for w in _WORD.findall(str(query_text).lower()) if len(w) >= MIN_TERM_LENGTH}
+
+
+def shorten_description(descricao: str, query_terms: set[str], max_chars: int = MAX_SPEC_CHARS) -> str:
+    """Mantém a frase de abertura e as frases com números ou termos do item, até `max_chars`."""
+    frases = [f.strip() for f in _SENTENCE_SPLIT.split(str(descricao or '')) if f.strip()]
+    if not frases:
+        return ''
+    escolhidas = [frases[0]]
+    for frase in frases[1:]:
+        palavras = set(_WORD.findall(frase.lower()))
+        if _HAS_NUMBER.search(frase) or palavras & query_terms:
+            escolhidas.append(frase)
+    texto = ' '.join(escolhidas)
+    return texto if len(texto) <= max_chars else texto[:max_chars].rsplit(' ', 1)[0] + '…'
+
+
+def _cell(valor) -> str:
+    if pd.isna(valor):
+        return ''
+    return str(valor).replace('|', '/').replace('\n', ' ').strip()
+
+
+def _lexical_scores(df_candidates: pd.DataFrame, query_terms: set[str]) -> np.ndarray:
+    textos = df_candidates['DESCRICAO'].fillna('').astype(str).str.lower()
+    return np.array([len(query_terms & set(_WORD.findall(t))) for t in textos], dtype=float)
+
+
+class PackedCandidates:
+    """Candidatos escolhidos para o prompt, sua tabela compacta e o mapa ID -> linha da base."""
+
+    def __init__(self, frame: pd.DataFrame, table: str, tokens: int, total: int):
+        self.frame = frame
+        self.table = table
+        self.tokens = tokens
+        self.total = total
+        self.by_id = {candidate_id(pos): pos for pos in frame.index}
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    @property
+    def dropped(self) -> int:
+        return self.total - len(self.frame)
+
+    def row_for(self, product_id) -> pd.Series | None:
+        """Linha do catálogo para o ID devolvido pelo LLM (None se o ID não foi enviado)."""
+        pos = self.by_id.get(str(product_id or '').strip())
+        return None if pos is None else self.frame.loc[pos]
+
+
+def pack_candidates(df_candidates: pd.DataFrame, query_text: str, token_budget: int, tfidf_index=None) -> PackedCandidates:
+    """
+    Ordena os candidatos pela relevância para `query_text` e monta a tabela até
+    `token_budget` tokens (sempre inclui ao menos um candidato). O índice de
+    `df_candidates` deve ser a posição da linha na base.
+    """
+    termos = _query_terms(query_text)
+    if df_candidates.empty:
+        return PackedCandidates(df_candidates, '', 0, 0)
+
+    if tfidf_index is not None:
+        scores = tfidf_index.score(query_text, df_candidates.index.to_numpy())
+    else:
+        scores = _lexical_scores(df_candidates, termos)
+    ordem = np.argsort(-scores, kind='stable')
+
+    header = '|'.join(TABLE_COLUMNS)
+    linhas, escolhidas = [header], []
+    tokens = estimate_tokens(header)
+    for rel in ordem:
+        row = df_candidates.iloc[rel]
+        valor = pd.to_numeric(row.get('VALOR'), errors='coerce')
+        linha = '|'.join([
+            candidate_id(df_candidates.index[rel]),
+            _cell(row.get('MARCA')),
+            _cell(row.get('MODELO')),
+            f"{valor:.2f}" if pd.notna(valor) else '',
+            _cell(row.get('subcategoria')),
+            _cell(shorten_description(row.get('DESCRICAO'), termos)),
+        ])
+        custo = estimate_tokens(linha)
+        if escolhidas and tokens + custo > token_budget:
+            break
+        linhas.append(linha)
+        escolhidas.append(rel)
+        tokens += custo
+
+    return PackedCandidates(df_candidates.iloc[escolhidas], '\n'.join(linhas), tokens, len(df_candidates))
@@ -0,0 +1,137 @@
+"""
+CACHE DE TEXTO POR PÁGINA DE PDF (ENDEREÇADO POR CONTEÚDO, SQLITE)
+==================================================================
+
+Os mesmos PDFs (modelos de edital, anexos "Termo de Referência", zips baixados
+de novo) são extraídos a cada execução, já que o 'razao.txt' é apagado na
+limpeza do arte_edital. O `PageTextCache` guarda o texto extraído de cada
+página, direto ou por OCR, com a chave:
+
+- hash do conteúdo da página (`page_content_hash`): streams de conteúdo,
+  XObjects de formulário, imagens (bytes brutos), fontes e tamanho da página.
+  Assim, a mesma página em arquivos diferentes (ou renomeados) é reaproveitada.
+- tipo da extração (ex.: "texto", "texto_ordenado", "final_ocr300"), já que o
+  mesmo conteúdo pode ser lido de formas diferentes.
+
+O banco é compartilhado entre processos (WAL). Quando passa de `max_bytes`,
+as páginas usadas há mais tempo são removidas até EVICTION_TARGET do limite. A
+verificação roda a cada EVICTION_CHECK_EVERY gravações e no `close`.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 2**20
+EVICTION_TARGET = 0.9  # Após exceder o limite, remove até ficar em 90% dele
+EVICTION_CHECK_EVERY = 200  # Gravações entre verificações de tamanho
+
+
+def page_content_hash(doc, page) -> str:
+    """Hash do que determina o texto da página (fitz): conteúdo, XObjects, imagens, fontes e tamanho."""
+    digest = hashlib.sha256()
+    digest.update(repr(tuple(round(v, 2) for v in page.rect)).encode('ascii'))
+    digest.update(page.read_contents() or b'')
+    for xref, *_ in page.get_xobjects():
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    for xref, *_ in page.get_images(full=True):
+        digest.update(doc.xref_stream_raw(xref) or b'')
+    for _, _, _, basefont, nome, encoding, *_ in page.get_fonts(full=True):
+        digest.update(f"{basefont}|{nome}|{encoding}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """Texto por (hash do conteúdo da página, tipo de extração). Seguro para threads e processos."""
+
+    def __init__(self, db_path: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+        self._writes = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " page_hash TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (page_hash, kind))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_used ON pages (last_used)")
+        self._conn.commit()
+
+    def _count(self, kind: str, acerto: bool):
+        with self._lock:
+            contagem = self._stats.setdefault(kind, {'acertos': 0, 'falhas': 0})
+            contagem['acertos' if acerto else 'falhas'] += 1
+
+    def get(self, page_hash: str, kind: str) -> str | None:
+        with self._lock, self._conn:
+            linha = self._conn.execute(
+                "SELECT rowid, text FROM pages WHERE page_hash = ? AND kind = ?", (page_hash, kind)
+            ).fetchone()
+            if linha is not None:
+                self._conn.execute("UPDATE pages SET last_used = ? WHERE rowid = ?", (time.time(), linha[0]))
+        self._count(kind, linha is not None)
+        return linha[1] if linha is not None else None
+
+    def put(self, page_hash: str, kind: str, text: str):
+        agora = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (page_hash, kind, text, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (page_hash, kind, text, len(text.encode('utf-8')), agora, agora),
+            )
+            self._writes += 1
+            verificar = self._writes % EVICTION_CHECK_EVERY == 0
+        if verificar:
+            self._evict()
+
+    def text(self, page_hash: str, kind: str, extract) -> str:
+        """Texto em cache ou, na falta dele, `extract()` (gravado para as próximas execuções)."""
+        texto = self.get(page_hash, kind)
+        if texto is None:
+            texto = extract()
+            self.put(page_hash, kind, texto)
+        return texto
+
+    def _evict(self):
+        """Se o total passar de `max_bytes`, remove as páginas usadas há mais tempo."""
+        with self._lock, self._conn:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            alvo = total - int(self.max_bytes * EVICTION_TARGET)
+            removidos = 0
+            for rowid, tamanho in self._conn.execute("SELECT rowid, size FROM pages ORDER BY last_used").fetchall():
+                if removidos >= alvo:
+                    break
+                self._conn.execute("DELETE FROM pages WHERE rowid = ?", (rowid,))
+                removidos += tamanho
+        logger.info(f"Cache de páginas acima de {self.max_bytes / 2**20:.0f} MiB: {removidos / 2**20:.1f} MiB removidos.")
+
+    def report(self) -> str:
+        """Acertos e falhas por tipo de extração (neste processo) e tamanho do banco."""
+        with self._lock:
+            entradas, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+            linhas = [f"Cache de páginas: {entradas} entradas, {total / 2**20:.1f} MiB."]
+            for tipo, c in self._stats.items():
+                consultas = c['acertos'] + c['falhas']
+                linhas.append(f"  - {tipo}: {c['acertos']}/{consultas} acertos ({c['acertos'] / consultas:.0%})")
+            return "\n".join(linhas)
+
+    def close(self):
+        self._evict()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,210 @@
+"""
+CASCATA DE MATCHING ESPECULATIVA
+================================
+
+A cascata do arte_heavy (LLM na subcategoria -> ML top-10 na subcategoria + LLM
+-> ML top-20 na categoria principal + LLM) roda uma etapa após a outra, e os
+itens que passam por todas as etapas pagam a soma das latências.
+
+Os candidatos de cada etapa só dependem do item, da faixa de preço e dos
+produtos já julgados no início da tentativa, nunca do resultado da etapa
+anterior. Por isso, no modo especulativo:
+
+- a geração de candidatos das etapas 2 e 3 (top-N por ML + empacotamento) roda
+  em paralelo com a etapa 1;
+- com `speculate_llm`, os julgamentos do LLM das etapas 2 e 3 também são
+  disparados já no início;
+- os resultados são consumidos na ordem de prioridade: vale a primeira etapa
+  que encontra match, exatamente como na execução sequencial. As etapas ainda
+  não iniciadas são canceladas; as que já estão em andamento terminam e são
+  descartadas.
+
+Chamadas LLM descartadas são custo extra. Elas entram no relatório e num
+orçamento por execução (`wasted_call_budget`): quando ele acaba, a especulação
+continua só na geração de candidatos, que não consome cota.
+`report()` resume o ganho de latência e o número de chamadas extras. A latência
+sequencial do relatório é estimada pela soma das durações das etapas consumidas
+(que ficam mais lentas quando disputam CPU); para a medida exata, compare com o
+relatório de uma execução com a especulação desligada.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import arte_trace
+from arte_llm import add_llm_calls_in_thread, llm_calls_in_thread
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeStage:
+    """
+    Uma etapa da cascata. `candidates()` devolve o DataFrame de candidatos (ou None
+    se a etapa não tem candidatos); `note` é a mensagem impressa após o cabeçalho.
+    """
+
+    __slots__ = ('name', 'attempt', 'status', 'note', 'candidates')
+
+    def __init__(self, name: str, attempt: str, status: str, candidates, note: str | None = None):
+        self.name = name
+        self.attempt = attempt
+        self.status = status
+        self.candidates = candidates
+        self.note = note
+
+
+class SpeculativeCascade:
+    """
+    Executa as etapas de uma cascata (sequencial ou especulativa) e acumula as
+    estatísticas de latência e de chamadas extras da execução.
+    """
+
+    def __init__(self, enabled: bool = False, speculate_llm: bool = False, max_workers: int = 8,
+                 wasted_call_budget: int | None = None):
+        self.enabled = enabled
+        self.speculate_llm = speculate_llm
+        self.max_workers = max_workers
+        self.wasted_call_budget = wasted_call_budget
+        self._executor = None
+        self._lock = threading.Lock()
+        self._budget_warned = False
+        self.pipelines = 0
+        self.wall_seconds = 0.0
+        self.sequential_seconds = 0.0  # Soma das durações das etapas consumidas (estimativa do modo sequencial)
+        self.speculative_judgements = 0  # Julgamentos LLM disparados antes de serem necessários
+        self.speculative_hits = 0  # ... e aproveitados
+        self.wasted_calls = 0  # Chamadas LLM feitas por etapas descartadas
+        self.cancelled = 0  # Etapas canceladas antes de começar
+
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="especulacao")
+            return self._executor
+
+    def budget_left(self) -> bool:
+        if self.wasted_call_budget is None or self.wasted_calls < self.wasted_call_budget:
+            return True
+        if not self._budget_warned:
+            self._budget_warned = True
+            logger.warning(f"Orçamento de {self.wasted_call_budget} chamadas LLM especulativas descartadas esgotado. "
+                           f"Especulando só a geração de candidatos daqui em diante.")
+        return False
+
+    def run(self, stages: list[CascadeStage], prepare, judge):
+        """
+        Gera (etapa, candidatos, resultado) na ordem de prioridade. `prepare(etapa)`
+        monta os candidatos empacotados (None = etapa sem candidatos) e
+        `judge(etapa, candidatos)` faz o julgamento do LLM. O consumidor para de
+        iterar ao encontrar o match; feche o gerador (`contextlib.closing`) para
+        cancelar/descartar o restante na hora.
+        """
+        if self.enabled and len(stages) > 1:
+            return self._run_speculative(stages, prepare, judge)
+        return self._run_sequential(stages, prepare, judge)
+
+    def _record(self, wall: float, sequential: float, hits: int = 0):
+        with self._lock:
+            self.pipelines += 1
+            self.wall_seconds += wall
+            self.sequential_seconds += sequential
+            self.speculative_hits += hits
+
+    def _run_sequential(self, stages, prepare, judge):
+        inicio = time.perf_counter()
+        try:
+            for etapa in stages:
+                packed = prepare(etapa)
+                yield etapa, packed, (judge(etapa, packed) if packed is not None else None)
+        finally:
+            decorrido = time.perf_counter() - inicio
+            self._record(decorrido, decorrido)
+
+    def _stage_task(self, etapa, prepare, judge, with_llm: bool):
+        """Etapa rodando numa thread do executor: candidatos e, opcionalmente, o julgamento."""
+        inicio = time.perf_counter()
+        chamadas = llm_calls_in_thread()
+        with arte_trace.span('especulacao', etapa=etapa.name, llm=with_llm):
+            packed = prepare(etapa)
+            julgado = with_llm and packed is not None
+            resultado = None
+            if julgado:
+                with self._lock:
+                    self.speculative_judgements += 1
+                resultado = judge(etapa, packed)
+        return packed, resultado, julgado, llm_calls_in_thread() - chamadas, time.perf_counter() - inicio
+
+    def _discard(self, future):
+        """Etapa já em andamento quando a cascata terminou: suas chamadas LLM viram custo extra."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        chamadas = future.result()[3]
+        if chamadas:
+            with self._lock:
+                self.wasted_calls += chamadas
+            arte_trace.count('speculative_wasted_calls', chamadas)
+
+    def _run_speculative(self, stages, prepare, judge):
+        inicio = time.perf_counter()
+        with_llm = self.speculate_llm and self.budget_left()
+        executor = self.executor()
+        # A etapa 1 roda na thread do item; as demais já começam no executor
+        futures = [executor.submit(self._stage_task, etapa, prepare, judge, with_llm) for etapa in stages[1:]]
+        usadas = 0
+        aproveitadas = 0
+        sequencial = 0.0
+        try:
+            t0 = time.perf_counter()
+            packed = prepare(stages[0])
+            resultado = judge(stages[0], packed) if packed is not None else None
+            sequencial += time.perf_counter() - t0
+            yield stages[0], packed, resultado
+
+            for etapa, future in zip(stages[1:], futures):
+                packed, resultado, julgado, chamadas, duracao = future.result()
+                usadas += 1
+                # As chamadas feitas em nome do item contam para ele (relatório de deduplicação)
+                add_llm_calls_in_thread(chamadas)
+                if julgado:
+                    aproveitadas += 1
+                elif packed is not None:
+                    t0 = time.perf_counter()
+                    resultado = judge(etapa, packed)
+                    duracao += time.perf_counter() - t0
+                sequencial += duracao
+                yield etapa, packed, resultado
+        finally:
+            for future in futures[usadas:]:
+                if future.cancel():
+                    with self._lock:
+                        self.cancelled += 1
+                else:
+                    future.add_done_callback(self._discard)
+            if aproveitadas:
+                arte_trace.count('speculative_hits', aproveitadas)
+            self._record(time.perf_counter() - inicio, sequencial, aproveitadas)
+
+    def report(self) -> str:
+        with self._lock:
+            if not self.pipelines:
+                return "Cascata: nenhum pipeline executado."
+            media = self.wall_seconds / self.pipelines
+            if not self.enabled:
+                return f"Cascata sequencial: {self.pipelines} pipelines, latência média {media:.2f}s."
+            estimada = self.sequential_seconds / self.pipelines
+            ganho = 1 - self.wall_seconds / self.sequential_seconds if self.sequential_seconds else 0.0
+            orcamento = "sem limite" if self.wasted_call_budget is None else f"orçamento {self.wasted_call_budget}"
+            return (f"Cascata especulativa: {self.pipelines} pipelines, latência média {media:.2f}s "
+                    f"(sequencial estimada {estimada:.2f}s, {ganho:.0%} a menos); "
+                    f"{self.speculative_hits}/{self.speculative_judgements} julgamentos especulativos aproveitados, "
+                    f"{self.wasted_calls} chamadas LLM extras descartadas ({orcamento}), "
+                    f"{self.cancelled} etapas canceladas antes de começar.")
+
+    def shutdown(self):
+        """Espera as etapas descartadas terminarem (para o relatório contar as chamadas delas)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
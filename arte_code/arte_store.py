@@ -0,0 +1,124 @@
+"""
+ARMAZENAMENTO INCREMENTAL DE RESULTADOS (SQLITE, SOMENTE ANEXAR)
+================================================================
+
+Cada item processado é gravado como uma linha JSON em um banco SQLite local,
+em uma transação própria (modo WAL, synchronous=FULL): uma queda do processo
+perde no máximo o item em andamento. A planilha estilizada deixa de ser
+reescrita a cada item e passa a ser exportada a partir do banco no fim da
+execução (ou periodicamente, com `DebouncedExport`).
+
+A retomada lê as chaves (ARQUIVO, Nº) do banco, sem abrir o .xlsx. Na primeira
+execução com um banco vazio, o histórico existente do .xlsx é importado uma vez.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def result_key(arquivo, numero) -> tuple[str, str]:
+    """Chave normalizada de um item: (ARQUIVO sem espaços, Nº como inteiro em texto)."""
+    n = pd.to_numeric(numero, errors='coerce')
+    return str(arquivo).strip(), str(int(n) if pd.notna(n) else 0)
+
+
+def _jsonable(valor):
+    if isinstance(valor, (list, dict)):
+        return valor
+    if valor is None or (np.isscalar(valor) and pd.isna(valor)):
+        return None
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, (pd.Timestamp, np.datetime64)):
+        return str(valor)
+    return valor
+
+
+class ResultStore:
+    """Banco SQLite somente-anexar com uma linha de resultado (JSON) por item, seguro para threads."""
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " arquivo TEXT NOT NULL,"
+            " numero TEXT NOT NULL,"
+            " row_json TEXT NOT NULL,"
+            " created_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_key ON results (arquivo, numero)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def append(self, rows: list[dict]):
+        """Grava as linhas em uma única transação (todas ou nenhuma)."""
+        registros = []
+        for row in rows:
+            arquivo, numero = result_key(row.get('ARQUIVO'), row.get('Nº'))
+            conteudo = json.dumps({k: _jsonable(v) for k, v in row.items()}, ensure_ascii=False, default=str)
+            registros.append((arquivo, numero, conteudo))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT INTO results (arquivo, numero, row_json) VALUES (?, ?, ?)", registros)
+
+    def keys(self) -> set[tuple[str, str]]:
+        """Chaves (ARQUIVO, Nº) já gravadas."""
+        with self._lock:
+            return set(self._conn.execute("SELECT arquivo, numero FROM results").fetchall())
+
+    def to_dataframe(self, columns: list[str] | None = None) -> pd.DataFrame:
+        """Todas as linhas, na ordem de gravação."""
+        with self._lock:
+            linhas = self._conn.execute("SELECT row_json FROM results ORDER BY id").fetchall()
+        df = pd.DataFrame([json.loads(conteudo) for (conteudo,) in linhas])
+        return df.reindex(columns=columns) if columns is not None else df
+
+    def import_excel_once(self, xlsx_path: str) -> int:
+        """Importa o histórico de uma planilha existente se o banco ainda estiver vazio."""
+        if len(self) > 0 or not os.path.exists(xlsx_path):
+            return 0
+        df = pd.read_excel(xlsx_path)
+        self.append(df.to_dict(orient='records'))
+        logger.info(f"Histórico importado de {os.path.basename(xlsx_path)}: {len(df)} linhas.")
+        return len(df)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DebouncedExport:
+    """Executa uma exportação cara no máximo a cada `interval` segundos (e sempre no `flush`)."""
+
+    def __init__(self, export_fn, interval: float):
+        self.export_fn = export_fn
+        self.interval = interval
+        self._last = time.monotonic()
+        self._pending = False
+
+    def request(self):
+        self._pending = True
+        if self.interval > 0 and time.monotonic() - self._last >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.export_fn()
+            self._last = time.monotonic()
+            self._pending = False
@@ -0,0 +1,111 @@
+"""
+ÍNDICE TF-IDF PERSISTENTE DA BASE DE PRODUTOS
+=============================================
+
+Vetoriza a base `produtos_metadados.xlsx` uma única vez e salva em disco a
+matriz esparsa e o vocabulário (vectorizer ajustado), identificados pelo hash
+do conteúdo da base. Enquanto a base não mudar, cada execução apenas carrega
+o índice; cada consulta só transforma o texto do item e pontua contra as
+linhas candidatas (filtradas por preço, categoria ou subcategoria).
+
+As posições usadas aqui são posições de linha (0..N-1) do DataFrame da base,
+por isso a base deve estar com índice padrão (`reset_index(drop=True)`).
+"""
+
+import os
+import glob
+import hashlib
+import logging
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_PREFIX = "tfidf_"
+
+
+def catalog_content_hash(df_base: pd.DataFrame) -> str:
+    """Gera um hash estável do conteúdo textual da base (ordem das linhas incluída)."""
+    h = hashlib.sha256()
+    for texto in df_base['DESCRICAO'].fillna('').astype(str):
+        h.update(texto.encode('utf-8'))
+        h.update(b'\x1f')
+    return h.hexdigest()
+
+
+class TfidfCatalogIndex:
+    """Matriz TF-IDF pré-ajustada sobre todas as descrições da base de produtos."""
+
+    def __init__(self, vectorizer: TfidfVectorizer, matrix: sp.csr_matrix, content_hash: str):
+        self.vectorizer = vectorizer
+        self.matrix = matrix.tocsr()
+        self.content_hash = content_hash
+
+    @classmethod
+    def build(cls, df_base: pd.DataFrame, content_hash: str | None = None) -> "TfidfCatalogIndex":
+        """Ajusta o vectorizer em toda a base e gera a matriz de documentos."""
+        content_hash = content_hash or catalog_content_hash(df_base)
+        vectorizer = TfidfVectorizer()
+        matrix = vectorizer.fit_transform(df_base['DESCRICAO'].fillna('').astype(str).tolist())
+        return cls(vectorizer, matrix, content_hash)
+
+    @classmethod
+    def load_or_build(cls, df_base: pd.DataFrame, index_dir: str) -> "TfidfCatalogIndex":
+        """Carrega o índice salvo para este conteúdo de base ou reconstrói e salva um novo."""
+        content_hash = catalog_content_hash(df_base)
+        matrix_path, vectorizer_path = cls._paths(index_dir, content_hash)
+
+        if os.path.exists(matrix_path) and os.path.exists(vectorizer_path):
+            try:
+                index = cls(joblib.load(vectorizer_path), sp.load_npz(matrix_path), content_hash)
+                if index.matrix.shape[0] == len(df_base):
+                    logger.info(f"Índice TF-IDF carregado do cache ({content_hash[:12]}).")
+                    return index
+                logger.warning("Índice TF-IDF em cache não corresponde ao tamanho da base. Reconstruindo...")
+            except Exception as e:
+                logger.warning(f"Falha ao carregar índice TF-IDF em cache: {e}. Reconstruindo...")
+
+        logger.info(f"Construindo índice TF-IDF para {len(df_base)} produtos...")
+        index = cls.build(df_base, content_hash)
+        index.save(index_dir)
+        return index
+
+    @staticmethod
+    def _paths(index_dir: str, content_hash: str) -> tuple[str, str]:
+        stem = os.path.join(index_dir, f"{INDEX_FILE_PREFIX}{content_hash[:16]}")
+        return f"{stem}_matrix.npz", f"{stem}_vectorizer.joblib"
+
+    def save(self, index_dir: str):
+        """Salva matriz e vectorizer, removendo índices de versões anteriores da base."""
+        os.makedirs(index_dir, exist_ok=True)
+        matrix_path, vectorizer_path = self._paths(index_dir, self.content_hash)
+        for antigo in glob.glob(os.path.join(index_dir, f"{INDEX_FILE_PREFIX}*")):
+            if antigo not in (matrix_path, vectorizer_path):
+                os.remove(antigo)
+        sp.save_npz(matrix_path, self.matrix)
+        joblib.dump(self.vectorizer, vectorizer_path)
+        logger.info(f"Índice TF-IDF salvo em: {index_dir}")
+
+    def score(self, query_text: str, positions=None) -> np.ndarray:
+        """
+        Retorna a similaridade de cosseno entre a consulta e as linhas indicadas
+        (ou toda a base). As linhas já estão normalizadas (L2), então o cosseno
+        é apenas o produto escalar.
+        """
+        query_vec = self.vectorizer.transform([query_text])
+        rows = self.matrix if positions is None else self.matrix[np.asarray(positions, dtype=np.int64)]
+        return np.asarray((rows @ query_vec.T).todense()).ravel()
+
+    def top_n(self, query_text: str, positions, n: int) -> np.ndarray:
+        """Retorna as `n` posições (da base) mais similares à consulta, em ordem decrescente."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if n <= 0 or positions.size == 0:
+            return np.empty(0, dtype=np.int64)
+        similarities = self.score(query_text, positions)
+        num_results = min(n, similarities.size)
+        # Ordenação estável: empates mantêm a ordem original das linhas da base.
+        top_relative = np.argsort(-similarities, kind='stable')[:num_results]
+        return positions[top_relative]
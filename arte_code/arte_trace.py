@@ -0,0 +1,238 @@
+"""
+INSTRUMENTAÇÃO POR ETAPA (SPANS + CONTADORES EM JSONL)
+=====================================================
+
+Camada leve para saber onde o tempo de uma execução foi gasto (OCR, LLM,
+gravação de Excel, esperas do Selenium...), sem depender dos `print`s:
+
+- `span(nome, **attrs)`: context manager que mede a duração de uma etapa. Spans
+  aninhados na mesma thread viram filhos do span aberto (`parent`).
+- `traced(nome)`: o mesmo, como decorator de função.
+- `count(nome, valor)`: contador no span atual (tokens, acertos de cache,
+  retentativas...). Ao fechar, o span soma seus contadores no span pai, então
+  cada span carrega o total do que aconteceu dentro dele.
+- `annotate(**attrs)`: atributos extras no span atual (nº do item, modelo...).
+- `event(tipo, **campos)`: registro avulso (ex.: uma chamada LLM com modelo,
+  tokens e resultado).
+
+Com `start_run(nome, trace_dir)`, cada span fechado e cada evento vira uma linha
+no arquivo `<trace_dir>/<nome>_<data>.jsonl`. Sem ele, nada é gravado, mas os
+agregados continuam disponíveis. `summary_table()` resume a execução por etapa
+(chamadas, tempo total/médio/p95) e por modelo LLM. `finish_run()` grava esse
+resumo no trace e o devolve.
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAX_DURATIONS_PER_SPAN = 10_000  # Amostras de duração guardadas por etapa (para o p95)
+
+
+class Span:
+    """Etapa em andamento: atributos e contadores acumulados até o fechamento."""
+
+    __slots__ = ('name', 'span_id', 'parent', 'attrs', 'counters', 'start')
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:12]
+        self.parent = parent
+        self.attrs = attrs
+        self.counters: dict[str, float] = {}
+        self.start = time.time()
+
+    def add(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+
+class _Run:
+    """Estado da execução atual: arquivo JSONL e agregados por etapa e por modelo."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.name = None
+        self.run_id = None
+        self.path = None
+        self.started = time.time()
+        self.spans: dict[str, dict] = {}
+        self.models: dict[str, dict] = {}
+        self.counters: dict[str, float] = {}
+
+    def stack(self) -> list[Span]:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def write(self, registro: dict):
+        if self.path is None:
+            return
+        linha = json.dumps({"run": self.run_id, **registro}, ensure_ascii=False, default=str) + "\n"
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(linha)
+
+
+_RUN = _Run()
+
+
+def start_run(name: str, trace_dir: str | None = None) -> str | None:
+    """Inicia uma execução nova (zera os agregados). Com `trace_dir`, grava o trace JSONL lá."""
+    global _RUN
+    _RUN = _Run()
+    _RUN.name = name
+    _RUN.run_id = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+        _RUN.path = os.path.join(trace_dir, f"{_RUN.run_id}.jsonl")
+        logger.info(f"Trace da execução em: {_RUN.path}")
+    return _RUN.path
+
+
+def current_span() -> Span | None:
+    pilha = _RUN.stack()
+    return pilha[-1] if pilha else None
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Mede a etapa `name`; exceções são registradas no span e repropagadas."""
+    run = _RUN
+    pilha = run.stack()
+    atual = Span(name, pilha[-1] if pilha else None, attrs)
+    pilha.append(atual)
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield atual
+    except BaseException as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        pilha.pop()
+        if atual.parent is not None:
+            for chave, valor in atual.counters.items():
+                atual.parent.add(chave, valor)
+        with run.lock:
+            agregado = run.spans.setdefault(name, {"count": 0, "errors": 0, "total": 0.0, "durations": [], "counters": {}})
+            agregado["count"] += 1
+            agregado["errors"] += erro is not None
+            agregado["total"] += duracao
+            if len(agregado["durations"]) < MAX_DURATIONS_PER_SPAN:
+                agregado["durations"].append(duracao)
+            if atual.parent is None:
+                for chave, valor in atual.counters.items():
+                    run.counters[chave] = run.counters.get(chave, 0) + valor
+        run.write({
+            "type": "span", "name": name, "span_id": atual.span_id,
+            "parent": atual.parent.span_id if atual.parent else None,
+            "thread": threading.current_thread().name, "start": atual.start,
+            "duration": round(duracao, 6), "attrs": atual.attrs, "counters": atual.counters, "error": erro,
+        })
+
+
+def traced(name: str | None = None):
+    """Decorator: cada chamada da função vira um span (nome padrão: nome da função)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1):
+    """Soma `value` ao contador `name` do span atual (ou da execução, fora de spans)."""
+    atual = current_span()
+    if atual is not None:
+        atual.add(name, value)
+    else:
+        with _RUN.lock:
+            _RUN.counters[name] = _RUN.counters.get(name, 0) + value
+
+
+def annotate(**attrs):
+    """Atributos extras no span atual."""
+    atual = current_span()
+    if atual is not None:
+        atual.attrs.update(attrs)
+
+
+def event(kind: str, **fields):
+    """Registro avulso no trace, ligado ao span atual."""
+    atual = current_span()
+    _RUN.write({"type": kind, "time": time.time(), "span": atual.span_id if atual else None, **fields})
+
+
+def record_llm_call(model: str, stage: str, outcome: str, latency: float,
+                    prompt_tokens: int, response_tokens: int, total_tokens: int | None):
+    """Uma tentativa de chamada LLM: evento no trace, contadores no span e agregado por modelo."""
+    event("llm_call", model=model, stage=stage, outcome=outcome, latency=round(latency, 4),
+          prompt_tokens=prompt_tokens, response_tokens=response_tokens, total_tokens=total_tokens)
+    count("llm_calls")
+    if outcome == "ok":
+        count("tokens_prompt", prompt_tokens)
+        count("tokens_response", response_tokens)
+    with _RUN.lock:
+        m = _RUN.models.setdefault(model, {"calls": 0, "ok": 0, "quota": 0, "errors": 0, "latency": 0.0,
+                                           "tokens_prompt": 0, "tokens_response": 0})
+        m["calls"] += 1
+        m["latency"] += latency
+        if outcome == "ok":
+            m["ok"] += 1
+            m["tokens_prompt"] += prompt_tokens
+            m["tokens_response"] += response_tokens
+        elif outcome == "quota":
+            m["quota"] += 1
+        else:
+            m["errors"] += 1
+
+
+def summary() -> dict:
+    """Agregados da execução: por etapa, por modelo LLM e contadores totais."""
+    with _RUN.lock:
+        etapas = {}
+        for nome, a in _RUN.spans.items():
+            etapas[nome] = {
+                "count": a["count"], "errors": a["errors"], "total_s": round(a["total"], 3),
+                "mean_ms": round(a["total"] * 1000 / a["count"], 2),
+                "p95_ms": round(float(np.percentile(a["durations"], 95)) * 1000, 2) if a["durations"] else None,
+            }
+        return {"elapsed_s": round(time.time() - _RUN.started, 3), "spans": etapas,
+                "models": {k: dict(v) for k, v in _RUN.models.items()}, "counters": dict(_RUN.counters)}
+
+
+def summary_table() -> str:
+    resumo = summary()
+    linhas = [f"Resumo da execução ({resumo['elapsed_s']:.1f}s):",
+              f"  {'Etapa':<32} {'Chamadas':>9} {'Erros':>6} {'Total (s)':>10} {'Média (ms)':>11} {'p95 (ms)':>10}"]
+    for nome, e in sorted(resumo["spans"].items(), key=lambda kv: -kv[1]["total_s"]):
+        linhas.append(f"  {nome:<32} {e['count']:>9} {e['errors']:>6} {e['total_s']:>10.2f} "
+                      f"{e['mean_ms']:>11.1f} {e['p95_ms'] or 0:>10.1f}")
+    if resumo["models"]:
+        linhas.append(f"  {'Modelo LLM':<32} {'Chamadas':>9} {'OK':>6} {'429':>5} {'Erros':>6} "
+                      f"{'Lat. média (s)':>15} {'Tokens prompt':>14} {'Tokens resp.':>13}")
+        for nome, m in resumo["models"].items():
+            linhas.append(f"  {nome:<32} {m['calls']:>9} {m['ok']:>6} {m['quota']:>5} {m['errors']:>6} "
+                          f"{m['latency'] / m['calls']:>15.2f} {m['tokens_prompt']:>14} {m['tokens_response']:>13}")
+    if resumo["counters"]:
+        linhas.append("  Contadores: " + ", ".join(f"{k}={v:g}" for k, v in sorted(resumo["counters"].items())))
+    return "\n".join(linhas)
+
+
+def finish_run() -> str:
+    """Grava o resumo no trace e devolve a tabela para impressão."""
+    _RUN.write({"type": "summary", "time": time.time(), **summary()})
+    return summary_table()
@@ -0,0 +1,98 @@
+"""
+BENCHMARK: ÍNDICE ANN FILTRADO vs BUSCA EXATA
+=============================================
+
+Mede latência e recall@k do `FilteredAnnIndex` com os filtros usados em
+`heavy/arte_llm_master.process_item` (teto de preço + subcategoria, teto de
+preço + categoria principal, só teto de preço).
+
+Usa os embeddings reais (armazenamento de `arte_embeddings`) quando existirem e
+alinhados com a base; caso contrário, gera um catálogo sintético com N_SINTETICO produtos
+para simular o crescimento da base.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "arte_code"))
+
+from arte_catalog import CatalogIndex
+from arte_ann import FilteredAnnIndex, hnswlib
+
+# --- Parâmetros do Benchmark ---
+BASE_DIR = r"C:\Users\pietr\OneDrive\.vscode\arte_"
+CAMINHO_BASE = os.path.join(BASE_DIR, "DOWNLOADS", "METADADOS", "produtos_metadados.xlsx")
+CAMINHO_EMBEDDINGS = os.path.join(BASE_DIR, "machine_learning", "ml_models", "product_embeddings", "vectors.npy")
+INDEX_DIR = os.path.join(BASE_DIR, "machine_learning", "ml_models", "ann_index_benchmark")
+N_SINTETICO = 100_000
+DIMENSAO = 384
+N_CATEGORIAS, N_SUBCATEGORIAS = 12, 150
+N_CONSULTAS = 300
+TOP_K = 15
+SEED = 42
+
+
+def catalogo_sintetico(rng: np.random.Generator) -> tuple[pd.DataFrame, np.ndarray]:
+    """Produtos agrupados por subcategoria (centróide + ruído), com preços log-normais."""
+    sub_ids = rng.integers(0, N_SUBCATEGORIAS, N_SINTETICO)
+    centroides = rng.normal(size=(N_SUBCATEGORIAS, DIMENSAO)).astype(np.float32)
+    embeddings = centroides[sub_ids] + 0.8 * rng.normal(size=(N_SINTETICO, DIMENSAO)).astype(np.float32)
+    df = pd.DataFrame({
+        'categoria_principal': [f"cat_{s % N_CATEGORIAS}" for s in sub_ids],
+        'subcategoria': [f"sub_{s}" for s in sub_ids],
+        'VALOR': np.round(rng.lognormal(mean=6.0, sigma=1.2, size=N_SINTETICO), 2),
+    })
+    return df, embeddings
+
+
+def carregar_dados(rng: np.random.Generator) -> tuple[pd.DataFrame, np.ndarray, str]:
+    if os.path.exists(CAMINHO_BASE) and os.path.exists(CAMINHO_EMBEDDINGS):
+        df = pd.read_excel(CAMINHO_BASE).reset_index(drop=True)
+        embeddings = np.load(CAMINHO_EMBEDDINGS)
+        if len(df) == len(embeddings):
+            return df, embeddings, "base real"
+    df, embeddings = catalogo_sintetico(rng)
+    return df, embeddings, "catálogo sintético"
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+    df, embeddings, origem = carregar_dados(rng)
+    catalog = CatalogIndex(df)
+
+    inicio = time.perf_counter()
+    index = FilteredAnnIndex.load_or_build(embeddings, catalog, INDEX_DIR)
+    print(f"{origem}: {len(df)} produtos | hnswlib: {'sim' if hnswlib else 'não'} | "
+          f"construção/carga: {time.perf_counter() - inicio:.1f} s")
+
+    amostra = rng.integers(0, len(df), N_CONSULTAS)
+    consultas = embeddings[amostra] + 0.3 * rng.normal(size=(N_CONSULTAS, embeddings.shape[1])).astype(np.float32)
+    tetos = df['VALOR'].to_numpy(dtype=float)[amostra] * rng.uniform(0.8, 3.0, N_CONSULTAS)
+    cenarios = {
+        'preço + subcategoria': [{'max_cost': t, 'subcategoria': df['subcategoria'].iat[i]} for t, i in zip(tetos, amostra)],
+        'preço + categoria': [{'max_cost': t, 'categoria': df['categoria_principal'].iat[i]} for t, i in zip(tetos, amostra)],
+        'só preço': [{'max_cost': t} for t in tetos],
+    }
+
+    print(f"\n=== RESULTADOS (top-{TOP_K}, {N_CONSULTAS} consultas) ===")
+    for nome, filtros in cenarios.items():
+        tempos_idx, tempos_exato = [], []
+        for consulta, filtro in zip(consultas, filtros):
+            t0 = time.perf_counter()
+            index.search(consulta, TOP_K, **filtro)
+            t1 = time.perf_counter()
+            index.search(consulta, TOP_K, exact=True, **filtro)
+            t2 = time.perf_counter()
+            tempos_idx.append((t1 - t0) * 1000)
+            tempos_exato.append((t2 - t1) * 1000)
+        recall = index.recall_at_k(consultas, TOP_K, filtros)
+        print(f"{nome:22s} | índice p50 {np.percentile(tempos_idx, 50):7.3f} ms p95 {np.percentile(tempos_idx, 95):7.3f} ms"
+              f" | exato p50 {np.percentile(tempos_exato, 50):7.3f} ms | recall@{TOP_K} {recall * 100:5.1f}%")
+
+
+if __name__ == "__main__":
+    main()
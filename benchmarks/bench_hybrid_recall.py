@@ -0,0 +1,172 @@
+"""
+BENCHMARK: RECALL@K DA RECUPERAÇÃO HÍBRIDA (BM25 + VETORES, RRF)
+================================================================
+
+Mede se o produto aceito para cada item aparece entre os k primeiros
+candidatos de cada estratégia de recuperação, dentro da faixa de preço
+expandida (custo <= VALOR_UNIT * EXPANDED_PRICE_FILTER_PERCENTAGE):
+
+- tfidf:        cosseno TF-IDF (o pré-filtro ML do arte_heavy)
+- bm25:         índice invertido BM25 (arte_hybrid)
+- hibrido:      BM25 + TF-IDF fundidos por RRF (RETRIEVAL_MODE = "hibrido" no arte_heavy)
+- embeddings / bm25+embeddings: só nos dados sintéticos, que trazem vetores prontos
+
+O gabarito são os matches aceitos historicamente em master_heavy.xlsx
+(STATUS com "Match Encontrado"), ligados ao catálogo por MARCA + MODELO. Sem
+esses arquivos (ou com --sintetico), usa o catálogo e o edital de
+`synthetic_data`, cujo gabarito é o produto-alvo de cada item. O edital
+sintético copia a especificação do alvo palavra por palavra (todas as
+estratégias acertariam de primeira), então as consultas sintéticas são
+degradadas como num edital de verdade (ver `degradar_consulta`): parte das
+frases de especificação é omitida e o resto é reescrito com sinônimos; os
+vetores dos itens recebem ruído extra. Mesmo assim, os números absolutos só
+valem para comparar estratégias: o recall real é o medido com --historico.
+
+Uso: python bench_hybrid_recall.py [--sintetico] [--historico master_heavy.xlsx] [--base produtos_metadados.xlsx]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "arte_code"))
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from arte_catalog import CatalogIndex
+from arte_tfidf import TfidfCatalogIndex
+from arte_ann import FilteredAnnIndex
+from arte_dedup import normalize_text
+from arte_hybrid import BM25CatalogIndex, HybridRetriever, recall_at_k
+from synthetic_data import synthetic_catalog, synthetic_edital, synthetic_embeddings
+
+# --- Parâmetros do Benchmark ---
+BASE_DIR = r"C:\Users\pietr\OneDrive\.vscode\arte_"
+CAMINHO_HISTORICO = os.path.join(BASE_DIR, "DOWNLOADS", "master_heavy.xlsx")
+CAMINHO_BASE = os.path.join(BASE_DIR, "DOWNLOADS", "METADADOS", "produtos_metadados.xlsx")
+EXPANDED_PRICE_FILTER_PERCENTAGE = 0.75  # Mesmo teto da tentativa 2 do arte_heavy
+VALORES_K = [1, 5, 10, 20, 50]
+N_LINHAS_SINTETICO = 10_000
+N_ITENS_SINTETICO = 500
+SEED_CONSULTAS = 7
+FRACAO_ESPECIFICACAO = 0.4  # Fração das frases de especificação do alvo mantidas em cada consulta sintética
+RUIDO_VETOR_ITEM = 4.0  # Desvio do ruído somado aos vetores sintéticos dos itens
+SINONIMOS = {
+    "Potência de": "potência mínima", "Peso aproximado de": "peso até", "Medida de": "tamanho",
+    "Construção em": "fabricado em", "acabamento": "cor", "Conexão": "saída", "polegadas": "pol",
+    "Garantia de": "garantia mínima",
+}
+
+
+def gabarito_historico(caminho_historico: str, df_base: pd.DataFrame) -> pd.DataFrame:
+    """Itens com match aceito e a posição do produto aceito na base (colunas: consulta, valor_unit, alvo)."""
+    df_hist = pd.read_excel(caminho_historico)
+    aceitos = df_hist[df_hist['STATUS'].astype(str).str.contains("Match Encontrado", na=False)]
+    chave = lambda marca, modelo: (normalize_text(marca), normalize_text(modelo))
+    posicoes = {}
+    for pos, (marca, modelo) in enumerate(zip(df_base['MARCA'].fillna(''), df_base['MODELO'].fillna(''))):
+        posicoes.setdefault(chave(marca, modelo), pos)
+    linhas = []
+    for _, row in aceitos.iterrows():
+        alvo = posicoes.get(chave(row.get('MARCA_SUGERIDA', ''), row.get('MODELO_SUGERIDO', '')))
+        if alvo is None:
+            continue
+        linhas.append({
+            'consulta': f"{row.get('DESCRICAO_EDITAL', '')} {row.get('REFERENCIA', '')}",
+            'valor_unit': pd.to_numeric(str(row.get('VALOR_UNIT_EDITAL', '')).replace(',', '.'), errors='coerce'),
+            'alvo': alvo,
+        })
+    print(f"{len(aceitos)} matches aceitos no histórico, {len(linhas)} ligados a produtos da base atual.")
+    return pd.DataFrame(linhas, columns=['consulta', 'valor_unit', 'alvo'])
+
+
+def degradar_consulta(descricao: str, rng: np.random.Generator) -> str:
+    """
+    Descrição sintética como um edital a escreveria: o título do item e só parte
+    das frases de especificação (ao menos uma), com sinônimos no lugar dos termos do catálogo.
+    """
+    titulo, _, especificacao = descricao.partition(". ")
+    frases = [f for f in especificacao.split(". ") if f]
+    manter = max(1, round(len(frases) * FRACAO_ESPECIFICACAO))
+    frases = [frases[i] for i in sorted(rng.choice(len(frases), manter, replace=False))]
+    texto = ". ".join([titulo, *frases])
+    for termo, sinonimo in SINONIMOS.items():
+        texto = re.sub(re.escape(termo), sinonimo, texto)
+    return texto
+
+
+def gabarito_sintetico() -> tuple[pd.DataFrame, pd.DataFrame, np.ndarray, np.ndarray]:
+    df_base = synthetic_catalog(N_LINHAS_SINTETICO)
+    df_edital, alvos = synthetic_edital(df_base, N_ITENS_SINTETICO)
+    produtos, itens = synthetic_embeddings(df_base, alvos)
+    rng = np.random.default_rng(SEED_CONSULTAS)
+    consultas = [degradar_consulta(descricao, rng) for descricao in df_edital['DESCRICAO']]
+    itens = itens + RUIDO_VETOR_ITEM * rng.normal(size=itens.shape).astype(np.float32)
+    gabarito = pd.DataFrame({
+        'consulta': [f"{consulta} {referencia}" for consulta, referencia in zip(consultas, df_edital['REFERENCIA'])],
+        'valor_unit': df_edital['VALOR_UNIT'].to_numpy(dtype=float),
+        'alvo': alvos,
+    })
+    return df_base, gabarito, produtos, itens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k das estratégias de recuperação de candidatos.")
+    parser.add_argument("--sintetico", action="store_true", help="usa o catálogo e o edital sintéticos")
+    parser.add_argument("--historico", default=CAMINHO_HISTORICO)
+    parser.add_argument("--base", default=CAMINHO_BASE)
+    args = parser.parse_args()
+
+    produtos = itens = None
+    if not args.sintetico and os.path.exists(args.historico) and os.path.exists(args.base):
+        df_base = pd.read_excel(args.base).reset_index(drop=True)
+        df_base['VALOR'] = pd.to_numeric(df_base['VALOR'], errors='coerce').fillna(0)
+        gabarito = gabarito_historico(args.historico, df_base)
+    else:
+        if not args.sintetico:
+            print("Histórico ou base não encontrados: usando dados sintéticos.")
+        df_base, gabarito, produtos, itens = gabarito_sintetico()
+
+    inicio = time.perf_counter()
+    catalog = CatalogIndex(df_base)
+    tfidf_index = TfidfCatalogIndex.build(df_base)
+    bm25 = BM25CatalogIndex.build(df_base)
+    print(f"Índices TF-IDF e BM25 de {len(df_base)} produtos em {time.perf_counter() - inicio:.1f}s.")
+    ann_index = FilteredAnnIndex(produtos, catalog) if produtos is not None else None
+
+    estrategias = {
+        "tfidf": lambda consulta, pos, vetor: tfidf_index.top_n(consulta, pos, max(VALORES_K)),
+        "bm25": lambda consulta, pos, vetor: bm25.top_n(consulta, pos, max(VALORES_K)),
+        "hibrido": lambda consulta, pos, vetor: HybridRetriever(bm25, tfidf_index).search(consulta, pos, max(VALORES_K))[0],
+    }
+    if ann_index is not None:
+        estrategias["embeddings"] = lambda consulta, pos, vetor: ann_index.search_positions(vetor, pos, max(VALORES_K))[0]
+        estrategias["bm25+embeddings"] = lambda consulta, pos, vetor: HybridRetriever(bm25, ann_index=ann_index).search(
+            consulta, pos, max(VALORES_K), query_vector=vetor)[0]
+
+    # Só entram itens cujo produto aceito está na faixa de preço consultada
+    consultas = []
+    for i, row in enumerate(gabarito.itertuples(index=False)):
+        teto = row.valor_unit * EXPANDED_PRICE_FILTER_PERCENTAGE if pd.notna(row.valor_unit) and row.valor_unit > 0 else None
+        positions = catalog.price_positions(teto)
+        if row.alvo in set(positions.tolist()):
+            consultas.append((row.consulta, positions, None if itens is None else itens[i], int(row.alvo)))
+    print(f"{len(consultas)} de {len(gabarito)} itens com o produto aceito dentro da faixa de preço.\n")
+    if not consultas:
+        return
+
+    print(f"{'Estratégia':<18} " + " ".join(f"{f'R@{k}':>7}" for k in VALORES_K) + f" {'ms/item':>9}")
+    alvos = [alvo for *_, alvo in consultas]
+    for nome, buscar in estrategias.items():
+        inicio = time.perf_counter()
+        rankings = [buscar(consulta, positions, vetor) for consulta, positions, vetor, _ in consultas]
+        ms = (time.perf_counter() - inicio) * 1000 / len(consultas)
+        print(f"{nome:<18} " + " ".join(f"{recall_at_k(rankings, alvos, k):>7.3f}" for k in VALORES_K) + f" {ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
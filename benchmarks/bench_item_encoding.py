@@ -0,0 +1,75 @@
+"""
+BENCHMARK: CODIFICAÇÃO POR ITEM vs EM LOTE (SENTENCE-TRANSFORMERS, CPU)
+=======================================================================
+
+Compara a vazão de codificação dos itens do edital em `heavy/arte_llm_master`:
+
+- Antes: `st_model.encode(item_desc)` chamado por item em cada etapa (até 3
+  passadas por item), a partir de MAX_LLM_CONCURRENT_CALLS threads que
+  disputam o mesmo modelo na CPU.
+- Depois: `encode_items` codifica todos os itens de uma vez, em lotes de
+  ITEM_ENCODE_BATCH_SIZE, antes da fase com threads.
+
+Também confere que os vetores em lote são equivalentes aos vetores por item.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import torch
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "heavy"))
+
+import arte_llm_master
+from sentence_transformers import SentenceTransformer
+
+# --- Parâmetros do Benchmark ---
+CAMINHO_ITENS = os.path.join(arte_llm_master.BASE_DIR, "DOWNLOADS", "master_heavy.xlsx")  # Histórico com centenas de itens
+MAX_ITENS = 300
+ENCODES_POR_ITEM_ANTES = 3  # Etapa 2, etapa 3 e fallback na base inteira
+DEVICE = "cpu"
+
+
+def carregar_descricoes() -> list[str]:
+    caminho = CAMINHO_ITENS if os.path.exists(CAMINHO_ITENS) else arte_llm_master.CAMINHO_EDITAL
+    df = pd.read_excel(caminho)
+    coluna = 'DESCRICAO' if 'DESCRICAO' in df.columns else 'DESCRICAO_EDITAL'
+    return df[coluna].dropna().astype(str).head(MAX_ITENS).tolist()
+
+
+def main():
+    torch.set_num_threads(os.cpu_count() or 1)
+    st_model = SentenceTransformer(arte_llm_master.SENTENCE_TRANSFORMER_MODEL, device=DEVICE)
+    descricoes = carregar_descricoes()
+    n = len(descricoes)
+    print(f"Itens: {n} | Dispositivo: {DEVICE} | Threads torch: {torch.get_num_threads()}")
+    st_model.encode(descricoes[:8], show_progress_bar=False)  # Aquecimento
+
+    def encode_item(desc):
+        for _ in range(ENCODES_POR_ITEM_ANTES):
+            vetor = st_model.encode(desc, convert_to_tensor=True)
+        return vetor
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=arte_llm_master.MAX_LLM_CONCURRENT_CALLS) as executor:
+        por_item = list(executor.map(encode_item, descricoes))
+    tempo_antes = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    em_lote = arte_llm_master.encode_items(st_model, descricoes)
+    tempo_depois = time.perf_counter() - inicio
+
+    diferenca = (torch.stack(por_item) - em_lote).abs().max().item()
+    print("\n=== RESULTADOS ===")
+    print(f"Antes  (por item, {ENCODES_POR_ITEM_ANTES}x, {arte_llm_master.MAX_LLM_CONCURRENT_CALLS} threads): "
+          f"{tempo_antes:8.2f} s | {n / tempo_antes:8.1f} itens/s")
+    print(f"Depois (lote de {arte_llm_master.ITEM_ENCODE_BATCH_SIZE}):               "
+          f"{tempo_depois:8.2f} s | {n / tempo_depois:8.1f} itens/s")
+    print(f"Speedup: {tempo_antes / tempo_depois:.1f}x | Diferença máxima entre vetores: {diferenca:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+BENCHMARK: CASCATA DE MATCHING (ARTE_HEAVY E ARTE_LLM_MASTER) COM LLM SIMULADO
+==============================================================================
+
+Roda a cascata de matching dos dois scripts sobre catálogos sintéticos de
+1k/10k/100k produtos (`synthetic_data`). O LLM é um backend simulado plugado no
+`LLMClient` de cada script, que responde na hora a partir do gabarito do edital.
+Assim o tempo medido é só o do código do pipeline.
+
+- heavy:  `arte_heavy.match_item` (as duas tentativas de preço de
+  `process_single_item_pipeline`), com a classificação vinda do gabarito
+  (ERRO_CLASSIFICACAO dos itens recebem uma subcategoria errada e descem a cascata).
+- master: `arte_llm_master.process_item` (classificador ML, busca semântica
+  filtrada, categoria via LLM e fallback na base inteira), com embeddings sintéticos.
+
+Para cada script e tamanho de catálogo, o benchmark mede:
+- itens/s;
+- tempo por etapa (filtro de preço/categoria, pré-filtro ML, serialização dos
+  candidatos, julgamento e a própria chamada LLM; etapas aninhadas contam nas duas);
+- pico de RSS;
+- número de chamadas LLM.
+
+Cada combinação roda em um subprocesso, para que o pico de RSS seja só dela.
+Os resultados são anexados a HISTORICO_PATH. A execução é comparada com a
+anterior de mesma combinação, e quedas acima de LIMIAR_REGRESSAO são apontadas.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import platform
+import functools
+import subprocess
+import contextlib
+import tempfile
+from collections import Counter
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "arte_code"))
+sys.path.insert(0, os.path.join(REPO_DIR, "heavy"))
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from arte_llm import TokenUsage
+from synthetic_data import CATALOG_SIZES, N_ITENS_EDITAL, synthetic_catalog, synthetic_edital, synthetic_embeddings
+
+# --- Parâmetros do Benchmark ---
+PIPELINES = ["heavy", "master"]
+HISTORICO_PATH = os.path.join(REPO_DIR, "benchmarks", "historico_cascata.json")
+ERRO_CLASSIFICACAO = 0.15  # Fração de itens com subcategoria errada (heavy)
+LATENCIA_STUB_SEGUNDOS = 0.0  # Latência simulada por chamada LLM
+LIMIAR_REGRESSAO = 0.15  # Queda de itens/s (ou alta de ms/item por etapa) que conta como regressão
+SEED = 42
+
+
+# =====================================================================
+# LLM SIMULADO
+# =====================================================================
+
+class StubLLMBackend:
+    """
+    Backend com a interface de `arte_llm` que responde pelo gabarito: o item é
+    identificado pelo "Item N:" da descrição e o alvo é escolhido se estiver
+    entre os candidatos enviados; senão, o primeiro candidato volta como closest_match.
+    """
+
+    def __init__(self, df_catalog: pd.DataFrame, alvos: np.ndarray, latencia: float = LATENCIA_STUB_SEGUNDOS):
+        self.df_catalog = df_catalog
+        self.alvos = alvos
+        self.latencia = latencia
+        self.tipos = Counter()
+
+    def _alvo(self, prompt: str) -> pd.Series | None:
+        m = re.search(r'Item (\d+):', prompt)
+        return None if m is None else self.df_catalog.iloc[self.alvos[int(m.group(1)) - 1]]
+
+    @staticmethod
+    def _analise(score: int) -> dict:
+        negativos = [] if score >= 95 else ["FALHA CRÍTICA: Especificação principal divergente"]
+        return {"score_proposto": score, "pontos_positivos": ["Mesma categoria de produto"],
+                "pontos_negativos": negativos, "justificativa": "Resposta simulada pelo benchmark."}
+
+    def _match_heavy(self, prompt: str, alvo: pd.Series | None) -> dict:
+        tabela = prompt.split('<base_fornecedores_filtrada>')[-1]
+        ids = re.findall(r'^(P\d+)\|', tabela, re.MULTILINE)
+        alvo_id = None if alvo is None else f"P{alvo.name}"
+        if alvo_id in ids:
+            return {"best_match": {"ID": alvo_id, "Compatibilidade_analise": self._analise(98)}, "closest_match": None}
+        return {"best_match": None, "closest_match": {"ID": ids[0], "Compatibilidade_analise": self._analise(45)} if ids else None}
+
+    def _match_master(self, prompt: str, alvo: pd.Series | None) -> dict:
+        trecho = prompt.split('<lista_produtos_candidatos>')[-1].split('</lista_produtos_candidatos>')[0]
+        candidatos = json.loads(trecho)
+        escolhido = next((c for c in candidatos if alvo is not None and c.get('MODELO') == alvo['MODELO']), None)
+        chave, score = ("best_match", 99) if escolhido else ("closest_match", 45)
+        escolhido = escolhido or (candidatos[0] if candidatos else None)
+        if escolhido is None:
+            return {"best_match": None, "closest_match": None}
+        return {"best_match": None, "closest_match": None, chave: {
+            "Marca": escolhido.get('MARCA'), "Modelo": escolhido.get('MODELO'), "Valor": escolhido.get('VALOR'),
+            "Descricao_fornecedor": escolhido.get('DESCRICAO'), "Compatibilidade_analise": self._analise(score),
+        }}
+
+    def generate(self, model_name: str, contents, **kwargs):
+        if self.latencia > 0:
+            time.sleep(self.latencia)
+        prompt = contents if isinstance(contents, str) else " ".join(p for p in contents if isinstance(p, str))
+        alvo = self._alvo(prompt)
+        if '<base_fornecedores_filtrada>' in prompt:
+            self.tipos['match'] += 1
+            texto = json.dumps(self._match_heavy(prompt, alvo), ensure_ascii=False)
+        elif '<lista_produtos_candidatos>' in prompt:
+            self.tipos['match'] += 1
+            texto = json.dumps(self._match_master(prompt, alvo), ensure_ascii=False)
+        elif 'Categorias Principais Válidas' in prompt:
+            self.tipos['categoria'] += 1
+            texto = alvo['categoria_principal'] if alvo is not None else ""
+        else:
+            self.tipos['desconhecido'] += 1
+            texto = "{}"
+        return texto, TokenUsage(len(prompt) // 4, len(texto) // 4, len(prompt) // 4 + len(texto) // 4)
+
+
+# =====================================================================
+# MEDIÇÃO
+# =====================================================================
+
+class Cronometro:
+    """Tempo acumulado por etapa, medido envolvendo funções/métodos do pipeline."""
+
+    def __init__(self):
+        self.tempos: dict[str, float] = {}
+        self.chamadas = Counter()
+        self._originais = []
+
+    def medir(self, dono, atributo: str, etapa: str):
+        original = getattr(dono, atributo)
+
+        @functools.wraps(original)
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.tempos[etapa] = self.tempos.get(etapa, 0.0) + time.perf_counter() - inicio
+                self.chamadas[etapa] += 1
+
+        # Método herdado da classe (ex.: classifier.predict) é só sombreado na instância e apagado ao restaurar
+        self._originais.append((dono, atributo, original if atributo in vars(dono) else None))
+        setattr(dono, atributo, medido)
+
+    def restaurar(self):
+        for dono, atributo, original in reversed(self._originais):
+            if original is None:
+                delattr(dono, atributo)
+            else:
+                setattr(dono, atributo, original)
+        self._originais.clear()
+
+    def resumo(self, n_itens: int) -> dict:
+        return {etapa: {"chamadas": self.chamadas[etapa], "total_s": round(total, 4),
+                        "ms_por_item": round(total * 1000 / max(n_itens, 1), 3)}
+                for etapa, total in sorted(self.tempos.items())}
+
+
+def pico_rss_mb() -> float | None:
+    """Pico de memória residente do processo (Linux/macOS via resource; Windows via psutil, se instalado)."""
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / 2**20 if sys.platform == 'darwin' else maxrss / 2**10, 1)
+    except ImportError:
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+        except (ImportError, AttributeError):
+            return None
+
+
+# =====================================================================
+# CASOS
+# =====================================================================
+
+def classificacoes_do_gabarito(df_catalog: pd.DataFrame, alvos: np.ndarray, rng: np.random.Generator) -> list[dict]:
+    """Classificação correta do alvo; uma fração recebe outra subcategoria da mesma categoria."""
+    subs_por_categoria = df_catalog.groupby('categoria_principal')['subcategoria'].unique()
+    classificacoes = []
+    for pos in alvos:
+        categoria, sub = df_catalog.at[pos, 'categoria_principal'], df_catalog.at[pos, 'subcategoria']
+        outras = [s for s in subs_por_categoria[categoria] if s != sub]
+        if outras and rng.random() < ERRO_CLASSIFICACAO:
+            sub = rng.choice(outras)
+        classificacoes.append({'categoria_principal': categoria, 'subcategoria': sub})
+    return classificacoes
+
+
+def rodar_heavy(df_catalog, df_edital, alvos, stub, cronometro) -> tuple[list[str], int, float]:
+    import arte_heavy
+    from arte_llm import LLMClient
+    from arte_catalog import CatalogIndex
+    from arte_tfidf import TfidfCatalogIndex
+
+    arte_heavy.LLM_CLIENT = LLMClient(stub, arte_heavy.LLM_MODELS_FALLBACK, quality_tiers=arte_heavy.LLM_QUALITY_TIERS)
+    inicio = time.perf_counter()
+    catalog = CatalogIndex(df_catalog)
+    tfidf_index = TfidfCatalogIndex.build(df_catalog)
+    preparo = time.perf_counter() - inicio
+    classificacoes = classificacoes_do_gabarito(df_catalog, alvos, np.random.default_rng(SEED))
+
+    for metodo in ('price_positions', 'category_positions', 'subcategory_positions'):
+        cronometro.medir(CatalogIndex, metodo, 'filtro_catalogo')
+    cronometro.medir(arte_heavy, 'process_single_item_pipeline', 'pipeline')
+    cronometro.medir(arte_heavy, 'get_top_n_ml_matches', 'pre_filtro_ml')
+    cronometro.medir(arte_heavy, 'pack_candidates', 'serializacao')
+    cronometro.medir(arte_heavy, 'get_best_match_from_ai', 'julgamento')
+    cronometro.medir(LLMClient, 'generate', 'llm')
+
+    status, chamadas = [], 0
+    for (_, item), classificacao in zip(df_edital.iterrows(), classificacoes):
+        resultado = arte_heavy.match_item(item, catalog, tfidf_index, classificacao)
+        status.append(resultado[0])
+        chamadas += resultado[4]
+    return status, chamadas, preparo
+
+
+def rodar_master(df_catalog, df_edital, alvos, stub, cronometro) -> tuple[list[str], int, float]:
+    import torch
+    import arte_llm_master
+    from arte_llm import LLMClient
+    from arte_catalog import CatalogIndex
+    from arte_ann import FilteredAnnIndex
+    from arte_embeddings import QuantizedEmbeddings
+    from sklearn.pipeline import Pipeline
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import SGDClassifier
+
+    arte_llm_master.LLM_CLIENT = LLMClient(stub, arte_llm_master.LLM_MODELS_FALLBACK)
+    produtos, itens = synthetic_embeddings(df_catalog, alvos)
+    inicio = time.perf_counter()
+    catalog = CatalogIndex(df_catalog)
+    if arte_llm_master.EMBEDDING_QUANTIZATION != 'float32':
+        produtos = QuantizedEmbeddings.from_vectors(produtos, arte_llm_master.EMBEDDING_QUANTIZATION)
+    with tempfile.TemporaryDirectory() as index_dir:
+        ann_index = FilteredAnnIndex.load_or_build(produtos, catalog, index_dir)
+    # Classificador linear no lugar do RandomForest de train_classifier (treino rápido em 100k linhas)
+    classifier = Pipeline([('tfidf', TfidfVectorizer()), ('clf', SGDClassifier(random_state=SEED))])
+    classifier.fit(df_catalog['DESCRICAO'], df_catalog['subcategoria'])
+    preparo = time.perf_counter() - inicio
+    main_categories_list = list(df_catalog['categoria_principal'].unique())
+
+    cronometro.medir(CatalogIndex, 'price_positions', 'filtro_catalogo')
+    cronometro.medir(CatalogIndex, 'rows', 'materializacao')
+    cronometro.medir(classifier, 'predict', 'pre_filtro_ml')
+    cronometro.medir(FilteredAnnIndex, 'search', 'busca_semantica')
+    cronometro.medir(arte_llm_master, 'get_best_match_from_ai', 'julgamento')
+    cronometro.medir(LLMClient, 'generate', 'llm')
+
+    status, chamadas = [], 0
+    for i, (_, item) in enumerate(df_edital.iterrows()):
+        resultado, n_chamadas = arte_llm_master.process_item_counted(
+            item, catalog, classifier, None, ann_index, main_categories_list, torch.from_numpy(itens[i]))
+        status.append(resultado['STATUS'])
+        chamadas += n_chamadas
+    return status, chamadas, preparo
+
+
+def executar_caso(pipeline: str, n_linhas: int) -> dict:
+    """Roda um script sobre um catálogo de `n_linhas` produtos (chamado no subprocesso)."""
+    df_catalog = synthetic_catalog(n_linhas)
+    df_edital, alvos = synthetic_edital(df_catalog, N_ITENS_EDITAL)
+    stub = StubLLMBackend(df_catalog, alvos)
+    cronometro = Cronometro()
+    rodar = rodar_heavy if pipeline == "heavy" else rodar_master
+
+    logging.disable(logging.CRITICAL)
+    try:
+        with open(os.devnull, 'w', encoding='utf-8') as nulo, contextlib.redirect_stdout(nulo):
+            inicio = time.perf_counter()
+            status, chamadas, preparo = rodar(df_catalog, df_edital, alvos, stub, cronometro)
+            segundos = time.perf_counter() - inicio - preparo
+    finally:
+        cronometro.restaurar()
+        logging.disable(logging.NOTSET)
+
+    return {
+        "pipeline": pipeline,
+        "linhas": n_linhas,
+        "itens": len(df_edital),
+        "segundos": round(segundos, 3),
+        "preparo_s": round(preparo, 3),
+        "itens_por_s": round(len(df_edital) / segundos, 2),
+        "chamadas_llm": chamadas,
+        "prompts_por_tipo": dict(stub.tipos),
+        "pico_rss_mb": pico_rss_mb(),
+        "status": dict(Counter(status)),
+        "etapas": cronometro.resumo(len(df_edital)),
+    }
+
+
+# =====================================================================
+# HISTÓRICO E RELATÓRIO
+# =====================================================================
+
+def versao_atual() -> str:
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+def carregar_historico() -> list[dict]:
+    try:
+        with open(HISTORICO_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def regressoes(atual: dict, anterior: dict) -> list[str]:
+    """Quedas de vazão e altas de ms/item por etapa acima de LIMIAR_REGRESSAO."""
+    avisos = []
+    if atual["itens_por_s"] < anterior["itens_por_s"] * (1 - LIMIAR_REGRESSAO):
+        avisos.append(f"itens/s {anterior['itens_por_s']} -> {atual['itens_por_s']}")
+    for etapa, medida in atual["etapas"].items():
+        antes = anterior.get("etapas", {}).get(etapa)
+        # Etapas abaixo de 0.05 ms/item são ruído de medição
+        if antes and medida["ms_por_item"] > max(antes["ms_por_item"] * (1 + LIMIAR_REGRESSAO), 0.05):
+            avisos.append(f"{etapa} {antes['ms_por_item']} -> {medida['ms_por_item']} ms/item")
+    if atual["chamadas_llm"] > anterior["chamadas_llm"]:
+        avisos.append(f"chamadas LLM {anterior['chamadas_llm']} -> {atual['chamadas_llm']}")
+    return avisos
+
+
+def main():
+    historico = carregar_historico()
+    anteriores = {}
+    for execucao in historico:
+        for r in execucao["resultados"]:
+            anteriores[(r["pipeline"], r["linhas"])] = (execucao["commit"], r)
+
+    resultados = []
+    for pipeline in PIPELINES:
+        for n_linhas in CATALOG_SIZES:
+            print(f"Rodando {pipeline} com catálogo de {n_linhas} produtos...")
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--caso", pipeline, str(n_linhas)],
+                                  capture_output=True, text=True, encoding='utf-8')
+            if proc.returncode != 0:
+                print(f"   - ERRO no caso {pipeline}/{n_linhas}:\n{proc.stderr[-2000:]}")
+                continue
+            resultados.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print("\n=== RESULTADOS ===")
+    print(f"{'Pipeline':<8} {'Linhas':>8} {'Itens/s':>9} {'Chamadas LLM':>13} {'Pico RSS (MiB)':>15} {'Preparo (s)':>12}")
+    for r in resultados:
+        print(f"{r['pipeline']:<8} {r['linhas']:>8} {r['itens_por_s']:>9.1f} {r['chamadas_llm']:>13} "
+              f"{r['pico_rss_mb'] if r['pico_rss_mb'] is not None else 'N/A':>15} {r['preparo_s']:>12.2f}")
+        for etapa, medida in r["etapas"].items():
+            print(f"    {etapa:<18} {medida['ms_por_item']:>10.3f} ms/item ({medida['chamadas']} chamadas)")
+
+    for r in resultados:
+        commit_anterior, anterior = anteriores.get((r["pipeline"], r["linhas"]), (None, None))
+        if anterior is None:
+            continue
+        for aviso in regressoes(r, anterior):
+            print(f"⚠️ Regressão em {r['pipeline']}/{r['linhas']} desde {commit_anterior}: {aviso}")
+
+    if resultados:
+        historico.append({
+            "data": datetime.now().isoformat(timespec='seconds'),
+            "commit": versao_atual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "resultados": resultados,
+        })
+        with open(HISTORICO_PATH, 'w', encoding='utf-8') as f:
+            json.dump(historico, f, ensure_ascii=False, indent=2)
+        print(f"\nHistórico atualizado em: {HISTORICO_PATH}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--caso":
+        print(json.dumps(executar_caso(sys.argv[2], int(sys.argv[3])), ensure_ascii=False))
+    else:
+        main()
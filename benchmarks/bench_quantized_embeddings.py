@@ -0,0 +1,122 @@
+"""
+BENCHMARK: EMBEDDINGS QUANTIZADOS (INT8 / FLOAT16 EM MEMMAP) vs FLOAT32
+=======================================================================
+
+Compara a matriz de embeddings da base em float32 (np.load inteiro na RAM)
+com as versões quantizadas gravadas pelo `EmbeddingStore` e abertas com
+`QuantizedEmbeddings.open` (memmap somente leitura):
+
+- Memória: bytes da matriz (float32 carregada vs arquivo mapeado).
+- Partida: tempo de abrir a matriz e responder a primeira consulta filtrada.
+- Qualidade: concordância do top-k e do top-1 da busca exata filtrada
+  (`FilteredAnnIndex`, mesmos filtros de `process_item`) contra o float32.
+
+Usa os embeddings reais quando existirem e alinhados com a base; caso
+contrário, gera um catálogo sintético com N_SINTETICO produtos.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "arte_code"))
+
+from arte_catalog import CatalogIndex
+from arte_ann import FilteredAnnIndex
+from arte_embeddings import QUANTIZED_DTYPES, QuantizedEmbeddings, quantize_rows
+
+# --- Parâmetros do Benchmark ---
+BASE_DIR = r"C:\Users\pietr\OneDrive\.vscode\arte_"
+CAMINHO_BASE = os.path.join(BASE_DIR, "DOWNLOADS", "METADADOS", "produtos_metadados.xlsx")
+CAMINHO_EMBEDDINGS = os.path.join(BASE_DIR, "machine_learning", "ml_models", "product_embeddings", "vectors.npy")
+N_SINTETICO = 100_000
+DIMENSAO = 384
+N_CATEGORIAS, N_SUBCATEGORIAS = 12, 150
+N_CONSULTAS = 300
+TOP_K = 15
+SEED = 42
+
+
+def catalogo_sintetico(rng: np.random.Generator) -> tuple[pd.DataFrame, np.ndarray]:
+    """Produtos agrupados por subcategoria (centróide + ruído), com preços log-normais."""
+    sub_ids = rng.integers(0, N_SUBCATEGORIAS, N_SINTETICO)
+    centroides = rng.normal(size=(N_SUBCATEGORIAS, DIMENSAO)).astype(np.float32)
+    embeddings = centroides[sub_ids] + 0.8 * rng.normal(size=(N_SINTETICO, DIMENSAO)).astype(np.float32)
+    df = pd.DataFrame({
+        'categoria_principal': [f"cat_{s % N_CATEGORIAS}" for s in sub_ids],
+        'subcategoria': [f"sub_{s}" for s in sub_ids],
+        'VALOR': np.round(rng.lognormal(mean=6.0, sigma=1.2, size=N_SINTETICO), 2),
+    })
+    return df, embeddings
+
+
+def carregar_dados(rng: np.random.Generator) -> tuple[pd.DataFrame, np.ndarray, str]:
+    if os.path.exists(CAMINHO_BASE) and os.path.exists(CAMINHO_EMBEDDINGS):
+        df = pd.read_excel(CAMINHO_BASE).reset_index(drop=True)
+        embeddings = np.load(CAMINHO_EMBEDDINGS)
+        if len(df) == len(embeddings):
+            return df, embeddings, "base real"
+    df, embeddings = catalogo_sintetico(rng)
+    return df, embeddings, "catálogo sintético"
+
+
+def abrir_e_consultar(abrir, catalog: CatalogIndex, consulta: np.ndarray, filtro: dict) -> tuple[FilteredAnnIndex, float]:
+    """Tempo de abrir a matriz, montar o índice (busca exata) e responder a primeira consulta."""
+    inicio = time.perf_counter()
+    index = FilteredAnnIndex(abrir(), catalog)
+    index.search(consulta, TOP_K, exact=True, **filtro)
+    return index, time.perf_counter() - inicio
+
+
+def main():
+    rng = np.random.default_rng(SEED)
+    df, embeddings, origem = carregar_dados(rng)
+    catalog = CatalogIndex(df)
+    print(f"{origem}: {len(df)} produtos x {embeddings.shape[1]} dimensões | consultas: {N_CONSULTAS} | k={TOP_K}")
+
+    amostra = rng.integers(0, len(df), N_CONSULTAS)
+    consultas = embeddings[amostra] + 0.3 * rng.normal(size=(N_CONSULTAS, embeddings.shape[1])).astype(np.float32)
+    tetos = df['VALOR'].to_numpy(dtype=float)[amostra] * rng.uniform(0.8, 3.0, N_CONSULTAS)
+    filtros = ([{'max_cost': t, 'subcategoria': df['subcategoria'].iat[i]} for t, i in zip(tetos, amostra)]
+               + [{'max_cost': t, 'categoria': df['categoria_principal'].iat[i]} for t, i in zip(tetos, amostra)]
+               + [{'max_cost': t} for t in tetos])
+    consultas = np.concatenate([consultas] * 3)
+
+    with tempfile.TemporaryDirectory() as store_dir:
+        np.save(os.path.join(store_dir, "vectors.npy"), embeddings.astype(np.float32))
+        for dtype in QUANTIZED_DTYPES:
+            codes, scales = quantize_rows(embeddings, dtype)
+            np.save(os.path.join(store_dir, f"vectors_{dtype}.npy"), codes)
+            if dtype == 'int8':
+                np.save(os.path.join(store_dir, f"scales_{dtype}.npy"), scales)
+
+        variantes = {'float32': lambda: np.load(os.path.join(store_dir, "vectors.npy"))}
+        for dtype in QUANTIZED_DTYPES:
+            variantes[dtype] = lambda dtype=dtype: QuantizedEmbeddings.open(store_dir, dtype)
+
+        indices, partidas = {}, {}
+        for nome, abrir in variantes.items():
+            indices[nome], partidas[nome] = abrir_e_consultar(abrir, catalog, consultas[0], filtros[0])
+
+        referencia = [indices['float32'].search(q, TOP_K, exact=True, **f)[0] for q, f in zip(consultas, filtros)]
+
+        print("\n=== RESULTADOS ===")
+        print(f"{'Formato':<10} {'Matriz (MiB)':>13} {'Partida (ms)':>13} {'Consulta (ms)':>14} {'Top-k igual':>12} {'Top-1 igual':>12}")
+        for nome, index in indices.items():
+            inicio = time.perf_counter()
+            obtidos = [index.search(q, TOP_K, exact=True, **f)[0] for q, f in zip(consultas, filtros)]
+            consulta_ms = (time.perf_counter() - inicio) * 1000 / len(consultas)
+            validos = [(e, o) for e, o in zip(referencia, obtidos) if len(e)]
+            concordancia = np.mean([len(set(e.tolist()) & set(o.tolist())) / len(e) for e, o in validos])
+            top1 = np.mean([e[0] == o[0] for e, o in validos])
+            print(f"{nome:<10} {index.vectors.nbytes / 2**20:>13.1f} {partidas[nome] * 1000:>13.1f} "
+                  f"{consulta_ms:>14.3f} {concordancia:>12.2%} {top1:>12.2%}")
+        del indices  # Libera os memmaps antes de apagar o diretório temporário (Windows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+BENCHMARK: TF-IDF POR CHAMADA vs ÍNDICE PRÉ-AJUSTADO
+====================================================
+
+Compara a latência de `arte_heavy.get_top_n_ml_matches` no modo antigo
+(`fit_transform` sobre os candidatos a cada chamada) com o modo indexado
+(`TfidfCatalogIndex`, apenas `transform` da consulta), usando os mesmos
+conjuntos de candidatos que o pipeline monta (filtro de preço e subcategoria).
+
+Também mede a concordância do ranking (sobreposição do top-N) entre os dois
+modos, já que o IDF global da base difere levemente do IDF ajustado só nos
+candidatos.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arte_code"))
+
+import arte_heavy
+from arte_tfidf import TfidfCatalogIndex
+from arte_catalog import CatalogIndex
+
+# --- Parâmetros do Benchmark ---
+CAMINHO_ITENS = os.path.join(arte_heavy.BASE_DIR, "DOWNLOADS", "master_heavy.xlsx")  # Histórico com centenas de itens
+MAX_ITENS = 200
+REPETICOES = 3
+TOP_N = arte_heavy.MAIN_CATEGORY_ML_CANDIDATES
+
+
+def _percentis(amostras_ms: list[float]) -> str:
+    arr = np.asarray(amostras_ms)
+    return f"média {arr.mean():8.2f} ms | p50 {np.percentile(arr, 50):8.2f} ms | p95 {np.percentile(arr, 95):8.2f} ms"
+
+
+def carregar_itens() -> pd.DataFrame:
+    """Carrega itens de edital (usa DESCRICAO_EDITAL do histórico se existir)."""
+    caminho = CAMINHO_ITENS if os.path.exists(CAMINHO_ITENS) else arte_heavy.CAMINHO_EDITAL
+    df = pd.read_excel(caminho)
+    if 'DESCRICAO' not in df.columns and 'DESCRICAO_EDITAL' in df.columns:
+        df = df.rename(columns={'DESCRICAO_EDITAL': 'DESCRICAO', 'VALOR_UNIT_EDITAL': 'VALOR_UNIT'})
+    return df.dropna(subset=['DESCRICAO']).head(MAX_ITENS).reset_index(drop=True)
+
+
+def montar_conjuntos_candidatos(df_itens: pd.DataFrame, catalog: CatalogIndex) -> list[tuple[pd.Series, np.ndarray]]:
+    """Reproduz os conjuntos de candidatos do pipeline: filtro de preço (60%) sobre a base."""
+    conjuntos = []
+    for _, item in df_itens.iterrows():
+        valor = pd.to_numeric(str(item.get('VALOR_UNIT', '0')).replace(',', '.'), errors='coerce')
+        max_cost = valor * arte_heavy.INITIAL_PRICE_FILTER_PERCENTAGE if pd.notna(valor) and valor > 0 else None
+        positions = catalog.price_positions(max_cost)
+        if len(positions):
+            conjuntos.append((item, positions))
+    return conjuntos
+
+
+def main():
+    df_base = pd.read_excel(arte_heavy.CAMINHO_BASE).reset_index(drop=True)
+    df_base['VALOR'] = pd.to_numeric(df_base['VALOR'], errors='coerce').fillna(0)
+    df_itens = carregar_itens()
+    catalog = CatalogIndex(df_base)
+    conjuntos = montar_conjuntos_candidatos(df_itens, catalog)
+    print(f"Base: {len(df_base)} produtos | Itens: {len(df_itens)} | Chamadas por modo: {len(conjuntos) * REPETICOES}")
+
+    inicio = time.perf_counter()
+    index = TfidfCatalogIndex.build(df_base)
+    tempo_build = time.perf_counter() - inicio
+    index.save(arte_heavy.TFIDF_INDEX_DIR)
+    inicio = time.perf_counter()
+    TfidfCatalogIndex.load_or_build(df_base, arte_heavy.TFIDF_INDEX_DIR)
+    tempo_load = time.perf_counter() - inicio
+    print(f"Construção do índice: {tempo_build * 1000:.1f} ms | Carga do cache: {tempo_load * 1000:.1f} ms")
+
+    tempos_antes, tempos_depois, sobreposicoes = [], [], []
+    for _ in range(REPETICOES):
+        for item, positions in conjuntos:
+            t0 = time.perf_counter()
+            top_antes = arte_heavy.get_top_n_ml_matches(item, catalog, positions, TOP_N)
+            t1 = time.perf_counter()
+            top_depois = arte_heavy.get_top_n_ml_matches(item, catalog, positions, TOP_N, index)
+            t2 = time.perf_counter()
+            tempos_antes.append((t1 - t0) * 1000)
+            tempos_depois.append((t2 - t1) * 1000)
+            if len(top_antes):
+                sobreposicoes.append(len(set(top_antes.index) & set(top_depois.index)) / len(top_antes))
+
+    print("\n=== RESULTADOS (latência por chamada) ===")
+    print(f"Antes  (fit por chamada): {_percentis(tempos_antes)}")
+    print(f"Depois (índice):          {_percentis(tempos_depois)}")
+    print(f"Speedup médio: {np.mean(tempos_antes) / np.mean(tempos_depois):.1f}x")
+    print(f"Sobreposição média do top-{TOP_N}: {np.mean(sobreposicoes) * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
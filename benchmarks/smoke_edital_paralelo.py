@@ -0,0 +1,122 @@
+"""
+SMOKE TEST: PASTAS DE EDITAL EM PARALELO (arte_edital)
+======================================================
+
+Roda `processar_pastas_em_paralelo` (pool de processos de extração + threads
+de IA) sobre pastas sintéticas e falha se a execução não terminar no prazo.
+Cobre o caminho que mais prende o pool: um PDF escaneado com várias páginas
+(OCR no pool de OCR dentro de um processo de extração).
+
+- pasta_1: edital com texto + 'RelacaoItens.pdf' (itens sem IA, IA só enriquece)
+- pasta_2: edital com texto + PDF escaneado de PAGINAS_ESCANEADAS páginas
+  (sem itens estruturados: IA extrai do zero)
+- pasta_3..N: como a pasta_1
+
+Também confere que cada processo de extração, ao sair, gravou o resumo no seu
+trace (`arte_trace.finish_run`).
+
+A IA é substituída por respostas fixas (nenhuma chamada sai da máquina). Sem o
+Tesseract instalado, o OCR falha página a página (e o texto direto é mantido),
+mas o pool de OCR é criado e encerrado do mesmo jeito.
+
+Uso: python smoke_edital_paralelo.py [--pastas 3] [--timeout 300] [--manter]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import faulthandler
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "arte_code"))
+
+import arte_edital
+
+# --- Parâmetros do Smoke Test ---
+PAGINAS_ESCANEADAS = 3
+TEXTO_EDITAL = ("PREGÃO ELETRÔNICO. Termo de Referência. O item 1 refere-se a instrumento musical "
+                "de corda, com entrega no campus. ") * 20
+TEXTO_RELACAO = ("1 - Violão Descrição Detalhada: Violão clássico de nylon, tampo em cedro. "
+                 "Tratamento Diferenciado: Não Quantidade Total: 10 Valor Unitário (R$): 1.500,00 "
+                 "Valor Total (R$): 15.000,00 Unidade de Fornecimento: Unidade Local de Entrega (Quantidade): Campus (10)")
+RESPOSTAS_IA = {
+    'enriquecimento': "Nº<--|-->REFERENCIA\n1<--|-->Violão clássico nylon",
+    'extracao': "Nº<--|-->DESCRICAO<--|-->QTDE<--|-->VALOR_UNIT\n1<--|-->Violão clássico<--|-->10<--|-->1500,00",
+}
+
+
+def pdf_texto(caminho: Path, texto: str, paginas: int = 1):
+    with fitz.open() as doc:
+        for _ in range(paginas):
+            doc.new_page().insert_textbox(fitz.Rect(50, 50, 545, 790), texto, fontsize=10)
+        doc.save(caminho)
+
+
+def pdf_escaneado(caminho: Path, paginas: int):
+    """Páginas só com imagem (texto renderizado), sem camada de texto."""
+    with fitz.open() as origem, fitz.open() as doc:
+        origem.new_page().insert_textbox(fitz.Rect(50, 50, 545, 790), TEXTO_EDITAL, fontsize=10)
+        pix = origem[0].get_pixmap(dpi=100)
+        for _ in range(paginas):
+            page = doc.new_page()
+            page.insert_image(page.rect, pixmap=pix)
+        doc.save(caminho)
+
+
+def montar_pastas(raiz: Path, n_pastas: int) -> list[Path]:
+    pastas = []
+    for n in range(1, n_pastas + 1):
+        pasta = raiz / f"pasta_{n}"
+        pasta.mkdir(parents=True)
+        pdf_texto(pasta / "edital.pdf", TEXTO_EDITAL)
+        if n == 2:
+            pdf_escaneado(pasta / "anexo_escaneado.pdf", PAGINAS_ESCANEADAS)
+        else:
+            pdf_texto(pasta / "RelacaoItens.pdf", TEXTO_RELACAO)
+        pastas.append(pasta)
+    return pastas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smoke test do processamento de pastas em paralelo.")
+    parser.add_argument("--pastas", type=int, default=3)
+    parser.add_argument("--timeout", type=int, default=300, help="segundos até considerar a execução travada")
+    parser.add_argument("--manter", action="store_true", help="não apaga a pasta temporária no fim")
+    args = parser.parse_args()
+
+    raiz = Path(tempfile.mkdtemp(prefix="smoke_edital_"))
+    # Caches e traces na pasta temporária (os processos de extração herdam no fork; no spawn usam os padrões)
+    arte_edital.PAGE_CACHE_PATH = raiz / "cache" / "pdf_paginas.sqlite"
+    arte_edital.TRACE_DIR = raiz / "traces"
+    arte_edital.gerar_conteudo_ia = lambda prompt, etapa: RESPOSTAS_IA.get(etapa)
+    pastas = montar_pastas(raiz / "EDITAIS", args.pastas)
+
+    # Travou (ex.: pool de OCR nunca encerrado segurando o pool de extração): mostra as pilhas e sai com erro
+    faulthandler.dump_traceback_later(args.timeout, exit=True)
+    inicio = time.perf_counter()
+    resultados = arte_edital.processar_pastas_em_paralelo(pastas)
+    faulthandler.cancel_dump_traceback_later()
+
+    falhas = [p.name for p in pastas if resultados.get(p, (None, None))[1] is None]
+    # Trace de processo de extração sem o registro 'summary' no fim = encerramento não rodou
+    for trace in Path(arte_edital.TRACE_DIR).glob("arte_edital_extracao_*.jsonl"):
+        ultima = trace.read_text(encoding='utf-8').strip().splitlines()[-1]
+        if json.loads(ultima).get("type") != "summary":
+            falhas.append(trace.name)
+    print(f"\n{len(pastas)} pastas em {time.perf_counter() - inicio:.1f}s; sem resultado: {falhas or 'nenhuma'}.")
+    if not args.manter:
+        shutil.rmtree(raiz, ignore_errors=True)
+    else:
+        print(f"Arquivos em: {raiz}")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
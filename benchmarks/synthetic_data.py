@@ -0,0 +1,159 @@
+"""
+DADOS SINTÉTICOS PARA OS BENCHMARKS (CATÁLOGO + EDITAL)
+=======================================================
+
+Gera, de forma determinística (semente fixa):
+
+- Catálogo no esquema de `produtos_metadados.xlsx` (saída de arte_metadados):
+  ID_PRODUTO, categoria_principal, subcategoria, MARCA, MODELO, VALOR, DESCRICAO.
+- Edital no esquema de `master.xlsx` (saída de arte_edital):
+  Nº, DESCRICAO, REFERENCIA, QTDE, VALOR_UNIT, VALOR_TOTAL, UNID_FORN,
+  LOCAL_ENTREGA, ARQUIVO.
+- Embeddings dos produtos e dos itens (centróide da subcategoria + ruído), para
+  rodar a busca semântica sem o SentenceTransformer.
+
+Cada item do edital é escrito a partir de um produto-alvo do catálogo (o
+gabarito), com preço de referência calculado para que o alvo caia ora no filtro
+de preço inicial, ora só no expandido, ora em nenhum. Assim a cascata de
+matching percorre todas as etapas, como com editais reais.
+
+Executado diretamente, grava catálogos de 1k/10k/100k linhas e um edital em
+SAIDA_DIR (para rodar os scripts do pipeline sobre eles).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAIDA_DIR = os.path.join(REPO_DIR, "benchmarks", "dados_sinteticos")
+
+CATALOG_COLUMNS = ['ID_PRODUTO', 'categoria_principal', 'subcategoria', 'MARCA', 'MODELO', 'VALOR', 'DESCRICAO']
+EDITAL_COLUMNS = ['Nº', 'DESCRICAO', 'REFERENCIA', 'QTDE', 'VALOR_UNIT', 'VALOR_TOTAL', 'UNID_FORN', 'LOCAL_ENTREGA', 'ARQUIVO']
+CATALOG_SIZES = [1_000, 10_000, 100_000]
+N_ITENS_EDITAL = 200
+DIMENSAO = 384
+SEED = 42
+
+TAXONOMIA = {
+    "EQUIPAMENTO_SOM": ["caixa_ativa", "caixa_passiva", "line_array", "subwoofer_ativo", "amplificador_potencia", "monitor_de_palco"],
+    "EQUIPAMENTO_AUDIO": ["microfone_dinamico", "microfone_condensador", "microfone_sem_fio", "mesa_digital", "interface_audio", "fone_monitor"],
+    "INSTRUMENTO_CORDA": ["violao", "guitarra", "contra_baixo", "violino", "cavaquinho"],
+    "INSTRUMENTO_PERCUSSAO": ["bateria_acustica", "surdo_mao", "caixa_guerra", "pandeiro", "cajon", "prato"],
+    "INSTRUMENTO_SOPRO": ["saxofone", "trompete", "trombone", "clarinete", "flauta"],
+    "INSTRUMENTO_TECLADO": ["teclado_digital", "piano_digital", "sintetizador", "controlador_midi"],
+    "ACESSORIO_MUSICAL": ["estante_partitura", "suporte_microfone", "case_bag", "afinador", "cabos_audio", "baqueta"],
+}
+MARCAS = ["Yamaha", "Roland", "Behringer", "Shure", "JBL", "Pearl", "Giannini", "Tagima", "Oneal", "Sennheiser",
+          "Attack", "Nagano", "Michael", "Eagle", "Vogga", "Spanking", "Liverpool", "Torelli", "Csr", "Staner"]
+MATERIAIS = ["madeira maciça", "alumínio anodizado", "aço inoxidável", "ABS de alta resistência", "latão laqueado", "polipropileno"]
+CORES = ["preto", "natural", "branco", "vermelho", "azul", "dourado"]
+CONEXOES = ["XLR", "P10", "USB-C", "Bluetooth 5.0", "MIDI", "RCA", "Speakon"]
+UNIDADES = ["UN", "PC", "CJ", "KIT"]
+LOCAIS = ["Secretaria de Cultura", "Escola Municipal", "Almoxarifado Central", "Fundação Cultural"]
+
+
+def _subcategorias() -> list[tuple[str, str]]:
+    return [(categoria, sub) for categoria, subs in TAXONOMIA.items() for sub in subs]
+
+
+def _especificacoes(rng: np.random.Generator, n: int) -> list[str]:
+    """Frases de especificação com números/medidas (as que o arte_packer preserva)."""
+    potencias = rng.integers(5, 200, n) * 10
+    pesos = np.round(rng.uniform(0.2, 40.0, n), 1)
+    medidas = rng.integers(4, 60, n)
+    materiais = rng.choice(MATERIAIS, n)
+    cores = rng.choice(CORES, n)
+    conexoes = rng.choice(CONEXOES, n)
+    return [
+        f"Potência de {p}W RMS. Peso aproximado de {kg} kg. Medida de {m} polegadas. "
+        f"Construção em {mat}, acabamento {cor}. Conexão {con}. Garantia de 12 meses."
+        for p, kg, m, mat, cor, con in zip(potencias, pesos, medidas, materiais, cores, conexoes)
+    ]
+
+
+def synthetic_catalog(n: int, seed: int = SEED) -> pd.DataFrame:
+    """Catálogo com `n` produtos no esquema de produtos_metadados.xlsx (MODELO é único)."""
+    rng = np.random.default_rng(seed)
+    pares = _subcategorias()
+    escolhidos = rng.integers(0, len(pares), n)
+    marcas = rng.choice(MARCAS, n)
+    specs = _especificacoes(rng, n)
+    # Preço log-normal com nível próprio por subcategoria (acessórios baratos, teclados caros...)
+    nivel = rng.uniform(4.0, 8.0, len(pares))
+    valores = np.round(rng.lognormal(mean=nivel[escolhidos], sigma=0.6), 2)
+    return pd.DataFrame({
+        'ID_PRODUTO': [f"PROD{i:07d}" for i in range(n)],
+        'categoria_principal': [pares[s][0] for s in escolhidos],
+        'subcategoria': [pares[s][1] for s in escolhidos],
+        'MARCA': marcas,
+        'MODELO': [f"{marca[:3].upper()}-{i:06d}" for i, marca in enumerate(marcas)],
+        'VALOR': valores,
+        'DESCRICAO': [f"{pares[s][1].replace('_', ' ').capitalize()} {marca}. {spec}"
+                      for s, marca, spec in zip(escolhidos, marcas, specs)],
+    }, columns=CATALOG_COLUMNS)
+
+
+def synthetic_edital(df_catalog: pd.DataFrame, n: int = N_ITENS_EDITAL, seed: int = SEED) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Edital com `n` itens no esquema de master.xlsx e as posições dos produtos-alvo
+    no catálogo (gabarito). Custo do alvo / VALOR_UNIT fica entre 0.45 e 0.90:
+    parte entra no filtro inicial (60%), parte só no expandido (75%), parte em nenhum.
+    """
+    rng = np.random.default_rng(seed + 1)
+    alvos = rng.choice(len(df_catalog), size=n, replace=len(df_catalog) < n)
+    linhas = df_catalog.iloc[alvos]
+    razao = rng.uniform(0.45, 0.90, n)
+    valor_unit = np.round(linhas['VALOR'].to_numpy(dtype=float) / razao, 2)
+    qtde = rng.integers(1, 20, n)
+    # Metade dos itens cita a marca/modelo de referência; a outra metade só a especificação
+    com_referencia = rng.random(n) < 0.5
+    descricoes = [
+        f"Item {i + 1}: {row.subcategoria.replace('_', ' ')} com as seguintes características mínimas. "
+        f"{row.DESCRICAO.split('. ', 1)[1]}"
+        for i, row in enumerate(linhas.itertuples(index=False))
+    ]
+    df_edital = pd.DataFrame({
+        'Nº': np.arange(1, n + 1),
+        'DESCRICAO': descricoes,
+        'REFERENCIA': [f"{row.MARCA} {row.MODELO} ou similar" if ref else "N/A"
+                       for row, ref in zip(linhas.itertuples(index=False), com_referencia)],
+        'QTDE': qtde,
+        'VALOR_UNIT': valor_unit,
+        'VALOR_TOTAL': np.round(valor_unit * qtde, 2),
+        'UNID_FORN': rng.choice(UNIDADES, n),
+        'LOCAL_ENTREGA': rng.choice(LOCAIS, n),
+        'ARQUIVO': [f"EDITAL_SINTETICO_{i // 50 + 1:03d}" for i in range(n)],
+    }, columns=EDITAL_COLUMNS)
+    return df_edital, alvos
+
+
+def synthetic_embeddings(df_catalog: pd.DataFrame, alvos: np.ndarray, seed: int = SEED,
+                         dim: int = DIMENSAO) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vetores dos produtos (centróide da subcategoria + ruído) e dos itens do edital
+    (vetor do produto-alvo + ruído), no lugar dos gerados pelo SentenceTransformer.
+    """
+    rng = np.random.default_rng(seed + 2)
+    codigos, subs = pd.factorize(df_catalog['subcategoria'])
+    centroides = rng.normal(size=(len(subs), dim)).astype(np.float32)
+    produtos = centroides[codigos] + 0.8 * rng.normal(size=(len(df_catalog), dim)).astype(np.float32)
+    itens = produtos[alvos] + 0.3 * rng.normal(size=(len(alvos), dim)).astype(np.float32)
+    return produtos, itens
+
+
+def main():
+    os.makedirs(SAIDA_DIR, exist_ok=True)
+    for n in CATALOG_SIZES:
+        df_catalog = synthetic_catalog(n)
+        caminho = os.path.join(SAIDA_DIR, f"produtos_metadados_{n // 1000}k.xlsx")
+        df_catalog.to_excel(caminho, index=False)
+        print(f"Catálogo com {n} produtos salvo em: {caminho}")
+        df_edital, _ = synthetic_edital(df_catalog)
+        caminho = os.path.join(SAIDA_DIR, f"master_{n // 1000}k.xlsx")
+        df_edital.to_excel(caminho, index=False)
+        print(f"Edital com {len(df_edital)} itens salvo em: {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,15 @@ from pathlib import Path
 import shutil
 from io import StringIO, BytesIO
 import base64
+import math
+import random
 import time
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import pandas as pd
 import fitz  # PyMuPDF
 import zipfile
 import rarfile
-from pdf2image import convert_from_path
 import pytesseract
 import requests
 import json
@@ -33,7 +36,6 @@ FINAL_MASTER_PATH = BASE_DIR / "master.xlsx"
 
 # --- Configurações de Ferramentas Externas ---
 SCRIPTS_DIR = PROJECT_ROOT / "scripts"
-POPLER_PATH = SCRIPTS_DIR / "Release-25.07.0-0" / "poppler-25.07.0" / "Library" / "bin"
 TESSERACT_CMD = SCRIPTS_DIR / "Tesseract-OCR" / "tesseract.exe"
 pytesseract.pytesseract.tesseract_cmd = str(TESSERACT_CMD)
 UNRAR_CMD = SCRIPTS_DIR / "unrar" / "UnRAR.exe"
@@ -57,9 +59,25 @@ if not API_KEY:
 
 # --- Configurações do Processamento ---
 MAX_RETRIES = 3
-DELAY_BETWEEN_RETRIES = 5  # segundos
+DELAY_BETWEEN_RETRIES = 5  # segundos (base do backoff exponencial com jitter)
+MAX_DELAY_BETWEEN_RETRIES = 60  # segundos
 MAX_TOKENS = 4096
 TIMEOUT = 300  # segundos
+MAX_PAGINAS_SIMULTANEAS = 8  # Páginas de um PDF enviadas ao mesmo tempo (e renderizadas à frente)
+
+# Sessão HTTP compartilhada pelas threads de página: conexões reaproveitadas com o OpenRouter
+SESSION = requests.Session()
+SESSION.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PAGINAS_SIMULTANEAS))
+
+# --- Renderização das Páginas ---
+# Uma página por vez (fitz), limitada por área em pixels, já comprimida para o envio.
+RENDER_MAX_DPI = 200
+RENDER_MAX_PIXELS = 2_500_000  # ~A4 a 165 dpi; páginas maiores (A3, plantas) são reduzidas
+IMAGE_FORMAT = "JPEG"  # "JPEG" ou "WEBP"
+IMAGE_MIME = f"image/{IMAGE_FORMAT.lower()}"
+IMAGE_QUALITY = 80
+IMAGE_MIN_QUALITY = 50
+MAX_IMAGE_MB = 20.0  # Limite da API por imagem (já em base64)
 
 # --- Configurações de Filtro ---
 PALAVRAS_CHAVE = [
@@ -153,59 +171,69 @@ REGEX_EXCECAO = re.compile('|'.join(PALAVRAS_EXCECAO), re.IGNORECASE)
 # 2. FUNÇÕES DE PROCESSAMENTO DE IMAGENS
 # =====================================================================================
 
-def pdf_to_base64_images(pdf_path: Path) -> list[str]:
+def codificar_imagem(imagem: Image.Image, max_size_mb: float = MAX_IMAGE_MB) -> str:
     """
-    Converte cada página de um PDF em uma imagem codificada em base64.
+    Comprime a imagem em IMAGE_FORMAT e devolve o base64. Se passar do limite,
+    reduz a qualidade até IMAGE_MIN_QUALITY e, depois, a resolução.
     """
-    images_base64 = []
-    print(f"    > Convertendo PDF para imagens: {pdf_path.name}")
-    try:
-        images = convert_from_path(pdf_path, dpi=200, poppler_path=POPLER_PATH)
-        for i, img in enumerate(images):
-            print(f"      - Processando página {i+1}/{len(images)}...")
-            buffered = BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            images_base64.append(img_str)
-        print("      - ✅ PDF convertido para imagens com sucesso.")
-        return images_base64
-    except Exception as e:
-        print(f"      - ❌ ERRO: Falha ao converter PDF {pdf_path.name} para imagens: {e}")
-        return []
+    limite = max_size_mb * 1024 * 1024
+    qualidade = IMAGE_QUALITY
+    while True:
+        buffered = BytesIO()
+        imagem.save(buffered, format=IMAGE_FORMAT, quality=qualidade)
+        tamanho_b64 = 4 * math.ceil(buffered.tell() / 3)
+        if tamanho_b64 <= limite or min(imagem.size) <= 256:
+            return base64.b64encode(buffered.getbuffer()).decode("utf-8")
+        if qualidade > IMAGE_MIN_QUALITY:
+            qualidade = max(IMAGE_MIN_QUALITY, qualidade - 15)
+            continue
+        fator = 0.9 * (limite / tamanho_b64) ** 0.5
+        imagem = imagem.resize(tuple(max(1, int(dim * fator)) for dim in imagem.size), Image.Resampling.LANCZOS)
 
-def resize_image_if_needed(image_base64: str, max_size_mb: float = 20.0) -> str:
+def renderizar_paginas(pdf_path: Path) -> Iterator[tuple[int, int, str]]:
     """
-    Redimensiona a imagem se ela exceder o tamanho máximo especificado.
+    Renderiza o PDF uma página por vez e gera (nº da página, total de páginas, imagem em base64).
+    A escala vem de RENDER_MAX_DPI limitada a RENDER_MAX_PIXELS, então a memória não cresce
+    com o número de páginas: só a página atual fica em memória enquanto o consumidor a usa.
     """
-    # Decodifica a string base64
-    image_data = base64.b64decode(image_base64)
-    image_size_mb = len(image_data) / (1024 * 1024)
-    
-    if image_size_mb <= max_size_mb:
-        return image_base64
-    
-    # Carrega a imagem
-    image = Image.open(BytesIO(image_data))
-    
-    # Calcula o fator de redução necessário
-    reduction_factor = (max_size_mb / image_size_mb) ** 0.5
-    new_size = tuple(int(dim * reduction_factor) for dim in image.size)
-    
-    # Redimensiona a imagem
-    resized_image = image.resize(new_size, Image.Resampling.LANCZOS)
-    
-    # Converte de volta para base64
-    buffered = BytesIO()
-    resized_image.save(buffered, format=image.format or "PNG", quality=85)
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    print(f"    > Renderizando páginas: {pdf_path.name}")
+    try:
+        doc = fitz.open(pdf_path)
+    except Exception as e:
+        print(f"      - ❌ ERRO: Falha ao abrir o PDF {pdf_path.name}: {e}")
+        return
+    with doc:
+        total = len(doc)
+        for i, page in enumerate(doc):
+            area_pontos = abs(page.rect) or 1.0
+            zoom = min(RENDER_MAX_DPI / 72, (RENDER_MAX_PIXELS / area_pontos) ** 0.5)
+            try:
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+                imagem = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+                del pix
+                imagem_base64 = codificar_imagem(imagem)
+            except Exception as e:
+                print(f"      - ⚠️ Falha ao renderizar a página {i + 1}/{total}: {e}")
+                continue
+            print(f"      - Página {i + 1}/{total}: {imagem.width}x{imagem.height}, {len(imagem_base64) / 1024:.0f} KB")
+            del imagem
+            yield i + 1, total, imagem_base64
 
 # =====================================================================================
 # 3. FUNÇÕES DE INTERAÇÃO COM A API
 # =====================================================================================
 
-def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
+def espera_retentativa(tentativa: int, response=None) -> float:
+    """Segundos até a próxima tentativa: Retry-After do servidor, se houver; senão backoff exponencial com jitter."""
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(float(retry_after), MAX_DELAY_BETWEEN_RETRIES)
+    return min(DELAY_BETWEEN_RETRIES * 2 ** tentativa, MAX_DELAY_BETWEEN_RETRIES) * random.uniform(0.5, 1.0)
+
+def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None, rotulo: str = "") -> str:
     """
     Tenta gerar conteúdo usando diferentes modelos de linguagem com suporte a imagens.
+    Seguro para threads; `rotulo` (ex.: a página) prefixa as mensagens.
     """
     headers = {
         "Authorization": f"Bearer {API_KEY}",
@@ -213,7 +241,7 @@ def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
     }
 
     for nome_modelo in LLM_MODELS_FALLBACK:
-        print(f"Tentando modelo: {nome_modelo}")
+        print(f"{rotulo}Tentando modelo: {nome_modelo}")
         
         messages = [{"role": "user", "content": []}]
         
@@ -228,7 +256,7 @@ def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
             messages[0]["content"].append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{image_base64}",
+                    "url": f"data:{IMAGE_MIME};base64,{image_base64}",
                     "detail": "high"
                 }
             })
@@ -243,7 +271,7 @@ def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
 
         for tentativa in range(MAX_RETRIES):
             try:
-                response = requests.post(
+                response = SESSION.post(
                     "https://openrouter.ai/api/v1/chat/completions",
                     headers=headers,
                     json=payload,
@@ -252,9 +280,9 @@ def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
 
                 if response.status_code == 429:  # Rate limit
                     if tentativa < MAX_RETRIES - 1:
-                        time.sleep(DELAY_BETWEEN_RETRIES)
+                        time.sleep(espera_retentativa(tentativa, response))
                         continue
-                    print(f"   - Rate limit excedido para o modelo '{nome_modelo}'. Tentando o próximo.")
+                    print(f"{rotulo}   - Rate limit excedido para o modelo '{nome_modelo}'. Tentando o próximo.")
                     break
 
                 response.raise_for_status()
@@ -262,106 +290,159 @@ def gerar_conteudo_com_fallback(prompt: str, image_base64: str = None) -> str:
                 
                 content = response_json.get('choices', [{}])[0].get('message', {}).get('content')
                 if not content:
-                    print(f"API retornou resposta vazia para o modelo {nome_modelo}.")
+                    print(f"{rotulo}API retornou resposta vazia para o modelo {nome_modelo}.")
                     continue
 
-                print(f"   - Sucesso com o modelo '{nome_modelo}'.")
+                print(f"{rotulo}   - Sucesso com o modelo '{nome_modelo}'.")
                 return content
 
             except requests.exceptions.RequestException as e:
-                print(f"Erro de requisição com o modelo '{nome_modelo}': {e}")
+                print(f"{rotulo}Erro de requisição com o modelo '{nome_modelo}': {e}")
                 if tentativa < MAX_RETRIES - 1:
-                    time.sleep(DELAY_BETWEEN_RETRIES)
+                    time.sleep(espera_retentativa(tentativa, getattr(e, 'response', None)))
                     continue
                 break
             except Exception as e:
-                print(f"Erro inesperado e crítico com o modelo '{nome_modelo}': {e}")
+                print(f"{rotulo}Erro inesperado e crítico com o modelo '{nome_modelo}': {e}")
                 break
 
-    print("FALHA TOTAL: Todos os modelos multimodais na lista de fallback falharam.")
+    print(f"{rotulo}FALHA TOTAL: Todos os modelos multimodais na lista de fallback falharam.")
     return None
 
 # =====================================================================================
 # 4. FUNÇÕES DE PROCESSAMENTO DE DOCUMENTOS
 # =====================================================================================
 
+PROMPT_PAGINA = """
+Você é um assistente especializado em extrair informações de editais de licitação.
+
+Analise a imagem da página de um edital de licitação e extraia TODOS os itens que estão sendo licitados.
+Para cada item encontrado, extraia:
+
+1. Número do item
+2. Descrição completa e detalhada
+3. Quantidade
+4. Valor unitário
+5. Unidade de fornecimento
+6. Local de entrega (se disponível)
+
+Retorne no seguinte formato usando '<--|-->' como separador:
+Nº<--|-->DESCRICAO<--|-->QTDE<--|-->VALOR_UNIT<--|-->UNID_FORN<--|-->LOCAL_ENTREGA
+
+Exemplo:
+1<--|-->Violão Clássico Acústico<--|-->10<--|-->1500,00<--|-->Unidade<--|-->Campus São Paulo
+
+IMPORTANTE:
+- Retorne APENAS os dados no formato especificado
+- NÃO inclua textos explicativos ou informações adicionais
+- Se alguma informação não estiver disponível, deixe o campo vazio mas mantenha os separadores
+- Inclua TODOS os itens visíveis na imagem
+- Certifique-se de capturar a descrição detalhada completa de cada item
+"""
+
+def extrair_linhas_pagina(conteudo: str) -> list[dict]:
+    """Linhas no formato Nº<--|-->DESCRICAO<--|-->... da resposta do modelo (sem filtro de relevância)."""
+    linhas = []
+    for linha in conteudo.strip().split('\n'):
+        if not linha or '<--|-->' not in linha:
+            continue
+        campos = [campo.strip() for campo in linha.split('<--|-->')]
+        if len(campos) != 6:
+            continue
+        num, desc, qtd, val_unit, unid, local = campos
+        linhas.append({
+            "Nº": num,
+            "DESCRICAO": desc,
+            "QTDE": qtd,
+            "VALOR_UNIT": val_unit,
+            "UNID_FORN": unid,
+            "LOCAL_ENTREGA": local
+        })
+    return linhas
+
+def mesclar_itens_entre_paginas(paginas: list[list[dict] | None]) -> list[dict]:
+    """
+    Junta as linhas das páginas, na ordem. Um item quebrado na virada de página aparece
+    como a primeira linha da página seguinte sem número ou com o mesmo número da última
+    linha da anterior: as duas viram um item só (descrição concatenada, campos vazios
+    preenchidos). Páginas que falharam (None) interrompem a continuidade.
+    """
+    itens = []
+    anterior = None  # Última linha da página anterior
+    for linhas in paginas:
+        if not linhas:
+            anterior = None
+            continue
+        primeira, *demais = linhas
+        if anterior is not None and primeira["Nº"] in ("", anterior["Nº"]):
+            if primeira["DESCRICAO"] and primeira["DESCRICAO"] not in anterior["DESCRICAO"]:
+                anterior["DESCRICAO"] = f"{anterior['DESCRICAO']} {primeira['DESCRICAO']}".strip()
+            for campo, valor in primeira.items():
+                if valor and not anterior[campo]:
+                    anterior[campo] = valor
+        else:
+            itens.append(primeira)
+        itens.extend(demais)
+        anterior = itens[-1]
+    return itens
+
+def processar_pagina(num_pagina: int, total_paginas: int, imagem_base64: str) -> tuple[list[dict] | None, float]:
+    """Envia uma página ao modelo multimodal. Retorna (linhas extraídas ou None se falhou, segundos)."""
+    inicio = time.perf_counter()
+    conteudo = gerar_conteudo_com_fallback(PROMPT_PAGINA, imagem_base64, rotulo=f"[Página {num_pagina}/{total_paginas}] ")
+    if not conteudo:
+        print(f"Falha ao processar página {num_pagina}.")
+        return None, time.perf_counter() - inicio
+    return extrair_linhas_pagina(conteudo), time.perf_counter() - inicio
+
 def processar_pdf_direto(pdf_path: Path) -> list[dict]:
     """
-    Processa um PDF diretamente usando modelos multimodais, página por página.
+    Processa um PDF diretamente usando modelos multimodais. As páginas são renderizadas
+    sob demanda e enviadas em paralelo (até MAX_PAGINAS_SIMULTANEAS por vez); as linhas
+    são remontadas na ordem das páginas, juntando itens quebrados entre páginas.
     """
     print(f"Processando PDF: {pdf_path.name}")
-    itens_encontrados = []
-    
-    # Converte PDF para lista de imagens em base64
-    imagens_base64 = pdf_to_base64_images(pdf_path)
-    if not imagens_base64:
+    inicio = time.perf_counter()
+    linhas_por_pagina: dict[int, list[dict] | None] = {}
+    duracoes = []
+    total_paginas = 0
+    em_andamento = {}
+
+    def coletar(futures):
+        for future in futures:
+            num_pagina = em_andamento.pop(future)
+            try:
+                linhas, duracao = future.result()
+            except Exception as e:
+                print(f"Erro inesperado na página {num_pagina}: {e}")
+                linhas, duracao = None, 0.0
+            linhas_por_pagina[num_pagina] = linhas
+            duracoes.append(duracao)
+
+    with ThreadPoolExecutor(max_workers=MAX_PAGINAS_SIMULTANEAS) as executor:
+        # Só MAX_PAGINAS_SIMULTANEAS imagens ficam em memória: a próxima página é renderizada quando uma termina
+        for num_pagina, total_paginas, imagem_base64 in renderizar_paginas(pdf_path):
+            if len(em_andamento) >= MAX_PAGINAS_SIMULTANEAS:
+                concluidas, _ = wait(em_andamento, return_when=FIRST_COMPLETED)
+                coletar(concluidas)
+            em_andamento[executor.submit(processar_pagina, num_pagina, total_paginas, imagem_base64)] = num_pagina
+        coletar(wait(em_andamento).done)
+
+    if not linhas_por_pagina:
         print("Falha ao converter PDF para imagens.")
         return []
-    
-    # Processa cada página do PDF
-    for num_pagina, imagem_base64 in enumerate(imagens_base64, 1):
-        print(f"Processando página {num_pagina}/{len(imagens_base64)}...")
-        
-        # Redimensiona a imagem se necessário
-        imagem_base64 = resize_image_if_needed(imagem_base64)
-        
-        # Gera o prompt para extração
-        prompt = f"""
-        Você é um assistente especializado em extrair informações de editais de licitação.
-        
-        Analise a imagem da página de um edital de licitação e extraia TODOS os itens que estão sendo licitados.
-        Para cada item encontrado, extraia:
-        
-        1. Número do item
-        2. Descrição completa e detalhada
-        3. Quantidade
-        4. Valor unitário
-        5. Unidade de fornecimento
-        6. Local de entrega (se disponível)
-
-        Retorne no seguinte formato usando '<--|-->' como separador:
-        Nº<--|-->DESCRICAO<--|-->QTDE<--|-->VALOR_UNIT<--|-->UNID_FORN<--|-->LOCAL_ENTREGA
-
-        Exemplo:
-        1<--|-->Violão Clássico Acústico<--|-->10<--|-->1500,00<--|-->Unidade<--|-->Campus São Paulo
-        
-        IMPORTANTE:
-        - Retorne APENAS os dados no formato especificado
-        - NÃO inclua textos explicativos ou informações adicionais
-        - Se alguma informação não estiver disponível, deixe o campo vazio mas mantenha os separadores
-        - Inclua TODOS os itens visíveis na imagem
-        - Certifique-se de capturar a descrição detalhada completa de cada item
-        """
-        
-        # Obtém o conteúdo da página usando modelo multimodal
-        conteudo = gerar_conteudo_com_fallback(prompt, imagem_base64)
-        if not conteudo:
-            print(f"Falha ao processar página {num_pagina}.")
-            continue
-        
-        # Processa os itens encontrados
-        for linha in conteudo.strip().split('\n'):
-            if not linha or '<--|-->' not in linha:
-                continue
-                
-            campos = linha.split('<--|-->')
-            if len(campos) != 6:
-                continue
-                
-            num, desc, qtd, val_unit, unid, local = campos
-            
-            # Verifica se o item é relevante usando os filtros existentes
-            if REGEX_FILTRO.search(desc) and not REGEX_EXCLUIR.search(desc):
-                item = {
-                    "Nº": num,
-                    "DESCRICAO": desc,
-                    "QTDE": qtd,
-                    "VALOR_UNIT": val_unit,
-                    "UNID_FORN": unid,
-                    "LOCAL_ENTREGA": local
-                }
-                itens_encontrados.append(item)
-    
+
+    # Ordem das páginas, não a de conclusão; páginas que não renderizaram contam como falha
+    paginas = [linhas_por_pagina.get(n) for n in range(1, total_paginas + 1)]
+    itens_encontrados = [
+        item for item in mesclar_itens_entre_paginas(paginas)
+        # Verifica se o item é relevante usando os filtros existentes
+        if REGEX_FILTRO.search(item["DESCRICAO"]) and not REGEX_EXCLUIR.search(item["DESCRICAO"])
+    ]
+
+    falhas = sum(1 for linhas in paginas if linhas is None)
+    print(f"{total_paginas} página(s) em {time.perf_counter() - inicio:.1f}s "
+          f"(página mais lenta: {max(duracoes):.1f}s, soma das páginas: {sum(duracoes):.1f}s, falhas: {falhas}).")
     print(f"Total de itens relevantes encontrados: {len(itens_encontrados)}")
     return itens_encontrados
 
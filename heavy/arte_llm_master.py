@@ -1,13 +1,11 @@
 import pandas as pd
 import numpy as np
 import os
-import time
 import json
 import logging
 from dotenv import load_dotenv
 import joblib
 import google.generativeai as genai
-import google.api_core.exceptions as google_exceptions
 import sys
 import torch
 from concurrent.futures import ThreadPoolExecutor, as_completed  # Para paralelização das chamadas LLM
@@ -23,7 +21,20 @@ from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, classification_report
 
 # Sentence-Transformers para busca semântica
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import SentenceTransformer
+
+# Módulos compartilhados do pipeline (arte_code/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arte_code"))
+from arte_catalog import CatalogIndex
+from arte_ann import FilteredAnnIndex
+from arte_hybrid import BM25CatalogIndex, HybridRetriever
+from arte_embeddings import EmbeddingStore, QuantizedEmbeddings
+from arte_dedup import group_items
+from arte_store import DebouncedExport, ResultStore, result_key
+from arte_limiter import ModelRateLimiter
+from arte_llm import GeminiBackend, LLMClient, TIER_LITE, TIER_STANDARD, llm_calls_in_thread
+from arte_llm_replay import backend_from_env
+import arte_trace
 
 # =====================================================================
 # CONFIGURAÇÕES E CONSTANTES
@@ -34,12 +45,16 @@ BASE_DIR = r"C:\Users\pietr\OneDrive\.vscode\arte_"  # Ajuste conforme seu ambie
 CAMINHO_EDITAL = os.path.join(BASE_DIR, "DOWNLOADS", "master.xlsx")
 CAMINHO_BASE_PRODUTOS = os.path.join(BASE_DIR, "DOWNLOADS", "METADADOS", "produtos_metadados.xlsx")
 CAMINHO_SAIDA = os.path.join(BASE_DIR, "DOWNLOADS", "master_otimizado.xlsx")
+CAMINHO_RESULT_STORE = os.path.join(BASE_DIR, "DOWNLOADS", "master_otimizado.sqlite")  # Resultados gravados item a item
+EXCEL_EXPORT_INTERVAL_SECONDS = 300  # Exporta a planilha estilizada no máximo a cada N segundos (0 = só no fim)
 
 # --- ML Models & Precomputed Data Paths ---
 MODELS_DIR = os.path.join(BASE_DIR, "machine_learning", "ml_models")
 CLASSIFIER_PATH = os.path.join(MODELS_DIR, "subcategory_classifier.joblib")
-EMBEDDINGS_PATH = os.path.join(MODELS_DIR, "product_embeddings.npy")
-EMBEDDINGS_DATA_PATH = os.path.join(MODELS_DIR, "product_embeddings_data.pkl")
+EMBEDDING_STORE_DIR = os.path.join(MODELS_DIR, "product_embeddings")  # Vetores + metadados por hash de conteúdo
+ANN_INDEX_DIR = os.path.join(MODELS_DIR, "ann_index")  # Grafo HNSW persistente (se hnswlib estiver instalado)
+BM25_INDEX_DIR = os.path.join(MODELS_DIR, "bm25_index")  # Índice invertido BM25 (modo híbrido)
+EMBEDDING_QUANTIZATION = 'int8'  # 'int8' (4x menor), 'float16' (2x menor) ou 'float32' (matriz original na RAM)
 # Nova variável para o modelo Sentence Transformer
 SENTENCE_TRANSFORMER_MODEL = 'paraphrase-multilingual-MiniLM-L12-v2'
 
@@ -48,9 +63,14 @@ PROFIT_MARGIN = 0.47  # Margem de lucro
 PRICE_FILTER_PERCENTAGE = 0.67  # Custo do fornecedor não pode exceder 75% do valor de referência do edital
 
 # --- ML & AI Parameters ---
+ITEM_ENCODE_BATCH_SIZE = 64  # Itens do edital codificados por lote antes da fase LLM
 SEMANTIC_SEARCH_TOP_K = 15  # Nº de candidatos que a busca semântica vai levantar para o LLM (aumentado ligeiramente)
 MIN_COMPATIBILITY_SCORE_FOR_MATCH = 90  # Score mínimo para ser considerado um "Match Encontrado"
 CRITICAL_FAILURE_SCORE = 20.0  # Score máximo se houver uma "FALHA CRÍTICA"
+# "cascata": subcategoria ML -> categoria via LLM -> base inteira (até 4 chamadas LLM por item)
+# "hibrido": BM25 + embeddings fundidos por RRF numa única lista (1 chamada LLM por item)
+RETRIEVAL_MODE = "cascata"
+HYBRID_CANDIDATES = 20  # Candidatos da lista fundida enviados ao LLM
 
 # --- AI Model Configuration ---
 # Usaremos Gemini pela robustez e estabilidade, como discutido.
@@ -65,12 +85,17 @@ LLM_MODELS_FALLBACK = [
     "gemini-2.5-flash",
     
 ]
-LLM_MAX_RETRIES = 3  # Tentativas para cada chamada LLM
+LLM_MAX_RETRIES = 3  # Rodadas pela lista de modelos quando todos falham
 LLM_TIMEOUT = 180  # Segundos
+MATCH_LLM_TIER = TIER_STANDARD  # Nível mínimo de qualidade para o julgamento do match
+CATEGORY_LLM_TIER = TIER_LITE  # Nível mínimo para a escolha da categoria principal
 MAX_LLM_CONCURRENT_CALLS = 5  # Número de chamadas LLM que podem rodar em paralelo
+# Orçamento por modelo (sobrescreve os padrões de arte_limiter). Ex.: {"gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000}}
+LLM_RATE_LIMITS = {}
 
 # --- Logging Configuration ---
 LOG_FILE = os.path.join(BASE_DIR, "LOGS", "arte_otimizado.log")
+TRACE_DIR = os.path.join(BASE_DIR, "LOGS", "traces")  # Trace JSONL por execução (spans, chamadas LLM, tokens)
 os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)  # Garante que a pasta de logs exista
 logging.basicConfig(
     level=logging.INFO,
@@ -82,44 +107,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Modelos em cache, disjuntor por modelo e rota pelo mais rápido saudável do nível pedido
+# As threads do executor (e outros scripts com a mesma chave) dividem o orçamento RPM/TPM
+LLM_CLIENT = LLMClient(backend_from_env(GeminiBackend), LLM_MODELS_FALLBACK, max_rounds=LLM_MAX_RETRIES,
+                       rate_limiter=ModelRateLimiter.shared("GOOGLE_API_KEY", LLM_RATE_LIMITS))
+
 # =====================================================================
 # FUNÇÕES DE IA (ADAPTADAS E OTIMIZADAS)
 # =====================================================================
 
-def gerar_conteudo_com_fallback(prompt: str, modelos: list[str]) -> str | None:
-    """Tenta gerar conteúdo usando uma lista de modelos em ordem de preferência."""
-    for nome_modelo in modelos:
-        for attempt in range(LLM_MAX_RETRIES):
-            try:
-                logger.info(f"   - Tentando (tentativa {attempt+1}/{LLM_MAX_RETRIES}) modelo '{nome_modelo}'...")
-                model = genai.GenerativeModel(nome_modelo)
-                response = model.generate_content(prompt, request_options={"timeout": LLM_TIMEOUT})
-                
-                # Verifica se a resposta contém partes válidas
-                if not response.parts:
-                    finish_reason = response.candidates[0].finish_reason.name if response.candidates else 'N/A'
-                    logger.warning(f"   - ❌ Resposta vazia do modelo '{nome_modelo}'. Motivo: {finish_reason}.")
-                    if attempt == LLM_MAX_RETRIES - 1:  # Se for a última tentativa, falha
-                        break  # Sai do loop de tentativas para este modelo
-                    else:  # Se não for a última, tenta novamente
-                        time.sleep(2 * (attempt + 1))  # Espera antes de re-tentar
-                        continue
-                logger.info(f"   - Sucesso com o modelo '{nome_modelo}'.")
-                return response.text
-            except google_exceptions.ResourceExhausted as e:
-                logger.warning(f"- Cota excedida para o modelo '{nome_modelo}'. Tentando o próximo da lista.")
-                time.sleep(5)
-                break  # Sai do loop de tentativas e passa para o próximo modelo
-            except Exception as e:
-                logger.error(f"   - ❌ Erro inesperado com o modelo '{nome_modelo}': {e}")
-                if attempt == LLM_MAX_RETRIES - 1:
-                    break
-                else:
-                    time.sleep(2 * (attempt + 1))
-                    continue
-    logger.error("   - ❌ FALHA TOTAL: Todos os modelos e tentativas falharam.")
-    return None
-
 def get_best_match_from_ai(item_edital_dict: dict, df_candidates: pd.DataFrame):
     """
     Usa o modelo de IA para encontrar o melhor match e calcular um score de compatibilidade,
@@ -222,7 +218,7 @@ def get_best_match_from_ai(item_edital_dict: dict, df_candidates: pd.DataFrame):
 
 JSON:
 """
-    response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+    response_text = LLM_CLIENT.generate(prompt, min_tier=MATCH_LLM_TIER, request_options={"timeout": LLM_TIMEOUT})
     if response_text:
         try:
             cleaned_response = response_text.strip().replace("```json", "").replace("```", "").strip()
@@ -282,38 +278,16 @@ def train_classifier(df_path: str, classifier_save_path: str):
     logger.info("Treinamento concluído e modelo salvo.")
     return classifier_pipeline
 
-def generate_embeddings(df_path: str, embeddings_save_path: str, data_save_path: str):
+def sync_product_embeddings(df_products_base: pd.DataFrame, st_model) -> tuple[np.ndarray | QuantizedEmbeddings, pd.DataFrame]:
     """
-    Gera e salva os embeddings de texto para todas as descrições de produtos
-    usando um modelo SentenceTransformer. Inclui 'categoria_principal' se presente.
+    Atualiza o armazenamento de embeddings da base e retorna (vetores, metadados)
+    alinhados às linhas de `df_products_base`. Só os produtos novos ou alterados
+    (hash de ID_PRODUTO + DESCRICAO) são codificados; os removidos são descartados.
+    Fora de float32, os vetores vêm quantizados em memmap (EMBEDDING_QUANTIZATION).
     """
-    logger.info("Iniciando geração de embeddings semânticos para os produtos...")
-    df = pd.read_excel(df_path)
-    df.dropna(subset=['DESCRICAO'], inplace=True)
-    df.rename(columns={'DESCRICAO': 'DESCRICAO_FORNECEDOR'}, inplace=True)  # Padroniza nome da coluna
-    df['DESCRICAO_FORNECEDOR'] = df['DESCRICAO_FORNECEDOR'].astype(str)
-
-    logger.info(f"Carregando o modelo Sentence Transformer '{SENTENCE_TRANSFORMER_MODEL}'...")
-    model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
-
-    logger.info(f"Gerando embeddings para {len(df)} descrições de produtos...")
-    df['VALOR'] = pd.to_numeric(df['VALOR'], errors='coerce').fillna(0)
-    
-    embeddings = model.encode(df['DESCRICAO_FORNECEDOR'].tolist(), convert_to_tensor=True, show_progress_bar=True)
-
-    logger.info(f"Salvando embeddings em: {embeddings_save_path}")
-    np.save(embeddings_save_path, embeddings.cpu().numpy())
-    
-    # Salva apenas as colunas necessárias para o contexto de busca
-    cols_to_save = ['DESCRICAO_FORNECEDOR', 'subcategoria', 'MARCA', 'MODELO', 'VALOR']
-    if 'categoria_principal' in df.columns:
-        cols_to_save.append('categoria_principal')
-    
-    df_to_save = df[[col for col in cols_to_save if col in df.columns]].copy()
-    df_to_save.to_pickle(data_save_path)
-    
-    logger.info(f"Dados dos embeddings salvos em: {data_save_path}")
-    logger.info("Geração de embeddings concluída.")
+    store = EmbeddingStore(EMBEDDING_STORE_DIR, SENTENCE_TRANSFORMER_MODEL)
+    encode = lambda textos: st_model.encode(textos, batch_size=ITEM_ENCODE_BATCH_SIZE, show_progress_bar=True)
+    return store.sync(df_products_base, encode, quantization=EMBEDDING_QUANTIZATION)
 
 # =====================================================================
 # FUNÇÕES AUXILIARES E DE PÓS-PROCESSAMENTO
@@ -374,6 +348,7 @@ def get_rainbow_color(score: float) -> PatternFill:
     else: hex_color = red  # Vermelho para scores muito baixos ou críticos
     return PatternFill(start_color=hex_color, end_color=hex_color, fill_type='solid')
 
+@arte_trace.traced('excel')
 def save_styled_excel(file_path: str, df: pd.DataFrame, output_cols: list):
     """
     Salva o DataFrame final em um arquivo Excel, aplicando formatação de cores
@@ -404,10 +379,42 @@ def save_styled_excel(file_path: str, df: pd.DataFrame, output_cols: list):
 # PIPELINE PRINCIPAL DE PROCESSAMENTO DO ITEM
 # =====================================================================
 
-def process_item(item_edital_row, df_products_base, classifier, st_model, product_embeddings_data, product_embeddings_tensor, main_categories_list):
-    """Processa um único item do edital através do pipeline de ML e LLM."""
+def encode_items(st_model, texts: list[str]) -> torch.Tensor:
+    """Codifica as descrições dos itens em lotes (uma passada por lote, em vez de uma por item e etapa)."""
+    logger.info(f"Codificando {len(texts)} itens do edital em lotes de {ITEM_ENCODE_BATCH_SIZE}...")
+    return st_model.encode(texts, batch_size=ITEM_ENCODE_BATCH_SIZE, convert_to_tensor=True, show_progress_bar=False)
+
+def match_row_update(match: dict, status: str) -> dict:
+    """Colunas do resultado preenchidas a partir de um best_match/closest_match da IA."""
+    cost_price = pd.to_numeric(match.get('Valor'), errors='coerce')
+    analise_compat_obj = match.get('Compatibilidade_analise', {})
+    return {
+        'STATUS': status,
+        'MARCA_SUGERIDA': match.get('Marca'),
+        'MODELO_SUGERIDO': match.get('Modelo'),
+        'DESCRICAO_FORNECEDOR': match.get('Descricao_fornecedor'),
+        'CUSTO_FORNECEDOR': cost_price,
+        'PRECO_FINAL_VENDA': cost_price * (1 + PROFIT_MARGIN) if pd.notna(cost_price) else 0.0,
+        'COMPATIBILITY_SCORE': calculate_compatibility_score(analise_compat_obj),
+        'ANALISE_COMPATIBILIDADE': json.dumps(analise_compat_obj, ensure_ascii=False)
+    }
+
+@arte_trace.traced()
+def process_item(item_edital_row, catalog: CatalogIndex, classifier, st_model, ann_index: FilteredAnnIndex, main_categories_list, item_embedding=None,
+                 retriever: HybridRetriever | None = None):
+    """
+    Processa um único item do edital através do pipeline de ML e LLM.
+    `item_embedding` é a linha do item na matriz codificada em lote por `encode_items`
+    (uma view do tensor, sem cópia); sem ela, o item é codificado aqui uma única vez.
+    Com `retriever` (RETRIEVAL_MODE = "hibrido"), as etapas 2 a 4 viram uma única
+    lista fundida (BM25 + embeddings) e uma única chamada LLM.
+    """
     item_edital_dict = item_edital_row.to_dict()
+    arte_trace.annotate(item=item_edital_dict.get('Nº'), arquivo=item_edital_dict.get('ARQUIVO'))
     item_desc = str(item_edital_dict['DESCRICAO'])
+    if item_embedding is None:
+        item_embedding = st_model.encode(item_desc, convert_to_tensor=True)
+    item_vector = item_embedding.cpu().numpy()
     valor_unit_edital = pd.to_numeric(item_edital_dict.get('VALOR_UNIT'), errors='coerce')
     
     final_row_data = {
@@ -419,15 +426,43 @@ def process_item(item_edital_row, df_products_base, classifier, st_model, produc
         'LAST_UPDATE': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
 
-    df_price_filtered = df_products_base.copy()
+    # Filtro de preço por busca binária no catálogo: apenas posições, sem cópia da base
+    max_cost = None
     if pd.notna(valor_unit_edital) and valor_unit_edital > 0:
         max_cost = valor_unit_edital * PRICE_FILTER_PERCENTAGE
-        df_price_filtered = df_products_base[df_products_base['VALOR'] <= max_cost].copy()
-        if df_price_filtered.empty:
-            logger.warning(f"Item {item_edital_dict['Nº']}: Nenhum produto na base atende ao critério de preço inicial (custo <= R${max_cost:.2f}).")
-            final_row_data['STATUS'] = 'Nenhum Produto com Margem'
+    price_positions = catalog.price_positions(max_cost)
+    if max_cost is not None and len(price_positions) == 0:
+        logger.warning(f"Item {item_edital_dict['Nº']}: Nenhum produto na base atende ao critério de preço inicial (custo <= R${max_cost:.2f}).")
+        final_row_data['STATUS'] = 'Nenhum Produto com Margem'
+        return final_row_data
+
+    if retriever is not None:
+        # Filtro pela categoria principal da subcategoria prevista pelo ML (se tiver produtos na faixa)
+        predicted_subcategory = str(classifier.predict([item_desc])[0])
+        positions = price_positions
+        categoria = next((cat for cat, sub in catalog.partitions if sub == predicted_subcategory), None)
+        if categoria is not None:
+            category_positions = catalog.category_positions(categoria, max_cost)
+            if len(category_positions) > 0:
+                positions = category_positions
+        logger.info(f"   [HÍBRIDO] BM25 + embeddings em {len(positions)} produtos (categoria: {categoria})...")
+        item_desc_full = f"{item_desc} {item_edital_dict.get('REFERENCIA', '')}"
+        top_positions, _ = retriever.search(item_desc_full, positions, HYBRID_CANDIDATES, query_vector=item_vector)
+        if len(top_positions) == 0:
+            final_row_data['MOTIVO_INCOMPATIBILIDADE'] = 'Nenhum candidato na recuperação híbrida.'
             return final_row_data
 
+        ai_result = get_best_match_from_ai(item_edital_dict, catalog.rows(top_positions))
+        if ai_result.get("best_match"):
+            logger.info(f"   ✅ [HÍBRIDO SUCESSO] {ai_result['best_match'].get('Marca')} {ai_result['best_match'].get('Modelo')}")
+            final_row_data.update(match_row_update(ai_result["best_match"], 'Match Encontrado (Híbrido)'))
+        elif ai_result.get("closest_match"):
+            logger.info(f"   ⚠️ [HÍBRIDO PARCIAL] {ai_result['closest_match'].get('Marca')} {ai_result['closest_match'].get('Modelo')}")
+            final_row_data.update(match_row_update(ai_result["closest_match"], 'Match Parcial (Híbrido)'))
+        else:
+            final_row_data['MOTIVO_INCOMPATIBILIDADE'] = ai_result.get('reasoning', 'Nenhum match viável na lista híbrida.')
+        return final_row_data
+
     ai_result = {}
     best_match = None
     closest_match = None
@@ -439,23 +474,11 @@ def process_item(item_edital_row, df_products_base, classifier, st_model, produc
     
     # --- ETAPA 2: Busca Semântica na Subcategoria Prevista + LLM ---
     logger.info("   [ETAPA 2/4] Buscando e validando LLM na subcategoria...")
-    df_candidates_subcat = df_price_filtered[df_price_filtered['subcategoria'] == predicted_subcategory].copy()
-
-    if not df_candidates_subcat.empty:
-        item_embedding = st_model.encode(item_desc, convert_to_tensor=True)
-        # Filtra os embeddings para apenas os candidatos relevantes
-        candidate_indices_in_full_df = df_candidates_subcat.index.tolist()
-        candidate_embeddings_for_search = product_embeddings_tensor[candidate_indices_in_full_df]  # Usa tensor diretamente
+    # Top-k semântico filtrado por subcategoria e teto de preço (posições na base)
+    final_candidate_indices, _ = ann_index.search(item_vector, SEMANTIC_SEARCH_TOP_K, max_cost=max_cost, subcategoria=predicted_subcategory)
 
-        cos_scores = util.cos_sim(item_embedding, candidate_embeddings_for_search)[0]
-        top_k = min(SEMANTIC_SEARCH_TOP_K, len(df_candidates_subcat))
-        
-        # Obter os índices dos top_k no sub-DataFrame
-        top_results_relative_indices = np.argpartition(-cos_scores.cpu().numpy(), range(top_k))[:top_k]
-        
-        # Mapear de volta para os índices originais do df_products_base
-        final_candidate_indices = [candidate_indices_in_full_df[i] for i in top_results_relative_indices]
-        df_llm_candidates = df_products_base.iloc[final_candidate_indices].copy()
+    if len(final_candidate_indices) > 0:
+        df_llm_candidates = catalog.rows(final_candidate_indices)
         
         ai_result = get_best_match_from_ai(item_edital_dict, df_llm_candidates)
         best_match = ai_result.get("best_match")
@@ -499,22 +522,14 @@ Item: \"{item_desc_full}\"
 Categorias Principais Válidas: {main_categories_list}
 
 Categoria Principal:"""
-    correct_main_cat = gerar_conteudo_com_fallback(prompt_main_cat, LLM_MODELS_FALLBACK)
+    correct_main_cat = LLM_CLIENT.generate(prompt_main_cat, min_tier=CATEGORY_LLM_TIER, request_options={"timeout": LLM_TIMEOUT})
     if correct_main_cat and correct_main_cat.strip() in main_categories_list:
         correct_main_cat = correct_main_cat.strip()
         logger.info(f"   - Categoria principal prevista pelo LLM: '{correct_main_cat}'")
-        df_candidates_maincat = df_price_filtered[df_price_filtered['categoria_principal'] == correct_main_cat].copy()
-
-        if not df_candidates_maincat.empty:
-            item_embedding = st_model.encode(item_desc, convert_to_tensor=True)
-            candidate_indices_in_full_df_main = df_candidates_maincat.index.tolist()
-            candidate_embeddings_for_search_main = product_embeddings_tensor[candidate_indices_in_full_df_main]
-
-            cos_scores_main = util.cos_sim(item_embedding, candidate_embeddings_for_search_main)[0]
-            top_k_main = min(SEMANTIC_SEARCH_TOP_K, len(df_candidates_maincat))
-            top_results_relative_indices_main = np.argpartition(-cos_scores_main.cpu().numpy(), range(top_k_main))[:top_k_main]
-            final_candidate_indices_main = [candidate_indices_in_full_df_main[i] for i in top_results_relative_indices_main]
-            df_llm_candidates_main = df_products_base.iloc[final_candidate_indices_main].copy()
+        final_candidate_indices_main, _ = ann_index.search(item_vector, SEMANTIC_SEARCH_TOP_K, max_cost=max_cost, categoria=correct_main_cat)
+
+        if len(final_candidate_indices_main) > 0:
+            df_llm_candidates_main = catalog.rows(final_candidate_indices_main)
             
             ai_result_main_cat = get_best_match_from_ai(item_edital_dict, df_llm_candidates_main)
             best_match_main_cat = ai_result_main_cat.get("best_match")
@@ -568,11 +583,9 @@ Categoria Principal:"""
 
     # --- ETAPA 4: FALLBACK FINAL - Busca na Base Inteira + LLM ---
     logger.info("   [ETAPA 4/4] FALLBACK FINAL: Buscando e validando LLM na base inteira (pós-preço)...")
-    item_embedding = st_model.encode(item_desc, convert_to_tensor=True)
-    cos_scores_full = util.cos_sim(item_embedding, product_embeddings_tensor)[0]
-    top_k_full = min(SEMANTIC_SEARCH_TOP_K * 2, len(df_price_filtered))  # Aumenta top_k para fallback
-    top_results_full = np.argpartition(-cos_scores_full.cpu().numpy(), range(top_k_full))[:top_k_full]
-    df_llm_candidates_full = df_products_base.iloc[top_results_full].copy()
+    # Busca apenas entre os produtos que passaram no filtro de preço (top_k maior no fallback)
+    top_results_full, _ = ann_index.search(item_vector, SEMANTIC_SEARCH_TOP_K * 2, max_cost=max_cost)
+    df_llm_candidates_full = catalog.rows(top_results_full)
     
     ai_result_full = get_best_match_from_ai(item_edital_dict, df_llm_candidates_full)
     best_match_full = ai_result_full.get("best_match")
@@ -623,6 +636,22 @@ Categoria Principal:"""
 
     return final_row_data
 
+def process_item_counted(*args) -> tuple[dict, int]:
+    """Executa `process_item` e retorna também o número de chamadas LLM que ele fez."""
+    calls_before = llm_calls_in_thread()
+    result = process_item(*args)
+    return result, llm_calls_in_thread() - calls_before
+
+def fan_out_result(result: dict, member_row: pd.Series) -> dict:
+    """Replica o resultado do representante do grupo para outra linha idêntica do edital."""
+    member_dict = member_row.to_dict()
+    return {
+        **result,
+        **member_dict,
+        'DESCRICAO_EDITAL': member_dict.get('DESCRICAO'),
+        'VALOR_UNIT_EDITAL': pd.to_numeric(member_dict.get('VALOR_UNIT'), errors='coerce'),
+    }
+
 # =====================================================================
 # MAIN: EXECUÇÃO PRINCIPAL DO SCRIPT
 # =====================================================================
@@ -631,11 +660,12 @@ def main():
     logger.info("Iniciando o pipeline otimizado para processamento de itens do edital...")
     load_dotenv()
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    arte_trace.start_run("arte_llm_master", TRACE_DIR)
 
     # Carrega os dados
     try:
         df_edital = pd.read_excel(CAMINHO_EDITAL)
-        df_products_base = pd.read_excel(CAMINHO_BASE_PRODUTOS)
+        df_products_base = pd.read_excel(CAMINHO_BASE_PRODUTOS).reset_index(drop=True)
     except FileNotFoundError as e:
         logger.critical(f"Erro ao carregar arquivos: {e}")
         sys.exit(1)
@@ -650,27 +680,32 @@ def main():
         logger.info(f"Carregando classificador pré-treinado de: {CLASSIFIER_PATH}")
         classifier = joblib.load(CLASSIFIER_PATH)
 
-    # Gera embeddings se não existirem
-    if not os.path.exists(EMBEDDINGS_PATH) or not os.path.exists(EMBEDDINGS_DATA_PATH):
-        generate_embeddings(CAMINHO_BASE_PRODUTOS, EMBEDDINGS_PATH, EMBEDDINGS_DATA_PATH)
-
-    logger.info(f"Carregando embeddings pré-computados de: {EMBEDDINGS_PATH}")
-    product_embeddings_np = np.load(EMBEDDINGS_PATH)
-    product_embeddings_tensor = torch.from_numpy(product_embeddings_np)  # Converte para tensor
-
-    product_embeddings_data = pd.read_pickle(EMBEDDINGS_DATA_PATH)  # Dados contextuais
-
     st_model = SentenceTransformer(SENTENCE_TRANSFORMER_MODEL)
 
-    # Verifica se o arquivo de saída existe; carrega para processamento incremental
-    if os.path.exists(CAMINHO_SAIDA):
-        df_existing = pd.read_excel(CAMINHO_SAIDA)
-        existing_keys = set(zip(df_existing['ARQUIVO'].astype(str), pd.to_numeric(df_existing['Nº'], errors='coerce').fillna(0).astype(int).astype(str)))
-    else:
-        df_existing = pd.DataFrame()
-        existing_keys = set()
-
-    df_novos_itens = df_edital[~df_edital.apply(lambda row: (str(row['ARQUIVO']), str(int(pd.to_numeric(row['Nº'], errors='coerce') or 0))) in existing_keys, axis=1)].copy()
+    # Embeddings da base: recodifica apenas produtos novos/alterados e mantém vetores e metadados alinhados
+    product_embeddings_np, _ = sync_product_embeddings(df_products_base, st_model)
+    if EMBEDDING_QUANTIZATION != 'float32':
+        # A busca usa a matriz quantizada em memmap; a matriz float32 não fica na RAM
+        logger.info(f"Embeddings da base em {EMBEDDING_QUANTIZATION} (memmap): {product_embeddings_np.nbytes / 2**20:.1f} MiB")
+
+    # Partições por categoria/subcategoria ordenadas por preço, montadas uma única vez
+    catalog = CatalogIndex(df_products_base)
+    # Busca semântica top-k com filtros de preço/categoria (HNSW persistente ou exata)
+    ann_index = FilteredAnnIndex.load_or_build(product_embeddings_np, catalog, ANN_INDEX_DIR)
+    # Modo híbrido: índice invertido BM25 (em cache por conteúdo) fundido com a busca semântica
+    retriever = None
+    if RETRIEVAL_MODE == "hibrido":
+        retriever = HybridRetriever(BM25CatalogIndex.load_or_build(df_products_base, BM25_INDEX_DIR), ann_index=ann_index)
+        logger.info("Recuperação híbrida (BM25 + embeddings, RRF) ativada: uma chamada LLM por item.")
+
+    # Processamento incremental: as chaves já processadas vêm do banco local de resultados
+    # (na primeira execução, o histórico do .xlsx de saída é importado para o banco)
+    store = ResultStore(CAMINHO_RESULT_STORE)
+    store.import_excel_once(CAMINHO_SAIDA)
+    existing_keys = store.keys()
+
+    is_new = [result_key(arquivo, numero) not in existing_keys for arquivo, numero in zip(df_edital['ARQUIVO'], df_edital['Nº'])]
+    df_novos_itens = df_edital[is_new].copy()
 
     if df_novos_itens.empty:
         logger.info("Nenhum novo item para processar. Arquivo de saída atualizado.")
@@ -678,6 +713,11 @@ def main():
 
     logger.info(f"Identificados {len(df_novos_itens)} novos itens para processar.")
 
+    # Deduplicação: linhas idênticas (descrição, referência e faixa de preço) são processadas uma vez
+    groups = group_items(df_novos_itens)
+    logger.info(groups.report())
+    llm_calls_by_rep = {}
+
     output_columns = [
         'ARQUIVO', 'Nº', 'DESCRICAO_EDITAL', 'REFERENCIA', 'STATUS', 'UNID_FORN', 'QTDE', 
         'VALOR_UNIT_EDITAL', 'VALOR_TOTAL', 'LOCAL_ENTREGA',
@@ -686,45 +726,63 @@ def main():
         'COMPATIBILITY_SCORE', 'ANALISE_COMPATIBILIDADE', 'MOTIVO_INCOMPATIBILIDADE', 'LAST_UPDATE'
     ]
 
-    # Processamento paralelo com salvamento incremental a cada item
+    # A planilha estilizada é exportada do banco no fim (ou no máximo a cada EXCEL_EXPORT_INTERVAL_SECONDS)
+    exporter = DebouncedExport(
+        lambda: save_styled_excel(CAMINHO_SAIDA, store.to_dataframe(output_columns), output_columns),
+        EXCEL_EXPORT_INTERVAL_SECONDS
+    )
+
+    # Codifica todos os representantes de uma vez, antes da fase com threads;
+    # cada worker recebe apenas a sua linha do tensor (memória compartilhada, sem cópia)
+    item_embeddings = encode_items(st_model, [str(df_novos_itens.iloc[rep]['DESCRICAO']) for rep in groups.representatives])
+
+    # Processamento paralelo (um representante por grupo) com salvamento incremental a cada grupo
     with ThreadPoolExecutor(max_workers=MAX_LLM_CONCURRENT_CALLS) as executor:
-        future_to_row = {executor.submit(process_item, row, df_products_base, classifier, st_model, product_embeddings_data, product_embeddings_tensor, main_categories_list): row for _, row in df_novos_itens.iterrows()}
+        future_to_rep = {
+            executor.submit(process_item_counted, df_novos_itens.iloc[rep], catalog, classifier, st_model, ann_index, main_categories_list, item_embeddings[i], retriever): rep
+            for i, rep in enumerate(groups.representatives)
+        }
         
         processed_count = 0
         total_items = len(df_novos_itens)
         
-        for future in as_completed(future_to_row):
-            row_data = future_to_row[future]
+        for future in as_completed(future_to_rep):
+            rep = future_to_rep[future]
+            row_data = df_novos_itens.iloc[rep]
+            member_rows = [df_novos_itens.iloc[pos] for pos in groups.members[rep]]
             try:
-                new_result = future.result()
+                new_result, llm_calls_by_rep[rep] = future.result()
                 
-                # Concatena o novo resultado ao dataframe existente
-                df_existing = pd.concat([df_existing, pd.DataFrame([new_result])], ignore_index=True)
+                # Replica o resultado para todas as linhas do grupo e grava no banco (uma transação)
+                new_rows = [fan_out_result(new_result, member) for member in member_rows]
+                store.append(new_rows)
                 
-                processed_count += 1
+                processed_count += len(new_rows)
                 item_id = row_data.get('Nº', 'N/A')
-                logger.info(f"✅ Item Nº {item_id} processado com sucesso. Progresso: {processed_count}/{total_items}.")
+                logger.info(f"✅ Item Nº {item_id} processado com sucesso ({len(new_rows)} linha(s) no grupo). Progresso: {processed_count}/{total_items}.")
 
             except Exception as e:
                 item_id = row_data.get('Nº', 'N/A')
                 file_name = row_data.get('ARQUIVO', 'N/A')
                 logger.error(f"❌ Erro ao processar item Nº {item_id} do arquivo {file_name}: {e}", exc_info=True)
                 # Salva um placeholder de erro para não reprocessar
-                error_result = {
-                    **row_data.to_dict(),
+                error_results = [{
+                    **member.to_dict(),
                     'STATUS': 'ERRO DE PROCESSAMENTO',
                     'MOTIVO_INCOMPATIBILIDADE': str(e),
                     'LAST_UPDATE': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                df_existing = pd.concat([df_existing, pd.DataFrame([error_result])], ignore_index=True)
+                } for member in member_rows]
+                store.append(error_results)
             
             finally:
-                # Salva o arquivo Excel completo após cada tentativa (sucesso ou falha)
-                df_to_save = df_existing.reindex(columns=output_columns)
-                save_styled_excel(CAMINHO_SAIDA, df_to_save, output_columns)
-                logger.info(f"💾 Arquivo de saída salvo incrementalmente.")
+                exporter.request()
 
+    exporter.flush()
+    store.close()
 
+    logger.info(groups.report(llm_calls_by_rep))
+    logger.info(LLM_CLIENT.health_report())
+    logger.info(arte_trace.finish_run())
     logger.info("✅ Processamento de todos os itens concluído.")
 
 if __name__ == "__main__":
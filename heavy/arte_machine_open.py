@@ -1,6 +1,6 @@
 import pandas as pd
-import requests
 import os
+import sys
 from dotenv import load_dotenv
 import json
 import logging
@@ -10,6 +10,12 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+# Módulos compartilhados do pipeline (arte_code/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "arte_code"))
+from arte_limiter import ModelRateLimiter
+from arte_llm import LLMClient, OpenRouterBackend
+from arte_llm_replay import backend_from_env
+
 # ======================================================================
 # CONFIGURAÇÕES E CONSTANTES
 # ======================================================================
@@ -47,6 +53,9 @@ LLM_MODELS_FALLBACK = [
     "meta-llama/llama-3-8b-instruct",
 ]
 
+# Modelos gratuitos do OpenRouter: 20 requisições por minuto cada
+LLM_RATE_LIMITS = {modelo: {"rpm": 20, "tpm": 1_000_000} for modelo in LLM_MODELS_FALLBACK}
+
 # --- ML Configuration ---
 SUBCATEGORY_ML_CANDIDATES = 10
 MAIN_CATEGORY_ML_CANDIDATES = 20
@@ -75,61 +84,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sessão HTTP reaproveitada, disjuntor por modelo e rota pelo modelo gratuito mais rápido saudável
+LLM_CLIENT = LLMClient(
+    backend_from_env(lambda: OpenRouterBackend(
+        headers={"HTTP-Referer": "https://github.com/seu-usuario/arte-heavy", "X-Title": "Arte Heavy Analysis"})),
+    LLM_MODELS_FALLBACK,
+    rate_limiter=ModelRateLimiter.shared("OPENROUTER_API_KEY", LLM_RATE_LIMITS),
+)
+
 # ============================================================ 
 # FUNÇÕES DE IA (OPENROUTER) E ML
 # ============================================================ 
 
-def gerar_conteudo_com_fallback(prompt: str, modelos: list[str]) -> str | None:
-    """Tenta gerar conteúdo usando a API OpenRouter com uma lista de modelos de fallback."""
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        logger.error("OPENROUTER_API_KEY não encontrada no arquivo .env")
-        print("   - ❌ OPENROUTER_API_KEY não encontrada no arquivo .env")
-        return None
-
-    for nome_modelo in modelos:
-        try:
-            print(f"   - Tentando chamada à API OpenRouter com o modelo: {nome_modelo}...")
-            
-            response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "HTTP-Referer": "https://github.com/seu-usuario/arte-heavy",
-                    "X-Title": "Arte Heavy Analysis",
-                },
-                data=json.dumps({
-                    "model": nome_modelo,
-                    "messages": [{"role": "user", "content": prompt}]
-                }),
-                timeout=180
-            )
-
-            if response.status_code == 429: # Rate limit
-                print(f"   - Rate limit excedido para o modelo '{nome_modelo}'. Tentando o próximo.")
-                continue
-            
-            response.raise_for_status()
-            response_json = response.json()
-            
-            content = response_json.get('choices', [{}])[0].get('message', {}).get('content')
-            if not content:
-                logger.warning(f"API retornou resposta vazia para o modelo {nome_modelo}.")
-                return None
-
-            print(f"   - Sucesso com o modelo '{nome_modelo}'.")
-            return content
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Erro de requisição com o modelo '{nome_modelo}': {e}")
-            continue
-        except Exception as e:
-            logger.critical(f"Erro inesperado e crítico com o modelo '{nome_modelo}': {e}")
-            return None
-
-    logger.error("FALHA TOTAL: Todos os modelos na lista de fallback falharam.")
-    return None
-
 def get_item_classification(description: str, reference: str, categories_with_subcategories: dict) -> dict | None:
     """Usa o modelo de IA para classificar o item."""
     print("- Asking AI for item classification...")
@@ -155,7 +121,7 @@ Referência: {reference}
 </formato_saida>
 JSON:
 '''
-    response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+    response_text = LLM_CLIENT.generate(prompt)
     if response_text:
         try:
             cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
@@ -224,7 +190,7 @@ Responda APENAS com um único objeto JSON. Não inclua ```json ou qualquer outro
 }}
 </formato_saida><base_fornecedores_filtrada>{candidates_json}</base_fornecedores_filtrada>'''
 
-    response_text = gerar_conteudo_com_fallback(prompt, LLM_MODELS_FALLBACK)
+    response_text = LLM_CLIENT.generate(prompt)
     if response_text:
         try:
             cleaned_response = response_text.strip().replace("```json", "").replace("```", "")
@@ -432,6 +398,7 @@ def main():
             logger.error(f"Failed to save Excel file incrementally: {e}", exc_info=True)
             print(f"  ❌ Erro ao salvar o item {i+1}: {e}")
 
+    logger.info(LLM_CLIENT.health_report())
     logger.info("All new items processed.")
     print("\n✅ All new items processed.")
 